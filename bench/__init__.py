@@ -0,0 +1 @@
+__all__ = ['bench_startup', 'bench_throughput', 'ts_generator', 'ts_faults', 'mcast_replay', 'load_test']
@@ -0,0 +1,73 @@
+"""
+Import-time benchmark for the CLI entry points. Each case is executed in a fresh interpreter several times, wall-clock
+time and the most expensive imports (python -X importtime) are reported, so startup regressions are visible
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# case name -> python code executed in a fresh interpreter
+CASES = {
+    'interpreter': 'pass',
+    'cli_help': 'import iptv_analyzer\ntry:\n    iptv_analyzer.main(["--help"])\nexcept SystemExit:\n    pass',
+    'cli_multicast_args': 'import iptv_analyzer\niptv_analyzer.build_parser(["multicast"])',
+    'ts_reader': 'import ts.ts_reader',
+    'ts_stat': 'import ts.ts_stat',
+    'viewer': 'import views.viever',
+    'viewer_dicts': 'from views.viever import Viewer\nfrom models import PMT\nimport io\n'
+                    + 'Viewer().print_pmt(PMT.PMT(), file=io.StringIO())',
+}
+
+
+def run_case(code: str, repeat=5) -> dict:
+    """
+    Execute code in fresh interpreter several times
+
+    :param code: Python code to be executed
+    :param repeat: Number of runs
+    :return: dictionary with min/mean wall-clock time (ms) and the most expensive imports of the last run
+    """
+    times = list()
+    stderr = ''
+    for i in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT_DIR,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        times.append((time.perf_counter() - start) * 1000)
+        stderr = proc.stderr
+    imports = list()
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append({'module': name.strip(), 'self_us': int(self_us), 'cumulative_us': int(cumulative_us)})
+    imports = sorted(imports, key=lambda k: k['cumulative_us'], reverse=True)
+    return {'min_ms': round(min(times), 2), 'mean_ms': round(sum(times) / len(times), 2),
+            'import_us': sum(item['self_us'] for item in imports), 'top_imports': imports[:10]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure startup/import time of IPTV analyzer entry points')
+    parser.add_argument('-r', '--repeat', nargs='?', type=int, default=5, help='number of runs per case')
+    parser.add_argument('-o', '--output', nargs='?', default=None, help='save results to JSON file')
+    args = vars(parser.parse_args())
+
+    results = {'python': sys.version.split()[0], 'cases': dict()}
+    for name, code in CASES.items():
+        res = run_case(code, repeat=args['repeat'])
+        results['cases'][name] = res
+        print('{:<20} min={:>8.2f} ms  mean={:>8.2f} ms  imports={:>8} us'.format(name, res['min_ms'], res['mean_ms'],
+                                                                                 res['import_us']))
+    if args['output'] is not None:
+        with open(args['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Throughput benchmark of the analyzer pipeline on a deterministic synthetic stream (see ts_generator). Each stage is
+measured separately: parse-only (TSParser), reader (TSReader), reader+statistics (TSReader + Statistics) and the
+per-datagram, TS-file and pcap-file ingest paths. Results (packets/s and MB/s) can be saved as JSON for comparison
+across runs
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from bench.ts_generator import TSGenerator, datagrams, write_ts, write_pcap, PACKET_SIZE
+
+
+def connect(ts_reader, stats):
+    """ Connect Statistics to TSReader events the same way as readers do """
+    ts_reader.onPacketDecoded += stats.update_stat
+    ts_reader.onPatReceived += stats.update_programs_info
+    ts_reader.onPmtReceived += stats.update_programs_info
+    ts_reader.onCatReceived += stats.update_programs_info
+    ts_reader.onProgramSdtReceived += stats.update_programs_info
+
+
+def stage_parse(data: list, start_dt: datetime.datetime):
+    from ts.ts_parser import TSParser
+    parser = TSParser()
+    for t, datagram in data:
+        for pk, dpk, rsync in parser.parse(datagram):
+            pass
+
+
+def stage_reader(data: list, start_dt: datetime.datetime):
+    from ts.ts_reader import TSReader
+    ts_reader = TSReader()
+    for t, datagram in data:
+        ts_reader.read(datagram, dt=start_dt + datetime.timedelta(seconds=t))
+
+
+def stage_reader_stats(data: list, start_dt: datetime.datetime):
+    from ts.ts_reader import TSReader
+    from ts.ts_stat import Statistics
+    ts_reader = TSReader()
+    stats = Statistics(pcap=True, interval_s=1, anomalies=ts_reader.anomalies)
+    connect(ts_reader, stats)
+    for t, datagram in data:
+        ts_reader.read(datagram, dt=start_dt + datetime.timedelta(seconds=t))
+    stats.get_stat()
+
+
+def stage_datagram_ingest(data: list, start_dt: datetime.datetime):
+    """ The same processing as multicast_reader receive loop (without socket) """
+    from ts.ts_reader import TSReader
+    from ts.ts_stat import Statistics
+    from views.viever import Viewer
+    viewer = Viewer()
+    ts_reader = TSReader()
+    stats = Statistics(pcap=True, interval_s=1, anomalies=ts_reader.anomalies)
+    stats.onStatReady += viewer.print_stat_result
+    connect(ts_reader, stats)
+    stats.monitoring_start_dt = datetime.datetime.now()
+    for t, datagram in data:
+        dt = datetime.datetime.now()
+        if (dt - stats.monitoring_start_dt).total_seconds() > 3600:     # monitoring time check as in receive loop
+            break
+        ts_reader.read(datagram, dt=dt)
+    stats.get_stat()
+
+
+# stage name -> function processing list of datagrams
+STAGES = {
+    'parse': stage_parse,
+    'reader': stage_reader,
+    'reader_stats': stage_reader_stats,
+    'datagram_ingest': stage_datagram_ingest,
+}
+
+
+def measure(func, *args, repeat=3) -> float:
+    """
+    :return: The best wall-clock time of several runs in seconds
+    """
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def result(packets: int, elapsed: float) -> dict:
+    return {'packets': packets, 'seconds': round(elapsed, 4), 'packets_per_s': round(packets / elapsed),
+            'mbytes_per_s': round(packets * PACKET_SIZE / elapsed / 1000000, 3)}
+
+
+def run(duration_s=10, bitrate=4000000, video_pids=(256,), audio_pids=(257,), repeat=3, stages=None) -> dict:
+    """
+    Run benchmark
+
+    :param duration_s: Duration of generated stream in seconds
+    :param bitrate: Bitrate of generated stream
+    :param video_pids: Video PIDs of generated stream
+    :param audio_pids: Audio PIDs of generated stream
+    :param repeat: Number of runs per stage (the best one is reported)
+    :param stages: List of stages to run. Default is all stages including file and pcap ingest
+    :return: dictionary with benchmark parameters and results per stage
+    """
+    generator = TSGenerator(bitrate=bitrate, video_pids=video_pids, audio_pids=audio_pids)
+    data = list(datagrams(generator.packets(duration_s)))
+    packets = sum(len(datagram) // PACKET_SIZE for t, datagram in data)
+    results = {'python': sys.version.split()[0], 'cpu_count': os.cpu_count(),
+               'dt': str(datetime.datetime.now()),
+               'stream': {'duration_s': duration_s, 'bitrate': bitrate, 'packets': packets,
+                          'video_pids': list(video_pids), 'audio_pids': list(audio_pids)},
+               'stages': dict()}
+    if stages is None:
+        stages = list(STAGES.keys()) + ['file_ingest', 'pcap_ingest']
+    for name in stages:
+        if name in STAGES:
+            elapsed = measure(STAGES[name], data, generator.start_dt, repeat=repeat)
+        else:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                if name == 'file_ingest':
+                    from tsfile_reader import tsfile_reader
+                    path = os.path.join(tmp_dir, 'bench.ts')
+                    write_ts(path, TSGenerator(bitrate=bitrate, video_pids=video_pids,
+                                               audio_pids=audio_pids).packets(duration_s))
+                    elapsed = measure(tsfile_reader, path, repeat=repeat)
+                elif name == 'pcap_ingest':
+                    from pcap_reader import pcap_reader
+                    path = os.path.join(tmp_dir, 'bench.pcap')
+                    write_pcap(path, data, generator.start_dt)
+                    elapsed = measure(pcap_reader, path, repeat=repeat)
+                else:
+                    raise ValueError('Unknown stage: {}'.format(name))
+        results['stages'][name] = result(packets, elapsed)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure throughput of IPTV analyzer on synthetic TS stream')
+    parser.add_argument('-d', '--duration_s', nargs='?', type=float, default=10,
+                        help='duration of generated stream in seconds')
+    parser.add_argument('-b', '--bitrate', nargs='?', type=int, default=4000000, help='bitrate of generated stream')
+    parser.add_argument('-v', '--video_pids', nargs='?', type=int, default=1, help='number of video PIDs')
+    parser.add_argument('-a', '--audio_pids', nargs='?', type=int, default=1, help='number of audio PIDs')
+    parser.add_argument('-r', '--repeat', nargs='?', type=int, default=3, help='number of runs per stage')
+    parser.add_argument('-s', '--stages', nargs='*', default=None, help='stages to run (default: all)')
+    parser.add_argument('-o', '--output', nargs='?', default=None, help='save results to JSON file')
+    args = vars(parser.parse_args())
+
+    results = run(duration_s=args['duration_s'], bitrate=args['bitrate'],
+                  video_pids=tuple(range(256, 256 + args['video_pids'])),
+                  audio_pids=tuple(range(512, 512 + args['audio_pids'])),
+                  repeat=args['repeat'], stages=args['stages'])
+    for name, res in results['stages'].items():
+        print('{:<16} {:>10} packets/s {:>8.3f} MB/s'.format(name, res['packets_per_s'], res['mbytes_per_s']))
+    if args['output'] is not None:
+        with open(args['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
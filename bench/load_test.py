@@ -0,0 +1,174 @@
+"""
+Load test of multicast_reader over loopback multicast. Synthetic streams with injected impairments (see ts_faults) are
+replayed to many groups at original pacing (see mcast_replay) while one analyzer process per group is running.
+
+Modes:
+    accuracy - checks that every injected error is counted exactly by the analyzer for every group
+    ramp     - increases stream bitrate until the analyzer starts dropping packets
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from bench.ts_generator import TSGenerator, datagrams, PACKET_SIZE
+from bench.ts_faults import FaultInjector, IMPAIRMENTS
+from bench.mcast_replay import MulticastReplayer
+
+
+def start_analyzer(group: str, port: int, interface: str, mon_time_s: int, wait_s=3) -> subprocess.Popen:
+    """
+    Start analyzer process (iptv_analyzer.py multicast) for one group
+
+    :return: Popen object. Final statistics are printed by the process into stdout
+    """
+    cmd = [sys.executable, os.path.join(ROOT_DIR, 'iptv_analyzer.py'), 'multicast', '-i', group, '-p', str(port),
+           '-n', interface, '-t', str(mon_time_s), '-w', str(wait_s), '-s', '1']
+    return subprocess.Popen(cmd, cwd=ROOT_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            universal_newlines=True)
+
+
+def final_stat(process: subprocess.Popen) -> dict:
+    """
+    Wait for analyzer process and extract final statistics from its output
+
+    :return: Final statistics dictionary or None if it was not printed
+    """
+    out, err = process.communicate()
+    for line in out.splitlines():
+        if line.startswith('{"monitoring_start_dt"'):
+            return json.loads(line)
+    return None
+
+
+def replay(groups: list, port: int, data: list, interface: str, duration_s: float, spread_s=0.0) -> dict:
+    """
+    Start analyzers, replay data to all groups and collect analyzers final statistics
+
+    :return: dictionary group -> final statistics
+    """
+    processes = {group: start_analyzer(group, port, interface, int(duration_s) + 60) for group in groups}
+    time.sleep(1.0)     # time for analyzers to start and join groups
+    replayer = MulticastReplayer(interface=interface)
+    for i, group in enumerate(groups):
+        replayer.add_stream(group, port, data, offset_s=(spread_s * i / len(groups)) if len(groups) > 0 else 0)
+    replayer.run()
+    replayer.close()
+    result = {group: final_stat(process) for group, process in processes.items()}
+    result['_max_lag_s'] = replayer.max_lag_s
+    return result
+
+
+def group_address(base: str, index: int) -> str:
+    a, b, c, d = (int(x) for x in base.split('.'))
+    value = ((c << 8) | d) + index
+    return '{}.{}.{}.{}'.format(a, b, (value >> 8) & 255, value & 255)
+
+
+def count_packets(packets: list) -> dict:
+    counts = dict()
+    for t, packet in packets:
+        pid = ((packet[1] & 31) << 8) | packet[2]
+        counts[pid] = counts.get(pid, 0) + 1
+    return counts
+
+
+def accuracy(groups=4, base_group='239.255.0.1', port=5500, interface='127.0.0.1', duration_s=20, bitrate=4000000,
+             every_s=2.0) -> dict:
+    """
+    Replay impaired stream to several groups and compare analyzer counters with injected errors
+
+    :return: dictionary with expected counters and mismatches per group
+    """
+    generator = TSGenerator(bitrate=bitrate)
+    injector = FaultInjector(generator.pcr_pid, generator.pmt_pid, generator.streams[0].pid,
+                             every_s={name: every_s for name in IMPAIRMENTS}, warmup_s=2.0)
+    packets = list(injector.apply(generator.packets(duration_s)))
+    data = list(datagrams(packets))
+    sent = count_packets(packets)
+    group_list = [group_address(base_group, i) for i in range(groups)]
+    stats = replay(group_list, port, data, interface, duration_s)
+    report = {'expected': {str(pid): counters for pid, counters in injector.expected.items()},
+              'max_lag_s': stats.pop('_max_lag_s'), 'groups': dict()}
+    for group, stat in stats.items():
+        mismatches = list()
+        if stat is None:
+            mismatches.append('no final statistics')
+        else:
+            received = {pid['pid']: pid['stat'] for pid in stat['pids']}
+            for pid, packet_count in sent.items():
+                got = received.get(pid, {}).get('Packet_count', 0)
+                if got != packet_count:
+                    mismatches.append('PID=0x{:04X} Packet_count sent={} received={}'.format(pid, packet_count, got))
+            for pid, pid_stat in received.items():
+                for counter, value in pid_stat.items():
+                    if counter in ('Packet_count',):
+                        continue
+                    expected = injector.expected.get(pid, {}).get(counter, 0)
+                    if value != expected:
+                        mismatches.append('PID=0x{:04X} {} expected={} counted={}'.format(pid, counter, expected,
+                                                                                         value))
+        report['groups'][group] = mismatches
+    return report
+
+
+def ramp(base_group='239.255.1.1', port=5600, interface='127.0.0.1', duration_s=5, start_bitrate=4000000,
+         max_bitrate=400000000, step=2.0, loss_threshold=0.001) -> dict:
+    """
+    Increase stream bitrate until analyzer loses more than loss_threshold of packets
+
+    :return: dictionary with loss per tested bitrate and the first bitrate with drops
+    """
+    results = list()
+    drop_bitrate = None
+    bitrate = start_bitrate
+    while bitrate <= max_bitrate:
+        generator = TSGenerator(bitrate=bitrate)
+        data = list(datagrams(generator.packets(duration_s)))
+        sent = sum(len(datagram) // PACKET_SIZE for t, datagram in data)
+        stat = replay([base_group], port, data, interface, duration_s)
+        max_lag_s = stat.pop('_max_lag_s')
+        stat = stat[base_group]
+        received = 0 if stat is None else sum(pid['stat']['Packet_count'] for pid in stat['pids'])
+        loss = 1 - received / sent
+        results.append({'bitrate': bitrate, 'sent_packets': sent, 'received_packets': received,
+                        'loss': round(loss, 6), 'replay_max_lag_s': round(max_lag_s, 4)})
+        print('bitrate={:>11} sent={:>9} received={:>9} loss={:.4%}'.format(bitrate, sent, received, loss))
+        if loss > loss_threshold:
+            drop_bitrate = bitrate
+            break
+        bitrate = int(bitrate * step)
+    return {'loss_threshold': loss_threshold, 'results': results, 'drop_bitrate': drop_bitrate}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of multicast_reader over loopback multicast')
+    parser.add_argument('mode', choices=['accuracy', 'ramp'], help='test mode')
+    parser.add_argument('-g', '--groups', nargs='?', type=int, default=4, help='number of groups (accuracy mode)')
+    parser.add_argument('-d', '--duration_s', nargs='?', type=int, default=20, help='stream duration in seconds')
+    parser.add_argument('-b', '--bitrate', nargs='?', type=int, default=4000000, help='(start) bitrate')
+    parser.add_argument('-n', '--interface', nargs='?', default='127.0.0.1', help='interface ip address')
+    parser.add_argument('-o', '--output', nargs='?', default=None, help='save results to JSON file')
+    args = vars(parser.parse_args())
+
+    if args['mode'] == 'accuracy':
+        report = accuracy(groups=args['groups'], interface=args['interface'], duration_s=args['duration_s'],
+                          bitrate=args['bitrate'])
+        for group, mismatches in report['groups'].items():
+            print('{:<16} {}'.format(group, 'OK' if len(mismatches) == 0 else '; '.join(mismatches)))
+    else:
+        report = ramp(interface=args['interface'], duration_s=args['duration_s'], start_bitrate=args['bitrate'])
+        print('Analyzer starts dropping at bitrate: {}'.format(report['drop_bitrate']))
+    if args['output'] is not None:
+        with open(args['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
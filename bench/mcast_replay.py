@@ -0,0 +1,88 @@
+"""
+Local multicast replayer. Replays pre-generated datagrams to many multicast groups at once with original pacing
+(datagram times relative to start), so the analyzer can be loaded without a live headend
+"""
+import heapq
+import socket
+import time
+
+
+class MulticastReplayer:
+    """
+    Class for replaying datagrams to multicast groups. All groups are served by one thread and one socket: datagrams
+    of all groups are merged by their send time with a heap, so hundreds of groups can be simulated at once
+    """
+    def __init__(self, interface='127.0.0.1', ttl=1, speed=1.0):
+        """
+        Initialize object
+
+        :param interface: IP address of interface used for sending multicast (loopback by default)
+        :param ttl: Multicast TTL
+        :param speed: Replay speed factor (2.0 - two times faster than original pacing)
+        """
+        self.__streams = list()     # [(group, port, datagrams, offset_s)]
+        self.interface = interface
+        self.speed = speed
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.__sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self.__sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        self.__sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+        self.sent_datagrams = dict()    # (group, port) -> number of sent datagrams
+        self.sent_bytes = dict()        # (group, port) -> number of sent bytes
+        self.max_lag_s = 0.0            # Maximum delay of sending against schedule
+        self.running = False
+
+    def add_stream(self, group: str, port: int, datagrams: list, offset_s=0.0):
+        """
+        Add stream to be replayed. The same datagrams list may be shared by many groups
+
+        :param group: Multicast group IP address
+        :param port: UDP port
+        :param datagrams: List of (t, data) tuples with t - send time in seconds from stream start
+        :param offset_s: Start offset of the stream (used to spread groups in time)
+        """
+        self.__streams.append((group, port, datagrams, offset_s))
+        self.sent_datagrams[(group, port)] = 0
+        self.sent_bytes[(group, port)] = 0
+
+    def stop(self):
+        """ Stop replaying (can be called from another thread) """
+        self.running = False
+
+    def run(self, start=None):
+        """
+        Replay all streams. Returns when all datagrams are sent or stop() is called
+
+        :param start: time.monotonic() value of stream start (t=0). Default is now
+        """
+        heap = list()
+        for index, (group, port, datagrams, offset_s) in enumerate(self.__streams):
+            if len(datagrams) > 0:
+                heap.append((datagrams[0][0] + offset_s, index, 0))
+        heapq.heapify(heap)
+        if start is None:
+            start = time.monotonic()
+        self.running = True
+        sock = self.__sock
+        while self.running and len(heap) > 0:
+            t, index, pos = heap[0]
+            group, port, datagrams, offset_s = self.__streams[index]
+            due = start + t / self.speed
+            now = time.monotonic()
+            if due > now:
+                time.sleep(due - now)
+            elif now - due > self.max_lag_s:
+                self.max_lag_s = now - due
+            data = datagrams[pos][1]
+            sock.sendto(data, (group, port))
+            self.sent_datagrams[(group, port)] += 1
+            self.sent_bytes[(group, port)] += len(data)
+            pos += 1
+            if pos < len(datagrams):
+                heapq.heapreplace(heap, (datagrams[pos][0] + offset_s, index, pos))
+            else:
+                heapq.heappop(heap)
+        self.running = False
+
+    def close(self):
+        self.__sock.close()
@@ -0,0 +1,179 @@
+"""
+Fault injection for synthetic TS streams. FaultInjector modifies packets produced by TSGenerator with controlled
+impairments (CC gaps and duplicates, PCR gaps, missing PAT/PMT, CRC corruption, TEI bits, scrambled packets) and
+keeps the number of errors the analyzer is expected to count for each of them
+"""
+import struct
+
+from bench.ts_generator import PACKET_SIZE
+
+NULL_PACKET = struct.pack('>BHB', 0x47, 8191, 0x10) + b'\xFF' * (PACKET_SIZE - 4)
+
+# Impairment -> (Statistics counter, description)
+IMPAIRMENTS = {
+    'cc_gap': ('CC_errors', 'one packet of elementary stream is lost'),
+    'cc_dup': ('CC_errors', 'packet of elementary stream is sent three times (single duplicates are allowed)'),
+    'pcr_gap': ('PCR_repetition_error', 'pcr_gap_count PCRs are removed (40 ms < PCR interval <= 100 ms)'),
+    'pcr_disc': ('PCR_discontinuity_indicator_error', 'pcr_disc_count PCRs are removed (PCR interval > 100 ms)'),
+    'pat_missing': ('PAT_error', 'PAT is not sent for pat_gap_ms (> 500 ms)'),
+    'pmt_missing': ('PMT_error', 'PMT is not sent for pmt_gap_ms (> 500 ms)'),
+    'crc': ('CRC_error', 'CRC-32 of PAT section is corrupted'),
+    'tei': ('Transport_error', 'transport_error_indicator is set'),
+    'scrambled': ('Scrambled_count', 'transport_scrambling_control is set to 10'),
+}
+
+
+class FaultInjector:
+    """
+    Class for injecting impairments into TS packets stream. Each impairment is injected periodically (every_s) after
+    warm-up period, impairments of different types never hit the same packet. Expected analyzer counters per PID are
+    available in expected property
+    """
+    def __init__(self, pcr_pid: int, pmt_pid: int, es_pid: int, every_s=None, warmup_s=1.0, pcr_gap_count=2,
+                 pcr_disc_count=6, pat_gap_ms=800, pmt_gap_ms=800):
+        """
+        Initialize object
+
+        :param pcr_pid: PID which carries PCR
+        :param pmt_pid: PID of PMT
+        :param es_pid: PID of elementary stream used for CC, TEI and scrambling impairments
+        :param every_s: dictionary impairment -> period in seconds (see IMPAIRMENTS). Missing impairments are disabled
+        :param warmup_s: No impairments are injected during the first seconds (analyzer skips first CC errors)
+        :param pcr_gap_count: Number of consecutive PCRs removed by 'pcr_gap' impairment (2 for 20 ms PCR interval)
+        :param pcr_disc_count: Number of consecutive PCRs removed by 'pcr_disc' impairment (6 for 20 ms interval)
+        :param pat_gap_ms: Duration of PAT absence for 'pat_missing' impairment
+        :param pmt_gap_ms: Duration of PMT absence for 'pmt_missing' impairment
+        """
+        self.pcr_pid = pcr_pid
+        self.pmt_pid = pmt_pid
+        self.es_pid = es_pid
+        self.every_s = every_s if every_s is not None else dict()
+        for name in self.every_s:
+            if name not in IMPAIRMENTS:
+                raise ValueError('Unknown impairment: {}'.format(name))
+        self.warmup_s = warmup_s
+        self.__gap_s = {'pat_missing': pat_gap_ms / 1000, 'pmt_missing': pmt_gap_ms / 1000}
+        self.__pcr_count = {'pcr_gap': pcr_gap_count, 'pcr_disc': pcr_disc_count}
+        # Errors are expected when the gap is ended, i.e. when the analyzer can detect them
+        # Start times are staggered, so impairments of different types do not overlap by default
+        self.__next_s = {name: warmup_s + i * 0.2 for i, name in enumerate(sorted(self.every_s))}
+        self.__gap_end_s = dict()       # impairment -> end of currently active gap
+        self.__cc_shift = dict()        # pid -> number of removed packets (CC of following packets is renumbered)
+        self.injected = {name: 0 for name in IMPAIRMENTS}
+        self.expected = dict()          # pid -> {counter: count}
+
+    def __expect(self, name: str, pid: int):
+        self.injected[name] += 1
+        counter = IMPAIRMENTS[name][0]
+        pid_expected = self.expected.setdefault(pid, dict())
+        pid_expected[counter] = pid_expected.get(counter, 0) + 1
+
+    def __due(self, name: str, t: float) -> bool:
+        if name in self.__next_s and t >= self.__next_s[name]:
+            self.__next_s[name] += self.every_s[name]
+            return True
+        return False
+
+    def __gap(self, name: str, t: float) -> int:
+        """
+        Check if t is inside the gap of impairment. New gap is started if the impairment is due
+
+        :return: 0 - not in gap, 1 - inside the gap (or gap is started by this packet), 2 - gap is ended
+        """
+        end = self.__gap_end_s.get(name)
+        if end is not None:
+            if t < end:
+                return 1
+            del self.__gap_end_s[name]
+            return 2
+        if self.__due(name, t):
+            self.__gap_end_s[name] = t + self.__gap_s[name]
+            return 1
+        return 0
+
+    def apply(self, packets):
+        """
+        Apply impairments to TS packets
+
+        :param packets: Iterable of (t, packet) tuples (e.g. TSGenerator.packets)
+        :return: yields modified (t, packet) tuples
+        """
+        pcr_gap_name = None
+        pcr_removed = 0
+        for t, packet in packets:
+            b23, b4 = struct.unpack('>HB', packet[1:4])
+            pid = b23 & 8191
+            pusi = b23 & 0x4000
+            afc = (b4 >> 4) & 3
+            has_pcr = afc in (2, 3) and packet[4] > 0 and packet[5] & 0x10
+            if pid in self.__cc_shift:
+                packet = self.__shift_cc(packet, self.__cc_shift[pid])
+            if pid == 0:
+                gap = self.__gap('pat_missing', t)
+                if gap == 1:
+                    self.__cc_shift[pid] = self.__cc_shift.get(pid, 0) + 1
+                    yield t, NULL_PACKET
+                    continue
+                if gap == 2:
+                    self.__expect('pat_missing', pid)
+                if self.__due('crc', t):
+                    self.__expect('crc', pid)
+                    packet = self.__corrupt_crc(packet)
+            elif pid == self.pmt_pid:
+                gap = self.__gap('pmt_missing', t)
+                if gap == 1:
+                    self.__cc_shift[pid] = self.__cc_shift.get(pid, 0) + 1
+                    yield t, NULL_PACKET
+                    continue
+                if gap == 2:
+                    self.__expect('pmt_missing', pid)
+            if pid == self.pcr_pid and has_pcr:
+                if pcr_gap_name is None:
+                    for name in ('pcr_gap', 'pcr_disc'):
+                        if self.__due(name, t):
+                            pcr_gap_name = name
+                            pcr_removed = 0
+                            break
+                if pcr_gap_name is not None:
+                    if pcr_removed < self.__pcr_count[pcr_gap_name]:
+                        packet = self.__remove_pcr(packet)
+                        has_pcr = False
+                        pcr_removed += 1
+                    else:
+                        self.__expect(pcr_gap_name, pid)
+                        pcr_gap_name = None
+            if pid == self.es_pid and afc == 1 and not pusi and not has_pcr:
+                # Payload only packets inside PES: these impairments do not affect PES/PCR analysis
+                if self.__due('cc_gap', t):
+                    self.__expect('cc_gap', pid)
+                    yield t, NULL_PACKET
+                    continue
+                if self.__due('cc_dup', t):
+                    self.__expect('cc_dup', pid)
+                    yield t, packet
+                    yield t, packet
+                elif self.__due('tei', t):
+                    self.__expect('tei', pid)
+                    packet = packet[:1] + bytes([packet[1] | 0x80]) + packet[2:]
+                elif self.__due('scrambled', t):
+                    self.__expect('scrambled', pid)
+                    packet = packet[:3] + bytes([(packet[3] & 0x3F) | 0x80]) + packet[4:]
+            yield t, packet
+
+    @staticmethod
+    def __shift_cc(packet: bytes, shift: int) -> bytes:
+        return packet[:3] + bytes([(packet[3] & 0xF0) | ((packet[3] - shift) & 15)]) + packet[4:]
+
+    @staticmethod
+    def __corrupt_crc(packet: bytes) -> bytes:
+        pointer_field = packet[4]
+        pos = 5 + pointer_field
+        section_length = struct.unpack('>H', packet[pos + 1:pos + 3])[0] & 4095
+        pos_crc = pos + 3 + section_length - 1     # last byte of CRC-32
+        return packet[:pos_crc] + bytes([packet[pos_crc] ^ 0xFF]) + packet[pos_crc + 1:]
+
+    @staticmethod
+    def __remove_pcr(packet: bytes) -> bytes:
+        # PCR flag is cleared and 6 bytes of PCR become stuffing bytes, so packet size and payload stay the same
+        af_end = 5 + packet[4]
+        return packet[:5] + bytes([packet[5] & 0xEF]) + packet[12:af_end] + b'\xFF' * 6 + packet[af_end:]
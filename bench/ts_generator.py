@@ -0,0 +1,432 @@
+"""
+Deterministic synthetic MPEG TS generator. Generated stream contains PAT, PMT, SDT, CAT, PCR-bearing H.264 video PIDs,
+audio PIDs and null packets at configured bitrate. It is used by benchmarks and load tests instead of real recordings
+"""
+import datetime
+import random
+import struct
+
+PACKET_SIZE = 188
+PCR_CLOCK = 27000000    # 27 MHz
+PTS_CLOCK = 90000       # 90 kHz
+KEY_FRAME_WEIGHT = 3    # Key frame is this number of times larger than other frames of GOP
+RATE_HEADROOM = 1.25    # Packet rate of elementary stream above its average rate (catching up after key frames)
+VIDEO_PES_HEADER = 19   # PES header with PTS and DTS
+AUDIO_PES_HEADER = 14   # PES header with PTS
+
+_crc_table = None
+
+
+def crc32mpeg2(data: bytes) -> int:
+    """
+    Table-driven CRC-32/MPEG-2 (generator side only, the analyzer uses TSParser.crc32mpeg2)
+
+    :param data: bytes array for CRC calculation
+    :return: CRC-32/MPEG-2 for this bytes array
+    """
+    global _crc_table
+    if _crc_table is None:
+        _crc_table = list()
+        for i in range(256):
+            crc = i << 24
+            for j in range(8):
+                crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+            _crc_table.append(crc & 0xFFFFFFFF)
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _crc_table[(crc >> 24) ^ byte]
+    return crc
+
+
+def build_section(table_id: int, table_id_ext: int, body: bytes, ver_num=0, long_header=True) -> bytes:
+    """
+    Build PSI/SI section with section header and CRC-32
+
+    :param table_id: Table ID
+    :param table_id_ext: Table ID extension (transport_stream_id, program_number, service_id, etc.)
+    :param body: Section data after last_section_number
+    :param ver_num: Version number
+    :param long_header: If False section has short header without CRC (e.g. TDT)
+    :return: section bytes
+    """
+    if not long_header:
+        return struct.pack('>BH', table_id, 0x7000 | len(body)) + body
+    section_length = 5 + len(body) + 4
+    section = struct.pack('>BHHBBB', table_id, 0xB000 | section_length, table_id_ext,
+                          0xC1 | ((ver_num & 31) << 1), 0, 0) + body
+    return section + struct.pack('>L', crc32mpeg2(section))
+
+
+def packets_per_pes(pes_bytes: int) -> int:
+    """
+    :param pes_bytes: PES packet length in bytes
+    :return: Number of TS packets carrying the PES (without adaptation fields)
+    """
+    return -(-pes_bytes // (PACKET_SIZE - 4))
+
+
+def frame_bytes(bitrate: int, frame_duration_ms: float, frame_num: int, gop_size: int) -> int:
+    """
+    Elementary stream bytes of frame. Key frames of video are KEY_FRAME_WEIGHT times larger than other frames within
+    the same average bitrate of GOP
+
+    :param bitrate: Elementary stream bitrate
+    :param frame_duration_ms: Frame duration in ms
+    :param frame_num: Frame number from stream start
+    :param gop_size: Number of frames in GOP (0 - audio)
+    :return: Frame size in bytes
+    """
+    average = bitrate * frame_duration_ms / 8000
+    if gop_size == 0:
+        return int(average)
+    base = average * gop_size / (gop_size + KEY_FRAME_WEIGHT - 1)
+    return int(base * KEY_FRAME_WEIGHT) if frame_num % gop_size == 0 else int(base)
+
+
+def packet_rate(bitrate: int, frame_duration_ms: float, gop_size: int) -> float:
+    """
+    :return: Average number of TS packets per second of elementary stream (see frame_bytes)
+    """
+    header = VIDEO_PES_HEADER if gop_size > 0 else AUDIO_PES_HEADER
+    frames = max(gop_size, 1)
+    packets = sum(packets_per_pes(header + frame_bytes(bitrate, frame_duration_ms, k, gop_size))
+                  for k in range(frames))
+    return packets * 1000 / (frames * frame_duration_ms)
+
+
+def pes_timestamp(prefix: int, ts: int) -> bytes:
+    """
+    Encode 33-bit PTS/DTS into 5 bytes PES header field
+
+    :param prefix: 4-bit prefix ('0010' - PTS only, '0011' - PTS with DTS, '0001' - DTS)
+    :param ts: Timestamp in 90 kHz units
+    :return: encoded bytes
+    """
+    ts &= 0x1FFFFFFFF
+    return struct.pack('>BHH', (prefix << 4) | (((ts >> 30) & 7) << 1) | 1,
+                       (((ts >> 15) & 0x7FFF) << 1) | 1, ((ts & 0x7FFF) << 1) | 1)
+
+
+class ElementaryStream:
+    """ State of one elementary stream (PES producer) of the generator """
+    def __init__(self, pid: int, stream_type: int, stream_id: int, bitrate: int, frame_duration_ms: float,
+                 gop_size=0, pcr=False):
+        self.pid = pid
+        self.stream_type = stream_type
+        self.stream_id = stream_id
+        self.bitrate = bitrate
+        self.frame_duration_ms = frame_duration_ms
+        self.gop_size = gop_size            # 0 - audio (no GOP)
+        self.pcr = pcr
+        self.packet_rate = packet_rate(bitrate, frame_duration_ms, gop_size)
+        self.cc = 0
+        self.frame_num = 0
+        self.next_frame_s = 0.0
+        self.pending = b''                  # PES bytes not yet packetized
+        self.pending_key = False            # Pending PES starts with random access point
+        self.pusi = False                   # Next packet starts new PES
+
+
+class TSGenerator:
+    """
+    Generator of synthetic TS packets. The stream is fully deterministic for given parameters and seed: packets are
+    scheduled on a fixed grid of 188*8/bitrate seconds, PSI is repeated at fixed intervals and video/audio PES are
+    produced according to their frame rates. Remaining capacity is filled with null packets
+    """
+    def __init__(self, bitrate=4000000, video_pids=(256,), audio_pids=(257,), pmt_pid=4096, program_number=1,
+                 ts_id=1, service_name='Synthetic', provider_name='iptv-analyzer', video_bitrate=None,
+                 audio_bitrate=128000, fps=25, gop_size=25, pcr_interval_ms=20, psi_interval_ms=100,
+                 sdt_interval_ms=500, cat_interval_ms=500, ca_pid=None, seed=0, start_dt=None):
+        """
+        Initialize the object
+
+        :param bitrate: Total TS bitrate (bit/s) including null packets
+        :param video_pids: PIDs of H.264 video streams. The first one carries PCR
+        :param audio_pids: PIDs of MPEG audio streams
+        :param pmt_pid: PID of PMT
+        :param program_number: Program number (service ID)
+        :param ts_id: Transport stream ID
+        :param service_name: Service name for SDT
+        :param provider_name: Service provider name for SDT
+        :param video_bitrate: Bitrate of each video stream. Default is the capacity left after PSI/SI and audio
+                              packets (with RATE_HEADROOM) divided by number of video PIDs
+        :param audio_bitrate: Bitrate of each audio stream
+        :param fps: Video frame rate
+        :param gop_size: Number of frames in GOP (distance between IDR frames)
+        :param pcr_interval_ms: PCR repetition interval
+        :param psi_interval_ms: PAT and PMT repetition interval
+        :param sdt_interval_ms: SDT repetition interval
+        :param cat_interval_ms: CAT repetition interval
+        :param ca_pid: If set CAT contains CA_descriptor with this EMM PID
+        :param seed: Seed for pseudo-random payload bytes
+        :param start_dt: Timestamp of the first packet. Default is 2020-01-01 00:00:00
+        """
+        self.bitrate = bitrate
+        self.packet_duration_s = PACKET_SIZE * 8 / bitrate
+        self.pmt_pid = pmt_pid
+        self.program_number = program_number
+        self.ts_id = ts_id
+        self.start_dt = start_dt if start_dt is not None else datetime.datetime(2020, 1, 1)
+        self.__rnd = random.Random(seed)
+        if video_bitrate is None:
+            # Packets per second left for video: total minus PSI/SI tables and audio
+            rate = (bitrate / (PACKET_SIZE * 8) - 2000 / psi_interval_ms - 1000 / sdt_interval_ms
+                    - 1000 / cat_interval_ms - len(audio_pids) * packet_rate(audio_bitrate, 24, 0) * RATE_HEADROOM)
+            rate /= RATE_HEADROOM * max(len(video_pids), 1)
+            # PES headers and stuffing of the last packet of frames take less than 5% of video packets
+            video_bitrate = max(int(rate * (PACKET_SIZE - 4) * 8 * 0.95), 0)
+        self.streams = list()
+        for i, pid in enumerate(video_pids):
+            self.streams.append(ElementaryStream(pid, 0x1B, 0xE0 + i, video_bitrate, 1000 / fps, gop_size=gop_size,
+                                                 pcr=(i == 0)))
+        for i, pid in enumerate(audio_pids):
+            self.streams.append(ElementaryStream(pid, 0x03, 0xC0 + i, audio_bitrate, 24))
+        self.pcr_pid = video_pids[0] if len(video_pids) > 0 else audio_pids[0]
+        if len(video_pids) == 0:
+            self.streams[0].pcr = True
+        self.__pcr_interval_s = pcr_interval_ms / 1000
+        self.__tables = list()      # [pid, interval_s, next_s, section, cc]
+        self.__tables.append([0, psi_interval_ms / 1000, 0.0, self.__build_pat(), 0])
+        self.__tables.append([pmt_pid, psi_interval_ms / 1000, 0.0, self.__build_pmt(ca_pid), 0])
+        self.__tables.append([1, cat_interval_ms / 1000, 0.0, self.__build_cat(ca_pid), 0])
+        self.__tables.append([17, sdt_interval_ms / 1000, 0.0, self.__build_sdt(service_name, provider_name), 0])
+        # Payload pool to avoid generating pseudo-random bytes per packet. Zero bytes are excluded to avoid start
+        # code emulation inside generated elementary stream
+        self.__pool = bytes(self.__rnd.randrange(1, 256) for i in range(65536))
+
+    def __build_pat(self) -> bytes:
+        body = struct.pack('>HH', self.program_number, 0xE000 | self.pmt_pid)
+        return build_section(0x00, self.ts_id, body)
+
+    def __build_pmt(self, ca_pid) -> bytes:
+        prog_info = b''
+        if ca_pid is not None:
+            prog_info = struct.pack('>BBHH', 9, 4, 0x0B00, 0xE000 | ca_pid)
+        body = struct.pack('>HH', 0xE000 | self.pcr_pid, 0xF000 | len(prog_info)) + prog_info
+        for stream in self.streams:
+            body += struct.pack('>BHH', stream.stream_type, 0xE000 | stream.pid, 0xF000)
+        return build_section(0x02, self.program_number, body)
+
+    def __build_cat(self, ca_pid) -> bytes:
+        body = b''
+        if ca_pid is not None:
+            body = struct.pack('>BBHH', 9, 4, 0x0B00, 0xE000 | ca_pid)
+        return build_section(0x01, 0xFFFF, body)
+
+    def __build_sdt(self, service_name: str, provider_name: str) -> bytes:
+        provider = b'\x05' + provider_name.encode('iso-8859-9')     # 0x05 - ISO/IEC 8859-9 (see decode_text)
+        name = b'\x05' + service_name.encode('iso-8859-9')
+        descriptor = bytes([0x01, len(provider)]) + provider + bytes([len(name)]) + name
+        descriptor = bytes([72, len(descriptor)]) + descriptor
+        service = struct.pack('>HBH', self.program_number, 0xFC, 0x8000 | len(descriptor)) + descriptor
+        body = struct.pack('>HB', self.ts_id, 0xFF) + service      # original_network_id, reserved
+        return build_section(0x42, self.ts_id, body)
+
+    def __payload(self, n: int) -> bytes:
+        pos = self.__rnd.randrange(0, len(self.__pool))
+        if pos + n <= len(self.__pool):
+            return self.__pool[pos:pos + n]
+        # Large frames (high bitrates) reuse the pool several times
+        return (self.__pool[pos:] + self.__pool * (n // len(self.__pool) + 1))[:n]
+
+    def __build_pes(self, stream: ElementaryStream, t: float) -> bytes:
+        """
+        Build PES packet for the next frame of the stream
+
+        :param stream: Elementary stream
+        :param t: Frame time in seconds from the stream start
+        :return: PES bytes
+        """
+        size = frame_bytes(stream.bitrate, stream.frame_duration_ms, stream.frame_num, stream.gop_size)
+        pts = int((t + 0.5) * PTS_CLOCK)    # 500 ms of decoder buffer delay
+        if stream.gop_size > 0:
+            is_key = stream.frame_num % stream.gop_size == 0
+            # Access unit delimiter + slice NAL unit (IDR or non-IDR)
+            es = (b'\x00\x00\x00\x01\x09\xF0' + b'\x00\x00\x00\x01' + (b'\x65\x88' if is_key else b'\x41\x9A')
+                  + self.__payload(max(size - 12, 1)))
+            dts = pts - int(stream.frame_duration_ms * 90)
+            header = b'\xC0' + pes_timestamp(3, pts) + pes_timestamp(1, dts)
+            stream.pending_key = is_key
+            pes_packet_length = 0       # unbounded for video
+        else:
+            es = b'\xFF\xFD' + self.__payload(max(size - 2, 1))
+            header = b'\x80' + pes_timestamp(2, pts)
+            stream.pending_key = False
+            pes_packet_length = 3 + len(header) - 1 + len(es)
+        stream.frame_num += 1
+        return (b'\x00\x00\x01' + struct.pack('>BHBB', stream.stream_id, pes_packet_length, 0x80, header[0])
+                + bytes([len(header) - 1]) + header[1:] + es)
+
+    def __section_packet(self, table: list) -> bytes:
+        # Sections longer than one packet are not produced by this generator
+        section = table[3]
+        header = struct.pack('>BHB', 0x47, 0x4000 | table[0], 0x10 | table[4])
+        table[4] = (table[4] + 1) & 15
+        payload = b'\x00' + section
+        return header + payload + b'\xFF' * (PACKET_SIZE - 4 - len(payload))
+
+    def __stream_packet(self, stream: ElementaryStream, t: float, with_pcr: bool) -> bytes:
+        pusi = stream.pusi
+        af = b''
+        if with_pcr or (pusi and stream.pending_key):
+            flags = 0
+            if pusi and stream.pending_key:
+                flags |= 0x40       # random_access_indicator
+            af_body = b''
+            if with_pcr:
+                flags |= 0x10
+                pcr = int(t * PCR_CLOCK)
+                base, ext = pcr // 300, pcr % 300
+                af_body = struct.pack('>LH', (base >> 1) & 0xFFFFFFFF, ((base & 1) << 15) | 0x7E00 | ext)
+            af = bytes([1 + len(af_body), flags]) + af_body
+        room = PACKET_SIZE - 4 - len(af)
+        chunk = stream.pending[:room]
+        stream.pending = stream.pending[room:]
+        stream.pusi = False
+        if len(chunk) < room:
+            # Stuffing in adaptation field
+            stuffing = room - len(chunk)
+            if len(af) == 0:
+                af = bytes([stuffing - 1]) + (b'\x00' + b'\xFF' * (stuffing - 2) if stuffing > 1 else b'')
+            else:
+                af = bytes([af[0] + stuffing]) + af[1:] + b'\xFF' * stuffing
+        afc = (0x30 if len(af) > 0 else 0x10) if len(chunk) > 0 else 0x20
+        header = struct.pack('>BHB', 0x47, (0x4000 if pusi else 0) | stream.pid, afc | stream.cc)
+        if len(chunk) > 0:
+            stream.cc = (stream.cc + 1) & 15
+        return header + af + chunk
+
+    def packets(self, duration_s: float):
+        """
+        Generate TS packets
+
+        :param duration_s: Stream duration in seconds
+        :return: yields tuple (t, packet), where t - packet time in seconds from stream start and packet - 188 bytes
+        """
+        null_packet = struct.pack('>BHB', 0x47, 8191, 0x10) + b'\xFF' * (PACKET_SIZE - 4)
+        pcr_stream = [stream for stream in self.streams if stream.pcr][0]
+        next_pcr_s = 0.0
+        credits = [0.0] * len(self.streams)
+        n = int(duration_s / self.packet_duration_s)
+        for i in range(n):
+            t = i * self.packet_duration_s
+            # Produce PES for due frames
+            for stream in self.streams:
+                if t >= stream.next_frame_s and len(stream.pending) == 0:
+                    stream.pending = self.__build_pes(stream, stream.next_frame_s)
+                    stream.pusi = True
+                    stream.next_frame_s += stream.frame_duration_ms / 1000
+            # PSI/SI tables have the highest priority
+            packet = None
+            for table in self.__tables:
+                if t >= table[2]:
+                    table[2] += table[1]
+                    packet = self.__section_packet(table)
+                    break
+            if packet is None and t >= next_pcr_s:
+                next_pcr_s += self.__pcr_interval_s
+                packet = self.__stream_packet(pcr_stream, t, True)
+            if packet is None:
+                # Elementary streams share the capacity according to their packet rates
+                best = -1
+                for k, stream in enumerate(self.streams):
+                    credits[k] = min(credits[k] + stream.packet_rate * RATE_HEADROOM * self.packet_duration_s, 4)
+                    if len(stream.pending) > 0 and credits[k] >= 1 and (best == -1 or credits[k] > credits[best]):
+                        best = k
+                if best != -1:
+                    credits[best] -= 1
+                    packet = self.__stream_packet(self.streams[best], t, False)
+                else:
+                    packet = null_packet
+            yield t, packet
+
+    def dt(self, t: float) -> datetime.datetime:
+        """
+        :param t: Time in seconds from stream start
+        :return: Timestamp corresponding to this time
+        """
+        return self.start_dt + datetime.timedelta(seconds=t)
+
+
+def datagrams(packets, packets_per_datagram=7):
+    """
+    Pack TS packets into UDP datagram payloads
+
+    :param packets: Iterable of (t, packet) tuples (e.g. TSGenerator.packets)
+    :param packets_per_datagram: Number of TS packets per datagram
+    :return: yields tuple (t, data), where t - time of the last packet in datagram
+    """
+    chunk = list()
+    t = 0.0
+    for t, packet in packets:
+        chunk.append(packet)
+        if len(chunk) == packets_per_datagram:
+            yield t, b''.join(chunk)
+            chunk = list()
+    if len(chunk) > 0:
+        yield t, b''.join(chunk)
+
+
+def write_ts(path: str, packets):
+    """
+    Write TS packets into TS-file
+
+    :param path: Output file path
+    :param packets: Iterable of (t, packet) tuples
+    :return: Number of written packets
+    """
+    n = 0
+    with open(path, 'wb') as f:
+        for t, packet in packets:
+            f.write(packet)
+            n += 1
+    return n
+
+
+def udp_frame(data: bytes, dst_ip='239.0.0.1', dst_port=1234, src_ip='10.0.0.1', src_port=5000) -> bytes:
+    """
+    Wrap UDP payload into Ethernet/IPv4/UDP headers (as captured by Wireshark)
+
+    :param data: UDP payload
+    :param dst_ip: Destination IP address
+    :param dst_port: Destination UDP port
+    :param src_ip: Source IP address
+    :param src_port: Source UDP port
+    :return: Ethernet frame bytes
+    """
+    dst = bytes(int(x) for x in dst_ip.split('.'))
+    src = bytes(int(x) for x in src_ip.split('.'))
+    # Multicast MAC address 01:00:5E + lower 23 bits of group address
+    eth = bytes([0x01, 0x00, 0x5E, dst[1] & 0x7F, dst[2], dst[3]]) + b'\x02\x00\x00\x00\x00\x01' + b'\x08\x00'
+    udp = struct.pack('>HHHH', src_port, dst_port, 8 + len(data), 0)
+    ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(udp) + len(data), 0, 0x4000, 32, 17, 0, src, dst)
+    checksum = sum(struct.unpack('>10H', ip))
+    checksum = (checksum & 0xFFFF) + (checksum >> 16)
+    checksum = ~((checksum & 0xFFFF) + (checksum >> 16)) & 0xFFFF
+    ip = ip[:10] + struct.pack('>H', checksum) + ip[12:]
+    return eth + ip + udp + data
+
+
+def write_pcap(path: str, datagrams_iter, start_dt: datetime.datetime, dst_ip='239.0.0.1', dst_port=1234):
+    """
+    Write UDP datagrams into pcap-file (readable by pcap_reader)
+
+    :param path: Output file path
+    :param datagrams_iter: Iterable of (t, data) tuples (e.g. datagrams())
+    :param start_dt: Timestamp of t=0
+    :param dst_ip: Destination (multicast group) IP address
+    :param dst_port: Destination UDP port
+    :return: Number of written datagrams
+    """
+    n = 0
+    start = start_dt.timestamp()
+    with open(path, 'wb') as f:
+        # magic, version 2.4, thiszone, sigfigs, snaplen, network (1 - Ethernet)
+        f.write(struct.pack('=LHHlLLL', 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        for t, data in datagrams_iter:
+            frame = udp_frame(data, dst_ip=dst_ip, dst_port=dst_port)
+            sec, usec = divmod(int(round((start + t) * 1000000)), 1000000)
+            f.write(struct.pack('=LLLL', sec, usec, len(frame), len(frame)))
+            f.write(frame)
+            n += 1
+    return n
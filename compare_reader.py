@@ -0,0 +1,211 @@
+import argparse
+
+
+def compare_reader(inputs=None, pcap_file=None, mon_time_s=180, wait_s=15, stat_interval_s=1, interface=None,
+                   bufsize=1358, window_s=5.0) -> dict:
+    """
+    Compare two copies of one channel (e.g. main and backup streams from two headends) received from two multicast
+    groups or dumped into one pcap-file. Each stream is analyzed once by its own reader and statistics, comparison of
+    each stat interval (errors, bitrate, PSI versions, delay, PCR offset and content divergence, see ts_compare) is
+    printed as JSON
+
+    :param inputs: Two 'address:port' strings: multicast groups to subscribe to or UDP destinations of flows in
+                   pcap-file (default for pcap-file is the first two UDP flows)
+    :param pcap_file: If set, streams are read from this pcap-file instead of multicast
+    :param mon_time_s: Monitoring time in seconds
+    :param wait_s: Time to wait multicast in seconds
+    :param stat_interval_s: Statistics and comparison interval in seconds
+    :param interface: IP address of interface to join multicast groups on. Default is the address of host name
+    :param bufsize: Receive buffer size
+    :param window_s: PES not found in the other stream within this time are counted as missing
+    :return: Totals of the comparison (see StreamComparator.get_totals) or None if no stream found
+    """
+    import datetime
+    import json
+    from ts.ts_reader import TSReader
+    from ts.ts_stat import Statistics
+    from ts.ts_rtp import RtpLayer
+    from ts.ts_compare import StreamComparator, StreamSummary
+
+    comparator = StreamComparator(window_s=window_s)
+
+    def print_result(result: dict):
+        print(json.dumps(result))
+    comparator.onCompareReady += print_result
+
+    def add_stream(name: str):
+        ts_reader = TSReader(rtp=RtpLayer(), summary=StreamSummary())
+        stats = Statistics(pcap=True, interval_s=stat_interval_s, anomalies=ts_reader.anomalies)
+        stats.known_pids = ts_reader.known_pids
+        ts_reader.onPacketDecoded += stats.update_stat
+        ts_reader.onPatReceived += stats.update_programs_info
+        ts_reader.onPmtReceived += stats.update_programs_info
+        ts_reader.onCatReceived += stats.update_programs_info
+        comparator.add_stream(name, ts_reader, stats, ts_reader.summary)
+        return ts_reader, stats
+
+    streams = dict()    # (address, port) -> (TSReader, Statistics)
+    if pcap_file is not None:
+        read_pcap(pcap_file, inputs, streams, add_stream)
+    else:
+        read_multicast(inputs, streams, add_stream, mon_time_s, wait_s, interface, bufsize)
+
+    for ts_reader, stats in streams.values():
+        stats.get_stat()
+    comparator.flush()
+    if len(streams) == 0:
+        print('NO STREAMS FOUND!!!')
+        return None
+    totals = comparator.get_totals()
+    print('\nCOMPARISON SUMMARY ({}): {}'.format(datetime.datetime.now(), json.dumps(totals)))
+    return totals
+
+
+def parse_address(address: str) -> tuple:
+    """
+    :param address: 'address:port' string (port 1234 if omitted)
+    :return: (address, port) tuple
+    """
+    host, _, port = address.partition(':')
+    return host, int(port) if port else 1234
+
+
+def read_pcap(pcap_file: str, inputs, streams: dict, add_stream):
+    """
+    Read two UDP flows of pcap-file into their streams
+
+    :param pcap_file: Full path to pcap-file
+    :param inputs: Two 'address:port' strings of flows (destination). Default is the first two UDP flows
+    :param streams: Dictionary (address, port) -> (TSReader, Statistics) filled by streams of the flows
+    :param add_stream: Function creating reader and statistics of the stream by its name
+    """
+    import struct
+    import datetime
+    import socket
+
+    flows = [parse_address(address) for address in inputs] if inputs is not None else None
+    if flows is not None:
+        for flow in flows:
+            streams[flow] = add_stream('{}:{}'.format(*flow))
+    with open(pcap_file, 'rb') as f:
+        f.read(24)  # read pcap global header
+        while True:
+            # packet_header
+            b = f.read(8)  # time sec usec
+            if len(b) < 8:
+                break
+            sec, usec = struct.unpack('=LL', b)
+            dt = datetime.datetime.fromtimestamp(sec) + datetime.timedelta(microseconds=usec)
+            plen, empty = struct.unpack('=LL', f.read(8))
+            data = f.read(plen)
+            # 14 (ethernet header) + 10 (IP header - protocol byte)
+            if len(data) < 42 or data[23] != 17:  # 17 UDP
+                continue
+            flow = (socket.inet_ntoa(data[30:34]), (data[36] << 8) | data[37])
+            stream = streams.get(flow)
+            if stream is None:
+                if flows is not None or len(streams) == 2:
+                    continue
+                stream = streams[flow] = add_stream('{}:{}'.format(*flow))
+            # + 10 (rest of IP header) + 8 (UDP header)
+            stream[0].read(data[42:], dt=dt)
+
+
+def read_multicast(inputs, streams: dict, add_stream, mon_time_s: int, wait_s: int, interface, bufsize: int):
+    """
+    Subscribe to two multicast groups and read them in one thread
+
+    :param inputs: Two 'address:port' strings of multicast groups
+    :param streams: Dictionary (address, port) -> (TSReader, Statistics) filled by streams of the groups
+    :param add_stream: Function creating reader and statistics of the stream by its name
+    :param mon_time_s: Monitoring time in seconds
+    :param wait_s: Time to wait multicast in seconds
+    :param interface: IP address of interface to join multicast groups on
+    :param bufsize: Receive buffer size
+    """
+    import datetime
+    import selectors
+    import socket
+    import sys
+
+    if inputs is None or len(inputs) != 2:
+        raise ValueError('Two multicast groups are required')
+    host = interface if interface is not None else socket.gethostbyname(socket.gethostname())
+    selector = selectors.DefaultSelector()
+    sockets = list()
+    for address in inputs:
+        group = parse_address(address)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Linux delivers multicast only to sockets bound to the group (or any) address
+        sock.bind((host if sys.platform == 'win32' else group[0], group[1]))
+        sock.setblocking(False)
+        streams[group] = add_stream(address)
+        selector.register(sock, selectors.EVENT_READ, streams[group][0])
+        sockets.append((sock, socket.inet_aton(group[0]) + socket.inet_aton(host)))
+
+    start_dt = datetime.datetime.now()
+    for sock, mreq in sockets:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    print('START MONITORING: {}'.format(start_dt))
+    received = set()
+    try:
+        while True:
+            events = selector.select(timeout=wait_s)
+            dt = datetime.datetime.now()
+            if len(events) == 0 or (dt - start_dt).total_seconds() > mon_time_s:
+                break
+            for key, mask in events:
+                try:
+                    data = key.fileobj.recv(bufsize)
+                except BlockingIOError:
+                    continue
+                received.add(key.fileobj)
+                key.data.read(data, dt=dt)
+    finally:
+        selector.close()
+        for sock, mreq in sockets:
+            sock.close()
+    print('\nSTOP MONITORING: {}\n'.format(datetime.datetime.now()))
+    if len(received) == 0:
+        streams.clear()
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """
+    Add command line arguments of compare_reader to the parser
+
+    :param parser: ArgumentParser object (or subcommand parser)
+    """
+    parser.add_argument('-i', '--inputs', nargs=2, default=None, metavar='ADDRESS:PORT',
+                        help='two multicast groups (or UDP destinations of flows in pcap-file) to compare')
+    parser.add_argument('--pcap', nargs='?', default=None,
+                        help='read streams from this pcap-file (default flows are the first two UDP flows)')
+    parser.add_argument('-w', '--wait_s', nargs='?', type=int, default=15, help='time to wait multicast in seconds')
+    parser.add_argument('-t', '--mon_time_s', nargs='?', type=int, default=180, help='monitoring time in seconds')
+    parser.add_argument('-s', '--stat_int_s', nargs='?', type=int, default=1,
+                        help='statistics and comparison interval in seconds')
+    parser.add_argument('-n', '--interface', nargs='?', default=None,
+                        help='ip address of interface to join multicast groups on (default: host address)')
+    parser.add_argument('--window_s', nargs='?', type=float, default=5.0,
+                        help='PES not found in the other stream within this time are counted as missing')
+
+
+def run(args: dict):
+    """
+    Run compare_reader with parsed command line arguments
+
+    :param args: Dictionary of parsed arguments (see add_arguments)
+    """
+    if args['pcap'] is None and args['inputs'] is None:
+        raise SystemExit('compare: two multicast groups (-i) or pcap-file (--pcap) are required')
+    return compare_reader(args['inputs'], pcap_file=args['pcap'], mon_time_s=args['mon_time_s'],
+                          wait_s=args['wait_s'], stat_interval_s=args['stat_int_s'], interface=args['interface'],
+                          window_s=args['window_s'])
+
+
+if __name__ == "__main__":
+    """Compare two copies of one channel (main and backup streams)"""
+    parser = argparse.ArgumentParser(description='Compare main and backup copies of multicast IPTV stream')
+    add_arguments(parser)
+    run(vars(parser.parse_args()))
@@ -1,7 +1,48 @@
-import csv
+import os
+
+DICTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_lookup_tables = dict()    # Module level cache: dictionary name -> LookupTable
+
+
+class LookupTable:
+    """
+    Dictionary precompiled into direct lookup array. Each value of the dictionary (including values from ranges) is
+    an index in the array, so lookup takes O(1)
+    """
+    def __init__(self, dictionary: list):
+        """
+        Initialize object
+
+        :param dictionary: Dictionary loaded by load_dictionary_csv
+        """
+        size = 256
+        for item in dictionary:
+            if item['value2'] >= size:
+                size = 65536
+        self.__table = [None] * size
+        # Reversed order keeps the first matching item as in linear search
+        for item in reversed(dictionary):
+            if item['range']:
+                for value in range(item['value1'], min(item['value2'], size - 1) + 1):
+                    self.__table[value] = item['description']
+            else:
+                self.__table[item['value1']] = item['description']
+
+    def find(self, value: int) -> str:
+        """
+        :param value: Value to be found
+        :return: Description of the value or None if value is not in the dictionary
+        """
+        if 0 <= value < len(self.__table):
+            return self.__table[value]
+        return None
+
+    __getitem__ = find
 
 
 def load_dictionary_csv(file: str) -> list:
+    import csv      # Imported on first dictionary load only
 
     dictionary = list()
     with open(file, newline='') as csvfile:
@@ -18,10 +59,26 @@ def load_dictionary_csv(file: str) -> list:
     return dictionary
 
 
-def find(dictionary: list, value: int) -> str:
+def get_dictionary(name: str) -> LookupTable:
+    """
+    Return dictionary precompiled into lookup table. Dictionary is loaded from the package directory once per process
+
+    :param name: Dictionary name (CSV file name without extension), e.g. 'stream_type'
+    :return: LookupTable object
+    """
+    table = _lookup_tables.get(name)
+    if table is None:
+        table = LookupTable(load_dictionary_csv(os.path.join(DICTS_DIR, name + '.csv')))
+        _lookup_tables[name] = table
+    return table
+
+
+def find(dictionary, value: int) -> str:
+    if isinstance(dictionary, LookupTable):
+        return dictionary.find(value)
     for item in dictionary:
         if item['range']:
-            if value in range(item['value1'], item['value2']+1):
+            if item['value1'] <= value <= item['value2']:
                 return item['description']
         else:
             if value == item['value1']:
@@ -0,0 +1,81 @@
+"""
+Single entry point for IPTV analyzer. Each subcommand is implemented in its own module which is imported only when
+the subcommand is executed, so starting the analyzer does not pay for modules it does not use. Subcommand modules in
+turn import analyzer modules inside their reader functions, not at module level, so importing a subcommand module to
+add its arguments stays cheap
+"""
+import argparse
+import importlib
+
+# subcommand -> (module, help)
+COMMANDS = {
+    'multicast': ('multicast_reader', 'subscribe to multicast stream and monitor it according to ETSI TR 101 290'),
+    'pcap': ('pcap_reader', 'analyze multicast stream dumped into Wireshark pcap-file'),
+    'file': ('tsfile_reader', 'analyze multicast stream recorded into MPEG TS-file'),
+    'compare': ('compare_reader', 'compare main and backup copies of multicast stream'),
+}
+
+
+def build_parser(argv=None) -> argparse.ArgumentParser:
+    """
+    Build command line parser. Only the module of the selected subcommand is imported to add its arguments
+
+    :param argv: Command line arguments (without program name)
+    :return: ArgumentParser object
+    """
+    parser = argparse.ArgumentParser(description='IPTV analyzer for measuring MPEG Transport Stream quality '
+                                                 + 'according to ETSI TR 101 290')
+    parser.add_argument('--cprofile', metavar='FILE', default=None,
+                        help='run subcommand under cProfile and dump profile to FILE (see pstats)')
+    parser.add_argument('--cprofile_top', metavar='N', type=int, default=0,
+                        help='print N most expensive functions (by cumulative time) of cProfile run')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+    selected = next((arg for arg in argv if arg in COMMANDS), None) if argv is not None else None
+    for command, (module, help_str) in COMMANDS.items():
+        subparser = subparsers.add_parser(command, help=help_str)
+        if command == selected:
+            importlib.import_module(module).add_arguments(subparser)
+    return parser
+
+
+def main(argv=None):
+    """
+    Parse command line and run selected subcommand
+
+    :param argv: Command line arguments (without program name). Default is sys.argv[1:]
+    """
+    if argv is None:
+        import sys
+        argv = sys.argv[1:]
+    args = vars(build_parser(argv).parse_args(argv))
+    module = importlib.import_module(COMMANDS[args['command']][0])
+    if args['cprofile'] is None and args['cprofile_top'] == 0:
+        return module.run(args)
+    return run_profiled(module.run, args, args['cprofile'], args['cprofile_top'])
+
+
+def run_profiled(func, args: dict, path=None, top=0):
+    """
+    Run subcommand under cProfile
+
+    :param func: Subcommand run function
+    :param args: Dictionary of parsed arguments
+    :param path: File to dump profile to (can be loaded by pstats or snakeviz). Not dumped if None
+    :param top: Number of the most expensive functions to print
+    :return: result of func
+    """
+    import cProfile
+    import pstats
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, args)
+    finally:
+        if path is not None:
+            profile.dump_stats(path)
+        if top > 0:
+            pstats.Stats(profile).sort_stats('cumulative').print_stats(top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+class EIT:
+    """
+    Event Information Table (EIT) contains data concerning events or programmes such as event name, start time,
+    duration, etc. Present/following (table_id 0x4E, 0x4F) and schedule (table_id 0x50 - 0x6F) tables
+    """
+    def __init__(self):
+        self.table_id = 0               # Table ID
+        self.service_id = 0             # Service ID
+        self.ver_num = 0                # Version number
+        self.cur_next_ind = 0           # Current Next Indicator
+        self.sec_num = 0                # Section Number
+        self.last_sec_num = 0           # Last Section Number
+        self.transport_stream_id = 0    # Transport Stream ID
+        self.original_network_id = 0    # Original Network ID
+        self.segment_last_sec_num = 0   # Segment Last Section Number
+        self.last_table_id = 0          # Last Table ID
+        self.events = []                # Events with descriptors
+        self.crc32 = 0                  # 32-bit CRC
+        self.crc32_ok = True            # Status of CRC verification
@@ -0,0 +1,16 @@
+class NIT:
+    """
+    Network Information Table (NIT) conveys information relating to the physical organization of the multiplexes/TSs
+    carried via a given network, and the characteristics of the network itself
+    """
+    def __init__(self):
+        self.table_id = 0               # Table ID (0x40 - actual network, 0x41 - other network)
+        self.network_id = 0             # Network ID
+        self.ver_num = 0                # Version number
+        self.cur_next_ind = 0           # Current Next Indicator
+        self.sec_num = 0                # Section Number
+        self.last_sec_num = 0           # Last Section Number
+        self.descriptors = []           # Network descriptors
+        self.transport_streams = []     # Transport streams with descriptors
+        self.crc32 = 0                  # 32-bit CRC
+        self.crc32_ok = True            # Status of CRC verification
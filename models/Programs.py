@@ -19,6 +19,10 @@ class Programs:
         self.__other_pids = set()
         self.__cat = None
         self.__sdt = None
+        self.__pid_programs = dict()    # pid -> tuple of program numbers which refer to the PID
+        self.__services = dict()        # program_number -> {'service_type', 'service_provider_name', 'service_name'}
+        self.__sdt_sections = (None, set())     # (version, section numbers) of SDT actual received since PAT
+        self.__sdt_cycle = False        # All sections of SDT actual are received since PAT
 
     @property
     def pat(self) -> PAT:
@@ -27,6 +31,9 @@ class Programs:
     @pat.setter
     def pat(self, pat: PAT):
         self.__pat = pat
+        # Services of new programs are looked for in the next SDT cycle
+        self.__sdt_sections = (None, set())
+        self.__sdt_cycle = False
         for prog in pat.prog_nums:
             if prog['program_number'] == 0:
                 self.__net_pids.add(prog['network_PID'])
@@ -53,6 +60,30 @@ class Programs:
     def get_other_pids(self) -> set:
         return self.__other_pids
 
+    def get_pid_programs(self, pid: int) -> tuple:
+        """
+        :param pid: PID
+        :return: program numbers of programs which PMT refers to the PID (PMT, PCR, elementary and ECM PIDs)
+        """
+        return self.__pid_programs.get(pid, ())
+
+    def get_programs(self) -> dict:
+        """
+        :return: program_number -> PMT PID of programs which PMT is received
+        """
+        return {pmt.prog_num: int(pid) for pid, pmt in self.__pmt.items()}
+
+    def __index_programs(self):
+        """ Rebuild PID -> programs index. Called on PMT changes only, so lookups stay O(1) per packet """
+        pid_programs = dict()
+        for pid, pmt in self.__pmt.items():
+            pids = {int(pid), pmt.pcr_pid}
+            pids.update(stream['elementary_pid'] for stream in pmt.streams)
+            pids.update(desc['descriptor_data']['ca_pid'] for desc in pmt.descriptors if desc['descriptor_tag'] == 9)
+            for program_pid in pids:
+                pid_programs[program_pid] = pid_programs.get(program_pid, ()) + (pmt.prog_num,)
+        self.__pid_programs = pid_programs
+
     def get_prog_pmt(self, pid: int) -> PMT:
         if pid in self.__pmt_pids:
             return self.__pmt.get(str(pid), None)
@@ -65,6 +96,7 @@ class Programs:
             self.__stream_pids |= set([stream['elementary_pid'] for stream in pmt.streams])
             self.__other_pids |= set([desc['descriptor_data']['ca_pid'] for desc in pmt.descriptors if desc['descriptor_tag'] == 9])
             self.__pcr_pids.add(pmt.pcr_pid)
+            self.__index_programs()
 
     def update_prog_pmt(self, pid: int, pmt: PMT):
         if pid in self.__pmt_pids:
@@ -93,3 +125,71 @@ class Programs:
     def sdt(self, sdt: SDT):
         self.__sdt = sdt
 
+    def get_service(self, program_number: int) -> dict:
+        """
+        :return: {'service_type', 'service_provider_name', 'service_name'} of the program from SDT or None
+        """
+        return self.__services.get(program_number)
+
+    def update_services(self, sdt: SDT) -> bool:
+        """
+        Update services of programs listed in PAT from SDT actual
+
+        :param sdt: SDT object with all services
+        :return: True if any service of the programs is added or changed
+        """
+        if self.__pat is None or sdt.table_id != 0x42:
+            return False
+        version, sections = self.__sdt_sections
+        if version != sdt.ver_num:
+            version, sections = self.__sdt_sections = (sdt.ver_num, set())
+        sections.add(sdt.sec_num)
+        self.__sdt_cycle = len(sections) > sdt.last_sec_num
+        program_numbers = set(prog['program_number'] for prog in self.__pat.prog_nums)
+        changed = False
+        for service in sdt.services:
+            if service['service_id'] not in program_numbers:
+                continue
+            for descriptor in service['descriptors']:
+                if descriptor['descriptor_tag'] == 72:  # service_descriptor
+                    if self.__services.get(service['service_id']) != descriptor['descriptor_data']:
+                        self.__services[service['service_id']] = descriptor['descriptor_data']
+                        changed = True
+                    break
+        return changed
+
+    def get_state(self) -> dict:
+        """
+        :return: State of the object for checkpoint (see ts_checkpoint). Tables are not copied: they are replaced
+                 on updates, not modified
+        """
+        return {'pat': self.__pat, 'pmt': dict(self.__pmt), 'pmt_pids': set(self.__pmt_pids),
+                'net_pids': set(self.__net_pids), 'pcr_pids': set(self.__pcr_pids),
+                'stream_pids': set(self.__stream_pids), 'other_pids': set(self.__other_pids), 'cat': self.__cat,
+                'sdt': self.__sdt, 'services': dict(self.__services), 'sdt_cycle': self.__sdt_cycle}
+
+    def set_state(self, state: dict):
+        """
+        :param state: State returned by get_state
+        """
+        self.__pat = state['pat']
+        self.__pmt = dict(state['pmt'])
+        self.__pmt_pids = set(state['pmt_pids'])
+        self.__net_pids = set(state['net_pids'])
+        self.__pcr_pids = set(state['pcr_pids'])
+        self.__stream_pids = set(state['stream_pids'])
+        self.__other_pids = set(state['other_pids'])
+        self.__cat = state['cat']
+        self.__sdt = state['sdt']
+        self.__services = dict(state['services'])
+        self.__sdt_cycle = state['sdt_cycle']
+        self.__index_programs()
+
+    def has_all_services(self) -> bool:
+        """
+        :return: True if services of all programs listed in PAT are known or all sections of SDT actual have been
+                 received (programs without service in SDT are not waited for)
+        """
+        return self.__pat is not None and (self.__sdt_cycle or all(
+            prog['program_number'] in self.__services for prog in self.__pat.prog_nums if prog['program_number'] != 0))
+
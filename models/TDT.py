@@ -0,0 +1,11 @@
+class TDT:
+    """
+    Time and Date Table (TDT, table_id 0x70) carries UTC time and date. Time Offset Table (TOT, table_id 0x73)
+    carries UTC time and date and local time offset descriptors
+    """
+    def __init__(self):
+        self.table_id = 0               # Table ID
+        self.utc_time = None            # UTC time and date (datetime)
+        self.descriptors = []           # TOT descriptors
+        self.crc32 = None               # 32-bit CRC (TOT only)
+        self.crc32_ok = True            # Status of CRC verification (TOT only)
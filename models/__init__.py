@@ -1 +1 @@
-__all__ = ['TSPacket', 'PAT', 'PMT', 'Programs', 'CAT', 'SDT', 'PES', 'BAT']
+__all__ = ['TSPacket', 'PAT', 'PMT', 'Programs', 'CAT', 'SDT', 'PES', 'BAT', 'NIT', 'EIT', 'TDT']
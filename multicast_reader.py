@@ -1,12 +1,53 @@
 import argparse
-import socket
-import datetime
-from ts.ts_reader import TSReader
-from ts.ts_stat import Statistics
-from views.viever import Viewer
 
 
-def multicast_reader():
+def multicast_reader(mcast_grp: str, mcast_port=1234, mon_time_s=180, wait_s=15, stat_interval_s=1,
+                     skip_cc_err_ms=500, write_to_file=False, bufsize=1358, interface=None, profile=False,
+                     metrics_port=None, store_dir=None, alarms=None, capture_dir=None,
+                     capture_pre_s=10, capture_post_s=5, record=None, record_format='ts', rotate_mb=None,
+                     rotate_s=None, checkpoint=None) -> dict:
+    """
+    Subscribe to multicast stream and monitor its parameters according to ETSI TR 101 290
+
+    :param mcast_grp: Multicast group IP address
+    :param mcast_port: Multicast port
+    :param mon_time_s: Monitoring time in seconds
+    :param wait_s: Time to wait multicast in seconds
+    :param stat_interval_s: Statistics output interval in seconds
+    :param skip_cc_err_ms: Skipping CC errors for first milliseconds
+    :param write_to_file: If True received stream is written to <mcast_grp>.ts file (the same as record=mcast_grp)
+    :param bufsize: Receive buffer size
+    :param interface: IP address of interface to join multicast group on. Default is the address of host name
+    :param profile: If True hot-path profiling counters are collected and added to statistics (see ts_profiler)
+    :param metrics_port: If set, live counters are served for Prometheus on http://<host>:<metrics_port>/metrics
+    :param store_dir: If set, interval statistics are appended into time-series store in this directory
+    :param alarms: If set, alarm rules are loaded from this JSON file ('default' for default rules, see ts_alarm)
+    :param capture_dir: If set, stream around errors (raised alarms if alarms are set) is captured into TS-files in
+                        this directory (see ts_capture)
+    :param capture_pre_s: Seconds of stream captured before error
+    :param capture_post_s: Seconds of stream captured after error
+    :param record: If set, received stream is recorded into files with this path prefix by background thread (see
+                   ts_recorder)
+    :param record_format: Recording format: 'ts' or 'pcap' (original datagrams with arrival timestamps)
+    :param rotate_mb: Start new recording file when file size reaches this number of MB
+    :param rotate_s: Start new recording file after this number of seconds
+    :param checkpoint: Checkpoint file path. Analyzer state is restored from it on start (counters and PSI/SI tables
+                       are known at once, no CC errors are caused by the restart) and saved periodically and on stop
+                       (see ts_checkpoint)
+    :return: Final statistics or None if no multicast found
+    """
+    import socket
+    import sys
+    import datetime
+    from ts.ts_reader import TSReader
+    from ts.ts_stat import Statistics
+    from ts.ts_profiler import Profiler
+    from ts.ts_pes import PesTracker
+    from ts.ts_es import EsScanner
+    from ts.ts_freeze import FreezeDetector
+    from ts.ts_rtp import RtpLayer
+    from views.viever import Viewer
+
     # Create the socket
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -16,16 +57,26 @@ def multicast_reader():
     #sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFSIZE)
     print('Socket RCVBUF={}'.format(sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)))
 
-    # Bind to the server address
-    host = socket.gethostbyname(socket.gethostname())
-    sock.bind((host, MCAST_PORT))
+    # Bind to the server address. Linux delivers multicast only to sockets bound to the group (or any) address
+    host = interface if interface is not None else socket.gethostbyname(socket.gethostname())
+    sock.bind((host if sys.platform == 'win32' else mcast_grp, mcast_port))
 
     # Create TSReader object
     viewer = Viewer()
-    stats = Statistics(pcap=True, interval_s=STAT_INTERVAL_S, skip_cc_err_for_first_ms=SKIP_CC_ERR_FOR_FIRST_MS)
+    ts_reader = TSReader(profiler=Profiler() if profile else None, rtp=RtpLayer(),
+                         pes_tracker=PesTracker(), es_scanner=EsScanner(),
+                         freeze_detector=FreezeDetector())
+    stats = Statistics(pcap=True, interval_s=stat_interval_s, skip_cc_err_for_first_ms=skip_cc_err_ms,
+                       anomalies=ts_reader.anomalies, profiler=ts_reader.profiler)
+    stats.add_report_section('rtp', ts_reader.rtp.report, ts_reader.rtp.get_totals)
+    stats.add_report_section('pes', ts_reader.pes_tracker.report, ts_reader.pes_tracker.get_totals)
+    stats.add_report_section('es', ts_reader.es_scanner.report, ts_reader.es_scanner.get_totals)
+    stats.add_report_section('freeze', ts_reader.freeze_detector.report, ts_reader.freeze_detector.get_totals)
+    stats.add_report_section('si', ts_reader.si.report, ts_reader.si.get_totals, checkpointed=True)
+    stats.known_pids = ts_reader.known_pids
     stats.onStatReady += viewer.print_stat_result
     stats.onFinalStatReady += viewer.print_final_stat_result
-    ts_reader = TSReader()
+    ts_reader.onDatagramReceived += stats.update_datagram
     ts_reader.onPacketDecoded += stats.update_stat
     ts_reader.onPatReceived += stats.update_programs_info
     ts_reader.onPmtReceived += stats.update_programs_info
@@ -35,15 +86,67 @@ def multicast_reader():
     # ts_reader.onBatReceived += stats.update_programs_info
     # ts_reader.onNitReceived += stats.update_programs_info
 
-    # Prepare write to ts file
-    if WRITE_TO_FILE:
-        out_ts = open(MCAST_GRP + '.ts', 'wb')
+    # Evaluate alarm rules on interval deltas (alarm events are added to interval reports)
+    alarm_engine = None
+    if alarms is not None:
+        from ts.ts_alarm import AlarmEngine, load_rules
+        alarm_engine = AlarmEngine(load_rules(alarms))
+        alarm_engine.add_source('{}:{}'.format(mcast_grp, mcast_port), stats)
+
+    # Keep the last datagrams in memory and capture them around errors
+    capture = None
+    if capture_dir is not None:
+        from storage.ts_capture import CaptureRing
+        capture = CaptureRing(capture_dir, name='{}_{}'.format(mcast_grp, mcast_port), pre_s=capture_pre_s,
+                              post_s=capture_post_s)
+        if alarm_engine is not None:
+            alarm_engine.onAlarm += capture.on_alarm
+        else:
+            stats.onIntervalReady += capture.on_interval
+        stats.add_report_section('capture', capture.report, capture.get_totals)
+
+    # Append interval statistics into time-series store
+    store = None
+    if store_dir is not None:
+        from storage.ts_store import TimeSeriesStore
+        store = TimeSeriesStore(store_dir)
+        stats.onIntervalReady += store.on_interval('{}:{}'.format(mcast_grp, mcast_port))
+        store.start()
+
+    # Start metrics endpoint (scrapes read statistics snapshot only)
+    exporter = None
+    if metrics_port is not None:
+        from views.metrics_exporter import MetricsExporter
+        exporter = MetricsExporter(port=metrics_port)
+        exporter.add_source('{}:{}'.format(mcast_grp, mcast_port), stats, sock)
+        exporter.start()
+
+    # Record stream by background thread (datagrams are dropped and counted if disk is slower than the stream)
+    recorder = None
+    if write_to_file and record is None:
+        record = mcast_grp
+    if record is not None:
+        from storage.ts_recorder import StreamRecorder
+        recorder = StreamRecorder(record, fmt=record_format, rotate_mb=rotate_mb, rotate_s=rotate_s,
+                                  group=(mcast_grp, mcast_port))
+        stats.add_report_section('recorder', recorder.report, recorder.get_totals)
+        recorder.start()
+
+    # Restore analyzer state saved by previous run
+    checkpointer = None
+    if checkpoint is not None:
+        from storage.ts_checkpoint import Checkpointer
+        checkpointer = Checkpointer(checkpoint)
+        checkpointer.add('reader', ts_reader)
+        checkpointer.add('stats', stats)
+        checkpointer.restore(live=True)
+        checkpointer.start()
 
     # Tell the operating system to add the socket to the multicast group
     # on HOST interfaces.
-    mreq = socket.inet_aton(MCAST_GRP) + socket.inet_aton(host)
+    mreq = socket.inet_aton(mcast_grp) + socket.inet_aton(host)
     stats.monitoring_start_dt = datetime.datetime.now()
-    sock.settimeout(TIME_TO_WAIT_MULTICAST_S)
+    sock.settimeout(wait_s)
     sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
 
     print('START MONITORING: {}'.format(stats.monitoring_start_dt))
@@ -53,66 +156,110 @@ def multicast_reader():
     # Receive/respond loop
     try:
         while True:
-            data = sock.recv(BUFSIZE)
+            data = sock.recv(bufsize)
             is_multicast_present = True
-            #data, address = sock.recvfrom(BUFSIZE)
+            #data, address = sock.recvfrom(bufsize)
             dt = datetime.datetime.now()
             if first_packet:
                 first_packet = False
                 print('JOIN TIME: {}s'.format((dt - stats.monitoring_start_dt).total_seconds()))
-            if (dt - stats.monitoring_start_dt).total_seconds() > MOMITORING_TIME_S:
+            if (dt - stats.monitoring_start_dt).total_seconds() > mon_time_s:
                 break
             #print('{} - {}'.format(dt, data.hex()))
+            if capture is not None:
+                capture.push(data, dt)
             ts_reader.read(data, dt=dt)
-            if WRITE_TO_FILE:
-                out_ts.write(data)
+            if recorder is not None:
+                recorder.write(data, dt)
+            if checkpointer is not None:
+                checkpointer.poll()
     except socket.timeout:
         pass
 
     stats.monitoring_end_dt = datetime.datetime.now()
+    if checkpointer is not None:
+        checkpointer.close(save=is_multicast_present)
+    if capture is not None:
+        capture.close()
+    if recorder is not None:
+        recorder.close()
     stat = stats.get_stat()
     print('\nSTOP MONITORING: {}\n'.format(stats.monitoring_end_dt))
     if is_multicast_present:
-        if stats.pat_received_dt is not None:
-            viewer.print_pat(stats.programs.pat, stats.pat_received_dt)
-        if stats.pmt_received_dt is not None:
-            for pid in stats.programs.get_pmt_pids():
-                viewer.print_pmt(stats.programs.get_prog_pmt(pid), stats.pmt_received_dt)
-        if stats.sdt_received_dt is not None:
-            viewer.print_sdt(stats.programs.sdt, stats.sdt_received_dt)
-        if stats.cat_received_dt is not None:
-            viewer.print_cat(stats.programs.cat, stats.cat_received_dt)
-        viewer.print_stat(stat, stats.programs, ts_reader.known_pids)
+        viewer.print_summary(stats, stat, ts_reader.known_pids)
     else:
+        stat = None
         print('NO MULTICAST FOUND!!!')
 
-    # Close write to file
-    if WRITE_TO_FILE:
-        out_ts.close()
+    if exporter is not None:
+        exporter.stop()
+    if store is not None:
+        store.close()
+    sock.close()
+    return stat
 
 
-if __name__ == "__main__":
-    """Subscribe to multicast stream and monitor its parameters according to ETSI TR 101 290"""
-    parser = argparse.ArgumentParser(description='Subscribe to multicast stream and monitor its paramiters '
-                                                 + 'according to ETSI TR 101 290')
+def add_arguments(parser: argparse.ArgumentParser):
+    """
+    Add command line arguments of multicast_reader to the parser
+
+    :param parser: ArgumentParser object (or subcommand parser)
+    """
     parser.add_argument('-i', '--ipaddress', nargs='?', required=True, help='multicast ip address')
     parser.add_argument('-p', '--port', nargs='?', type=int, default=1234, help='multicast port')
     parser.add_argument('-w', '--wait_s', nargs='?', type=int, default=15, help='time to wait multicast in seconds')
     parser.add_argument('-t', '--mon_time_s', nargs='?', type=int, default=180, help='monitoring time in seconds')
     parser.add_argument('-s', '--stat_int_s', nargs='?', type=int, default=1,
                         help='statistics output interval in seconds')
+    parser.add_argument('-P', '--profile', action='store_true',
+                        help='collect hot-path profiling counters and add them to statistics')
     parser.add_argument('-e', '--skip_cc_err_ms', nargs='?', type=int, default=500,
                         help='skipping CC errors for first milliseconds')
-    args = vars(parser.parse_args())
-
-    MCAST_GRP = args['ipaddress']
-    MCAST_PORT = args['port']
-    # RECV_BUFSIZE = 16384
-    BUFSIZE = 1358
-    MOMITORING_TIME_S = args['mon_time_s']
-    TIME_TO_WAIT_MULTICAST_S = 15
-    STAT_INTERVAL_S = args['stat_int_s']
-    SKIP_CC_ERR_FOR_FIRST_MS = args['skip_cc_err_ms']
-    WRITE_TO_FILE = False
-
-    multicast_reader()
+    parser.add_argument('-n', '--interface', nargs='?', default=None,
+                        help='ip address of interface to join multicast group on (default: host address)')
+    parser.add_argument('-m', '--metrics_port', nargs='?', type=int, default=None,
+                        help='serve live counters for Prometheus on this HTTP port')
+    parser.add_argument('-o', '--store_dir', nargs='?', default=None,
+                        help='append interval statistics into time-series store in this directory')
+    parser.add_argument('-a', '--alarms', nargs='?', default=None,
+                        help='evaluate alarm rules from this JSON file (\'default\' for default rules)')
+    parser.add_argument('-c', '--capture_dir', nargs='?', default=None,
+                        help='capture stream around errors (raised alarms if -a is set) into this directory')
+    parser.add_argument('--capture_pre_s', nargs='?', type=int, default=10,
+                        help='seconds of stream captured before error')
+    parser.add_argument('--capture_post_s', nargs='?', type=int, default=5,
+                        help='seconds of stream captured after error')
+    parser.add_argument('-r', '--record', nargs='?', default=None,
+                        help='record stream into files with this path prefix')
+    parser.add_argument('--record_format', choices=('ts', 'pcap'), default='ts',
+                        help='recording format (pcap keeps datagram timestamps for pcap subcommand)')
+    parser.add_argument('--rotate_mb', nargs='?', type=float, default=None,
+                        help='start new recording file when file size reaches this number of MB')
+    parser.add_argument('--rotate_s', nargs='?', type=int, default=None,
+                        help='start new recording file after this number of seconds')
+    parser.add_argument('--checkpoint', nargs='?', default=None,
+                        help='checkpoint file: restore analyzer state on start, save it periodically and on stop')
+
+
+def run(args: dict):
+    """
+    Run multicast_reader with parsed command line arguments
+
+    :param args: Dictionary of parsed arguments (see add_arguments)
+    """
+    return multicast_reader(args['ipaddress'], mcast_port=args['port'], mon_time_s=args['mon_time_s'],
+                            wait_s=args['wait_s'], stat_interval_s=args['stat_int_s'],
+                            skip_cc_err_ms=args['skip_cc_err_ms'], interface=args['interface'],
+                            profile=args['profile'], metrics_port=args['metrics_port'],
+                            store_dir=args['store_dir'], alarms=args['alarms'], capture_dir=args['capture_dir'],
+                            capture_pre_s=args['capture_pre_s'], capture_post_s=args['capture_post_s'],
+                            record=args['record'], record_format=args['record_format'], rotate_mb=args['rotate_mb'],
+                            rotate_s=args['rotate_s'], checkpoint=args['checkpoint'])
+
+
+if __name__ == "__main__":
+    """Subscribe to multicast stream and monitor its parameters according to ETSI TR 101 290"""
+    parser = argparse.ArgumentParser(description='Subscribe to multicast stream and monitor its paramiters '
+                                                 + 'according to ETSI TR 101 290')
+    add_arguments(parser)
+    run(vars(parser.parse_args()))
@@ -1,59 +1,134 @@
-import struct
-import datetime
-from ts.ts_reader import TSReader
-from ts.ts_stat import Statistics
-from views.viever import Viewer
-
-
-#source_file = r'c:\Users\vitaliy_ko\PycharmProjects\iptv\samples\setanta2.pcap'
-source_file = input('Please enter full path to pcap-file: ')
-
-# out = open('test.ts', 'wb')
-
-with open(source_file, 'rb') as f:
-    f.read(24)  # read pcap global header
-    viewer = Viewer()
-    stats = Statistics(pcap=True, interval_s=10)
-    stats.onStatReady += viewer.print_stat_result
-    stats.onFinalStatReady += viewer.print_final_stat_result
-    ts_reader = TSReader()
-    ts_reader.onPacketDecoded += stats.update_stat
-    ts_reader.onPatReceived += stats.update_programs_info
-    ts_reader.onPmtReceived += stats.update_programs_info
-    ts_reader.onCatReceived += stats.update_programs_info
-    ts_reader.onProgramSdtReceived += stats.update_programs_info
-    #ts_reader.onSdtReceived += stats.show_table_data
-    #ts_reader.onBatReceived += stats.show_table_data
-    #ts_reader.onNitReceived += stats.show_table_data
-
-    while True:
-        # packet_header
-        b = f.read(8)  # time sec usec
-        if b == b'':
-            break
-        sec, usec = struct.unpack('=LL', b)
-        dt = datetime.datetime.fromtimestamp(sec) + datetime.timedelta(microseconds=usec)
-        plen, empty = struct.unpack('=LL', f.read(8))
-        data = f.read(plen)
-        # 14 (ethernet header) + 10 (IP header - protocol byte)
-        if int(data[23]) == 17:  # 17 UDP
-            # + 10 (rest of IP header) + 8 (UDP header)
-            data = data[42:]
-            # print('{} - {}'.format(dt, data.hex()))
-            # ts_reader.read(data, dt=dt, parse_SDT=True, parse_BAT=True)
-            ts_reader.read(data, dt=dt)
-           #  out.write(data)
-
-    stat = stats.get_stat()
-    if stats.pat_received_dt is not None:
-        viewer.print_pat(stats.programs.pat, stats.pat_received_dt)
-    if stats.pmt_received_dt is not None:
-        for pid in stats.programs.get_pmt_pids():
-            viewer.print_pmt(stats.programs.get_prog_pmt(pid), stats.pmt_received_dt)
-    if stats.sdt_received_dt is not None:
-        viewer.print_sdt(stats.programs.sdt, stats.sdt_received_dt)
-    if stats.cat_received_dt is not None:
-        viewer.print_cat(stats.programs.cat, stats.cat_received_dt)
-    viewer.print_stat(stat, stats.programs, ts_reader.known_pids)
-
-# out.close()
+import argparse
+
+
+def pcap_reader(source_file: str, stat_interval_s=10, profile=False, alarms=None, checkpoint=None) -> dict:
+    """
+    Analyze multicast IPTV stream dumped into Wireshark pcap-format
+
+    :param source_file: Full path to pcap-file
+    :param stat_interval_s: Statistics output interval in seconds (based on packets timestamps)
+    :param profile: If True hot-path profiling counters are collected and added to statistics (see ts_profiler)
+    :param alarms: If set, alarm rules are loaded from this JSON file ('default' for default rules, see ts_alarm)
+    :param checkpoint: Checkpoint file path. Analyzer state and file offset are saved periodically, so interrupted
+                       analysis resumes at the saved offset (see ts_checkpoint)
+    :return: Final statistics
+    """
+    import struct
+    import datetime
+    from ts.ts_reader import TSReader
+    from ts.ts_stat import Statistics
+    from ts.ts_profiler import Profiler
+    from ts.ts_pes import PesTracker
+    from ts.ts_es import EsScanner
+    from ts.ts_freeze import FreezeDetector
+    from ts.ts_rtp import RtpLayer
+    from views.viever import Viewer
+
+    # out = open('test.ts', 'wb')
+
+    with open(source_file, 'rb') as f:
+        f.read(24)  # read pcap global header
+        viewer = Viewer()
+        ts_reader = TSReader(profiler=Profiler() if profile else None, rtp=RtpLayer(),
+                             pes_tracker=PesTracker(), es_scanner=EsScanner(),
+                             freeze_detector=FreezeDetector())
+        stats = Statistics(pcap=True, interval_s=stat_interval_s, anomalies=ts_reader.anomalies,
+                           profiler=ts_reader.profiler)
+        stats.add_report_section('rtp', ts_reader.rtp.report, ts_reader.rtp.get_totals)
+        stats.add_report_section('pes', ts_reader.pes_tracker.report, ts_reader.pes_tracker.get_totals)
+        stats.add_report_section('es', ts_reader.es_scanner.report, ts_reader.es_scanner.get_totals)
+        stats.add_report_section('freeze', ts_reader.freeze_detector.report, ts_reader.freeze_detector.get_totals)
+        stats.add_report_section('si', ts_reader.si.report, ts_reader.si.get_totals, checkpointed=True)
+        stats.known_pids = ts_reader.known_pids
+        if alarms is not None:
+            from ts.ts_alarm import AlarmEngine, load_rules
+            AlarmEngine(load_rules(alarms)).add_source(source_file, stats)
+        stats.onStatReady += viewer.print_stat_result
+        stats.onFinalStatReady += viewer.print_final_stat_result
+        ts_reader.onDatagramReceived += stats.update_datagram
+        ts_reader.onPacketDecoded += stats.update_stat
+        ts_reader.onPatReceived += stats.update_programs_info
+        ts_reader.onPmtReceived += stats.update_programs_info
+        ts_reader.onCatReceived += stats.update_programs_info
+        ts_reader.onProgramSdtReceived += stats.update_programs_info
+        #ts_reader.onSdtReceived += stats.show_table_data
+        #ts_reader.onBatReceived += stats.show_table_data
+        #ts_reader.onNitReceived += stats.show_table_data
+        checkpointer = None
+        if checkpoint is not None:
+            from storage.ts_checkpoint import Checkpointer
+            checkpointer = Checkpointer(checkpoint)
+            checkpointer.add('reader', ts_reader)
+            checkpointer.add('stats', stats)
+            extra = checkpointer.restore()
+            if extra is not None:
+                f.seek(extra['offset'])
+            checkpointer.start()
+
+        while True:
+            # packet_header
+            b = f.read(8)  # time sec usec
+            if b == b'':
+                break
+            sec, usec = struct.unpack('=LL', b)
+            dt = datetime.datetime.fromtimestamp(sec) + datetime.timedelta(microseconds=usec)
+            plen, empty = struct.unpack('=LL', f.read(8))
+            data = f.read(plen)
+            # 14 (ethernet header) + 10 (IP header - protocol byte)
+            if int(data[23]) == 17:  # 17 UDP
+                # + 10 (rest of IP header) + 8 (UDP header)
+                data = data[42:]
+                # print('{} - {}'.format(dt, data.hex()))
+                # ts_reader.read(data, dt=dt, parse_SDT=True, parse_BAT=True)
+                ts_reader.read(data, dt=dt)
+               #  out.write(data)
+            if checkpointer is not None:
+                checkpointer.poll(offset=f.tell())
+
+        if checkpointer is not None:
+            # Analysis is completed
+            checkpointer.close(remove=True)
+        stat = stats.get_stat()
+        viewer.print_summary(stats, stat, ts_reader.known_pids)
+
+    # out.close()
+    return stat
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """
+    Add command line arguments of pcap_reader to the parser
+
+    :param parser: ArgumentParser object (or subcommand parser)
+    """
+    parser.add_argument('source_file', nargs='?', help='full path to pcap-file')
+    parser.add_argument('-s', '--stat_int_s', nargs='?', type=int, default=10,
+                        help='statistics output interval in seconds')
+    parser.add_argument('-P', '--profile', action='store_true',
+                        help='collect hot-path profiling counters and add them to statistics')
+    parser.add_argument('-a', '--alarms', nargs='?', default=None,
+                        help='evaluate alarm rules from this JSON file (\'default\' for default rules)')
+    parser.add_argument('--checkpoint', nargs='?', default=None,
+                        help='checkpoint file: save analyzer state periodically and resume interrupted analysis')
+
+
+def run(args: dict):
+    """
+    Run pcap_reader with parsed command line arguments
+
+    :param args: Dictionary of parsed arguments (see add_arguments)
+    """
+    source_file = args['source_file']
+    if source_file is None:
+        #source_file = r'c:\Users\vitaliy_ko\PycharmProjects\iptv\samples\setanta2.pcap'
+        source_file = input('Please enter full path to pcap-file: ')
+    return pcap_reader(source_file, stat_interval_s=args['stat_int_s'], profile=args['profile'],
+                       alarms=args['alarms'], checkpoint=args['checkpoint'])
+
+
+if __name__ == "__main__":
+    """Analyze multicast IPTV stream dumped into Wireshark pcap-format"""
+    parser = argparse.ArgumentParser(description='Analyze multicast IPTV stream dumped into pcap-file '
+                                                 + 'according to ETSI TR 101 290')
+    add_arguments(parser)
+    run(vars(parser.parse_args()))
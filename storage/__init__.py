@@ -0,0 +1 @@
+__all__ = ['ts_store', 'ts_capture', 'ts_recorder', 'ts_checkpoint']
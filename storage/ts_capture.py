@@ -0,0 +1,311 @@
+"""
+Pre-trigger capture of raw stream around errors. The last datagrams of a group are kept in a preallocated in-memory
+ring (fixed-size slots, no allocation per datagram). When a trigger fires (error counters of stat interval, raised
+alarm or manual trigger) the pre-trigger window and post_s seconds after the trigger are dumped into timestamped
+TS-file by a background writer thread. Ingest never waits on disk: datagrams overwritten before the writer copied them
+are counted as lost instead
+"""
+import array
+import datetime
+import logging
+import os
+import threading
+
+from ts.ts_rtp import rtp_header_length
+
+# Interval delta counters (see Statistics.interval) which trigger capture by default
+TRIGGER_COUNTERS = ('TS_sync_loss', 'Sync_byte_error', 'CC_errors', 'Transport_error', 'PCR_repetition_error',
+                    'PCR_discontinuity_indicator_error')
+BATCH_DATAGRAMS = 512       # Datagrams copied from the ring and written at once
+
+
+class _Capture:
+    """ State of one capture (file being written) """
+    __slots__ = ('path', 'reason', 'trigger_dt', 'end_ts', 'next_seq', 'end_seq', 'file', 'datagrams', 'lost')
+
+    def __init__(self, path: str, reason: str, trigger_dt: datetime.datetime, start_seq: int, end_ts: float):
+        self.path = path
+        self.reason = reason
+        self.trigger_dt = trigger_dt
+        self.end_ts = end_ts            # Datagrams received after this time are not captured
+        self.next_seq = start_seq       # Sequence number of the next datagram to be written
+        self.end_seq = None             # Sequence number after the last captured datagram (None while capturing)
+        self.file = None
+        self.datagrams = 0
+        self.lost = 0
+
+
+class CaptureRing:
+    """
+    Class for keeping the last datagrams of one group in memory and dumping them around triggers. Datagrams are
+    numbered by sequence number; datagram seq is kept in slot seq % slots until it is overwritten
+    """
+    def __init__(self, directory='.', name='capture', pre_s=10, post_s=5, capacity_mb=16, slot_size=1500,
+                 writer=None, trigger_counters=TRIGGER_COUNTERS):
+        """
+        Initialize object
+
+        :param directory: Directory for capture files
+        :param name: Prefix of capture file names (e.g. multicast address:port)
+        :param pre_s: Seconds of stream before trigger written to capture file
+        :param post_s: Seconds of stream after trigger written to capture file
+        :param capacity_mb: Ring size in MB. It bounds memory per group and should hold more than pre_s + post_s
+                            of the stream
+        :param slot_size: Slot size (maximum datagram size). Longer datagrams are truncated
+        :param writer: CaptureWriter shared by several rings. Default is own writer thread
+        :param trigger_counters: Interval delta counters which trigger capture (see on_interval)
+        """
+        self.directory = directory
+        self.name = ''.join(c if c.isalnum() or c in '.-' else '_' for c in name)
+        self.pre_s = pre_s
+        self.post_s = post_s
+        self.trigger_counters = trigger_counters
+        self.__slot_size = slot_size
+        self.__slots = capacity_mb * 1024 * 1024 // slot_size
+        self.__buffer = bytearray(self.__slots * slot_size)
+        self.__view = memoryview(self.__buffer)
+        self.__lengths = array.array('H', bytes(2 * self.__slots))
+        self.__times = array.array('d', bytes(8 * self.__slots))   # POSIX timestamps of datagrams
+        self.__seq = 0                  # Sequence number of the next datagram
+        self.__active = None            # Capture receiving post-trigger datagrams
+        self.__pending = list()         # Captures not completely written (in trigger order)
+        self.__last_interval_dt = None
+        self.__totals = {'triggers': 0, 'captures': 0, 'datagrams': 0, 'lost': 0}
+        self.__counts = dict(self.__totals)
+        self.__files = list()           # Capture files completed since previous report
+        # Guards active and pending captures and counters shared by ingest, trigger (statistics) and writer threads.
+        # It is never held during disk writes
+        self.__lock = threading.Lock()
+        if writer is None:
+            writer = CaptureWriter()
+            writer.start()
+            self.__own_writer = writer
+        else:
+            self.__own_writer = None
+        self.__writer = writer
+        writer.add(self)
+
+    def push(self, data: bytes, dt: datetime.datetime):
+        """
+        Keep datagram in the ring (called for each received datagram)
+
+        :param data: Datagram payload
+        :param dt: Arrival date and time of the datagram
+        """
+        ts = dt.timestamp()
+        if self.__active is not None:
+            with self.__lock:
+                active = self.__active
+                if active is not None and ts > active.end_ts:
+                    active.end_seq = self.__seq
+                    self.__active = None
+        seq = self.__seq
+        index = seq % self.__slots
+        offset = index * self.__slot_size
+        length = min(len(data), self.__slot_size)
+        self.__view[offset:offset + length] = data[:length]
+        self.__lengths[index] = length
+        self.__times[index] = ts
+        self.__seq = seq + 1
+
+    def trigger(self, dt: datetime.datetime, reason: str, start_dt=None) -> bool:
+        """
+        Start capture of pre_s seconds before start_dt and post_s seconds after dt. Triggers received while capturing
+        extend the current capture instead of starting a new one
+
+        :param dt: Date and time of the trigger
+        :param reason: Short trigger description (added to file name)
+        :param start_dt: Date and time the triggering event may have started (e.g. start of stat interval).
+                         Default is dt
+        :return: True if new capture is started
+        """
+        end_ts = dt.timestamp() + self.post_s
+        start_ts = (start_dt if start_dt is not None else dt).timestamp() - self.pre_s
+        file_name = '{}_{}_{}.ts'.format(self.name, dt.strftime('%Y%m%d_%H%M%S_%f'),
+                                         ''.join(c if c.isalnum() else '_' for c in reason))
+        with self.__lock:
+            self.__totals['triggers'] += 1
+            self.__counts['triggers'] += 1
+            if self.__active is not None:
+                self.__active.end_ts = max(self.__active.end_ts, end_ts)
+                return False
+            # Binary search of the first datagram of pre-trigger window among datagrams kept in the ring
+            low, high = max(0, self.__seq - self.__slots + 1), self.__seq
+            if len(self.__pending) > 0:
+                low = max(low, self.__pending[-1].end_seq if self.__pending[-1].end_seq is not None else high)
+            while low < high:
+                middle = (low + high) // 2
+                if self.__times[middle % self.__slots] < start_ts:
+                    low = middle + 1
+                else:
+                    high = middle
+            capture = _Capture(os.path.join(self.directory, file_name), reason, dt, low, end_ts)
+            self.__active = capture
+            self.__pending.append(capture)
+        self.__writer.notify()
+        return True
+
+    def on_interval(self, interval: dict):
+        """
+        Handler of Statistics.onIntervalReady: trigger capture if any of trigger counters is not zero
+
+        :param interval: Interval deltas (see Statistics.interval)
+        """
+        start_dt = self.__last_interval_dt
+        self.__last_interval_dt = interval['dt']
+        counters = [name for name in self.trigger_counters if interval['program'].get(name, 0) > 0]
+        if len(counters) > 0:
+            self.trigger(interval['dt'], counters[0], start_dt=start_dt)
+
+    def on_alarm(self, event: dict):
+        """
+        Handler of AlarmEngine.onAlarm: trigger capture on raised alarms
+
+        :param event: Alarm event (see ts_alarm)
+        """
+        if event['state'] == 'raised' and self.__seq > 0:
+            # Alarm is raised for the last stat interval, so the trigger time is the time of the last datagram
+            start_dt = self.__last_interval_dt
+            dt = datetime.datetime.fromtimestamp(self.__times[(self.__seq - 1) % self.__slots])
+            self.trigger(dt, event['rule'], start_dt=start_dt if start_dt is not None and start_dt < dt else None)
+
+    def flush(self):
+        """ Write datagrams of pending captures (called by writer thread) """
+        while True:
+            with self.__lock:
+                if len(self.__pending) == 0:
+                    return
+                capture = self.__pending[0]
+                done = capture.end_seq is not None
+                end_seq = capture.end_seq if done else self.__seq
+            if capture.file is None:
+                try:
+                    capture.file = open(capture.path, 'wb')
+                except OSError as e:
+                    logging.warning('Capture file {} is not created: {}'.format(capture.path, e))
+                    with self.__lock:
+                        if capture.end_seq is None:
+                            capture.end_seq = end_seq
+                        capture.next_seq = capture.end_seq
+                        self.__pending.pop(0)
+                        if capture is self.__active:
+                            self.__active = None
+                    continue
+            while capture.next_seq < end_seq:
+                self.__write_batch(capture, min(end_seq, capture.next_seq + BATCH_DATAGRAMS))
+            if not done:
+                return
+            capture.file.close()
+            capture.file = None
+            with self.__lock:
+                self.__pending.pop(0)
+                for counts in (self.__totals, self.__counts):
+                    counts['captures'] += 1
+                    counts['datagrams'] += capture.datagrams
+                    counts['lost'] += capture.lost
+                self.__files.append({'file': capture.path, 'trigger_dt': str(capture.trigger_dt),
+                                     'reason': capture.reason, 'datagrams': capture.datagrams,
+                                     'lost': capture.lost})
+            logging.warning('{}: {} captured into {} ({} datagrams, {} lost)'.format(
+                capture.trigger_dt, capture.reason, capture.path, capture.datagrams, capture.lost))
+
+    def __write_batch(self, capture: _Capture, end_seq: int):
+        chunks = list()
+        view = self.__view
+        for seq in range(capture.next_seq, end_seq):
+            offset = (seq % self.__slots) * self.__slot_size
+            data = view[offset:offset + self.__lengths[seq % self.__slots]]
+            header = rtp_header_length(data) if len(data) > 0 and data[0] != 0x47 else 0
+            if header > 0:
+                end = len(data) - data[-1] if data[0] & 0x20 else len(data)
+                data = data[header:end]
+            chunks.append(bytes(data))
+        # Slots overwritten by ingest while (or before) they were copied are dropped
+        first_valid = self.__seq - self.__slots + 1
+        lost = min(max(0, first_valid - capture.next_seq), len(chunks))
+        capture.file.write(b''.join(chunks[lost:]))
+        capture.datagrams += len(chunks) - lost
+        capture.lost += lost
+        capture.next_seq = end_seq
+
+    def close(self):
+        """ Finish active capture, wait until pending captures are written and stop own writer """
+        with self.__lock:
+            if self.__active is not None:
+                self.__active.end_seq = self.__seq
+                self.__active = None
+        self.__writer.remove(self)
+        if self.__own_writer is not None:
+            self.__own_writer.stop()
+
+    def report(self) -> dict:
+        """
+        :return: Capture counters and files completed since previous report (or None if there were no triggers)
+        """
+        with self.__lock:
+            counts, files = self.__counts, self.__files
+            self.__counts = {name: 0 for name in counts}
+            self.__files = list()
+        if counts['triggers'] == 0 and len(files) == 0:
+            return None
+        return dict(counts, files=files)
+
+    def get_totals(self) -> dict:
+        with self.__lock:
+            return dict(self.__totals)
+
+
+class CaptureWriter:
+    """
+    Background thread writing pending captures of one or more rings. One writer may be shared by all monitored
+    groups, so the number of threads does not grow with the number of channels
+    """
+    def __init__(self, poll_s=0.1):
+        """
+        Initialize object
+
+        :param poll_s: Period of writing post-trigger datagrams of active captures
+        """
+        self.poll_s = poll_s
+        self.__rings = list()
+        self.__lock = threading.Lock()          # Held while captures are written
+        self.__wakeup = threading.Event()       # Set by triggers (never blocks ingest on disk writes)
+        self.__running = False
+        self.__thread = None
+
+    def add(self, ring: CaptureRing):
+        with self.__lock:
+            self.__rings = self.__rings + [ring]
+
+    def remove(self, ring: CaptureRing):
+        """ Write pending captures of the ring and remove it """
+        with self.__lock:
+            if ring in self.__rings:
+                ring.flush()
+                self.__rings = [item for item in self.__rings if item is not ring]
+
+    def notify(self):
+        self.__wakeup.set()
+
+    def start(self):
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, name='capture-writer', daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        while self.__running:
+            self.__wakeup.wait(self.poll_s)
+            self.__wakeup.clear()
+            with self.__lock:
+                for ring in self.__rings:
+                    try:
+                        ring.flush()
+                    except OSError as e:
+                        logging.warning('Capture writing error: {}'.format(e))
+
+    def stop(self):
+        self.__running = False
+        self.notify()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
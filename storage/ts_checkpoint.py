@@ -0,0 +1,155 @@
+"""
+Checkpoint of analyzer state. States of registered objects (TSReader, Statistics or any object with get_state and
+set_state methods) are captured periodically on the analysis thread and written by a background thread into one file
+(pickle compressed by zlib, replaced atomically). On start the checkpoint is reloaded: offline analysis resumes at the
+saved file offset, live monitor restarts with its counters and PSI/SI tables known (no warm-up period) and without
+CC errors caused by the restart gap
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+import zlib
+
+CHECKPOINT_VERSION = 3
+
+
+class Checkpointer:
+    """ Class for periodic saving and restoring state of analyzer objects """
+    def __init__(self, path: str, interval_s=60):
+        """
+        Initialize object
+
+        :param path: Checkpoint file path
+        :param interval_s: Interval of saving checkpoint in seconds
+        """
+        self.path = path
+        self.interval_s = interval_s
+        self.__objects = dict()
+        self.__next_ts = time.monotonic() + interval_s
+        self.__pending = None               # Captured state waiting for writing
+        self.__lock = threading.Lock()      # Guards pending state
+        self.__wakeup = threading.Event()
+        self.__running = False
+        self.__thread = None
+        self.__totals = {'saved': 0, 'errors': 0}
+
+    def add(self, name: str, obj):
+        """
+        Register object whose state is saved
+
+        :param name: Unique name of the object in checkpoint
+        :param obj: Object with get_state() and set_state(state, live=False) methods
+        """
+        self.__objects[name] = obj
+
+    def load(self) -> dict:
+        """
+        :return: Checkpoint data ({'objects': {name: state}, 'extra': dict, 'ts': float}) or None if checkpoint does
+                 not exist or can't be read
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logging.warning('Checkpoint {} is not loaded: {}'.format(self.path, e))
+            return None
+        if not isinstance(data, dict) or data.get('version') != CHECKPOINT_VERSION:
+            logging.warning('Checkpoint {} has unsupported version'.format(self.path))
+            return None
+        return data
+
+    def restore(self, live=False) -> dict:
+        """
+        Load checkpoint and set state of registered objects
+
+        :param live: Passed to set_state of the objects: the stream is resumed after a gap (monitor restart)
+        :return: Extra data saved with the checkpoint (see poll) or None if there is no checkpoint
+        """
+        data = self.load()
+        if data is None:
+            return None
+        for name, obj in self.__objects.items():
+            if name in data['objects']:
+                obj.set_state(data['objects'][name], live=live)
+        logging.warning('Analyzer state is restored from checkpoint {} saved at {}'.format(
+            self.path, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(data['ts']))))
+        return data['extra']
+
+    def start(self):
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, name='checkpoint-writer', daemon=True)
+        self.__thread.start()
+
+    def poll(self, force=False, **extra) -> bool:
+        """
+        Capture state of registered objects if checkpoint interval elapsed. Must be called from the analysis thread
+        (between packets), so captured states are consistent. Pickling and writing are done by the writer thread
+
+        :param force: Capture state regardless of the interval
+        :param extra: Extra data saved with the checkpoint (e.g. offset in the file being analyzed)
+        :return: True if state is captured
+        """
+        now = time.monotonic()
+        if not force and now < self.__next_ts:
+            return False
+        self.__next_ts = now + self.interval_s
+        data = {'version': CHECKPOINT_VERSION, 'ts': time.time(), 'extra': extra,
+                'objects': {name: obj.get_state() for name, obj in self.__objects.items()}}
+        with self.__lock:
+            self.__pending = data
+        if self.__thread is not None:
+            self.__wakeup.set()
+        else:
+            self.__save()
+        return True
+
+    def __run(self):
+        while self.__running:
+            self.__wakeup.wait()
+            self.__wakeup.clear()
+            self.__save()
+
+    def __save(self):
+        with self.__lock:
+            data, self.__pending = self.__pending, None
+        if data is None:
+            return
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), 1))
+            # Previous checkpoint stays valid until the new one is completely written
+            os.replace(tmp_path, self.path)
+            self.__totals['saved'] += 1
+        except (OSError, pickle.PicklingError) as e:
+            self.__totals['errors'] += 1
+            logging.warning('Checkpoint {} is not saved: {}'.format(self.path, e))
+
+    def close(self, save=False, remove=False, **extra):
+        """
+        Stop writer thread
+
+        :param save: Capture and write state before stopping
+        :param remove: Remove checkpoint file (e.g. analysis is completed)
+        :param extra: Extra data saved with the final checkpoint
+        """
+        if save:
+            self.poll(force=True, **extra)
+        if self.__thread is not None:
+            self.__running = False
+            self.__wakeup.set()
+            self.__thread.join()
+            self.__thread = None
+        self.__save()
+        if remove:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def get_totals(self) -> dict:
+        return dict(self.__totals)
@@ -0,0 +1,212 @@
+"""
+Asynchronous stream recorder. Received datagrams are put into a bounded queue (never blocking the receive thread) and
+written by a writer thread, which coalesces them into large writes of write_size bytes. Files are rotated by size
+and/or time. TS output contains TS packets only (RTP header is stripped), pcap output keeps original datagrams and
+arrival timestamps with Ethernet/IPv4/UDP headers, so recordings can be re-analyzed by pcap_reader. Datagrams which do
+not fit into the queue or arrive while the file can't be opened are dropped and counted
+"""
+import datetime
+import logging
+import queue
+import struct
+import threading
+
+from ts.ts_rtp import rtp_header_length
+
+FORMATS = ('ts', 'pcap')
+PCAP_HEADER = struct.pack('=LHHlLLL', 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)   # version 2.4, Ethernet link type
+PCAP_RECORD = struct.Struct('=LLLL')        # sec, usec, captured length, original length
+
+
+class StreamRecorder:
+    """ Class for recording stream of one group into TS or pcap files by background thread """
+    def __init__(self, path_prefix: str, fmt='ts', rotate_mb=None, rotate_s=None, queue_size=8192,
+                 write_size=1024 * 1024, group=None):
+        """
+        Initialize object
+
+        :param path_prefix: Path of output file without extension. Rotated files have timestamp of their first
+                            datagram added to the prefix (<prefix>_YYYYmmdd_HHMMSS_ffffff.<fmt>)
+        :param fmt: Output format: 'ts' or 'pcap'
+        :param rotate_mb: Start new file when the file size reaches this number of MB
+        :param rotate_s: Start new file after this number of seconds (by datagram timestamps)
+        :param queue_size: Maximum number of datagrams waiting for writing. Datagrams above are dropped
+        :param write_size: Size of coalesced writes in bytes
+        :param group: (multicast address, port) written into IP/UDP headers of pcap records
+        """
+        if fmt not in FORMATS:
+            raise ValueError('Unknown recording format {}'.format(fmt))
+        self.path_prefix = path_prefix
+        self.fmt = fmt
+        self.rotate_bytes = int(rotate_mb * 1024 * 1024) if rotate_mb is not None else None
+        self.rotate_s = rotate_s
+        self.write_size = write_size
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__frame_header = self.__build_frame_header(*(group if group is not None else ('239.0.0.1', 1234)))
+        self.__file = None
+        self.__file_bytes = 0
+        self.__file_end_ts = None
+        self.__retry_ts = 0.0               # File is not opened again before this time after error
+        self.__error = None                 # Error of opening file while datagrams are not recorded
+        self.__buffer = bytearray()
+        self.__thread = None
+        self.__totals = {'datagrams': 0, 'bytes': 0, 'dropped': 0, 'files': 0, 'write_errors': 0}
+        self.__counts = dict(self.__totals)
+        self.__lock = threading.Lock()      # Guards counters shared by receive and writer threads
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__run, name='stream-recorder', daemon=True)
+        self.__thread.start()
+
+    def write(self, data: bytes, dt: datetime.datetime):
+        """
+        Queue datagram for recording (called for each received datagram). Never blocks
+
+        :param data: Datagram payload
+        :param dt: Arrival date and time of the datagram
+        """
+        try:
+            self.__queue.put_nowait((data, dt))
+        except queue.Full:
+            with self.__lock:
+                self.__totals['dropped'] += 1
+                self.__counts['dropped'] += 1
+
+    def close(self):
+        """ Write queued datagrams and close the file """
+        if self.__thread is not None:
+            self.__queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+
+    def __run(self):
+        while True:
+            try:
+                item = self.__queue.get(timeout=1)
+            except queue.Empty:
+                # Stream is idle: write partially filled buffer
+                self.__flush()
+                continue
+            if item is None:
+                break
+            self.__record(*item)
+        self.__flush()
+        self.__close_file()
+
+    def __record(self, data: bytes, dt: datetime.datetime):
+        ts = dt.timestamp()
+        if ((self.__file is None and ts >= self.__retry_ts)
+                or (self.rotate_bytes is not None and self.__file_bytes >= self.rotate_bytes)
+                or (self.__file_end_ts is not None and ts >= self.__file_end_ts)):
+            self.__flush()
+            self.__open_file(dt)
+        if self.__file is None:
+            # File can't be opened (retried later): datagrams are dropped, not buffered
+            with self.__lock:
+                self.__totals['dropped'] += 1
+                self.__counts['dropped'] += 1
+            return
+        if self.fmt == 'pcap':
+            frame = self.__frame(data)
+            sec = int(ts)
+            self.__buffer += PCAP_RECORD.pack(sec, int((ts - sec) * 1000000), len(frame), len(frame))
+            self.__buffer += frame
+            size = PCAP_RECORD.size + len(frame)
+        else:
+            header = rtp_header_length(data) if len(data) > 0 and data[0] != 0x47 else 0
+            if header > 0:
+                data = data[header:len(data) - data[-1] if data[0] & 0x20 else len(data)]
+            self.__buffer += data
+            size = len(data)
+        self.__file_bytes += size
+        with self.__lock:
+            for counts in (self.__totals, self.__counts):
+                counts['datagrams'] += 1
+                counts['bytes'] += size
+        if len(self.__buffer) >= self.write_size:
+            # Only whole blocks of write_size are written, the rest waits for the next datagrams
+            end = len(self.__buffer) - len(self.__buffer) % self.write_size
+            remainder = self.__buffer[end:]
+            with memoryview(self.__buffer) as view, view[:end] as block:
+                self.__write(block)
+            self.__buffer = remainder
+
+    def __open_file(self, dt: datetime.datetime):
+        self.__close_file()
+        if self.rotate_bytes is None and self.rotate_s is None:
+            path = '{}.{}'.format(self.path_prefix, self.fmt)
+        else:
+            path = '{}_{}.{}'.format(self.path_prefix, dt.strftime('%Y%m%d_%H%M%S_%f'), self.fmt)
+        try:
+            self.__file = open(path, 'wb', buffering=0)
+        except OSError as e:
+            logging.warning('Recording file {} is not created: {}'.format(path, e))
+            self.__retry_ts = dt.timestamp() + 10
+            with self.__lock:
+                self.__totals['write_errors'] += 1
+                self.__counts['write_errors'] += 1
+                self.__error = 'file {} is not created: {}'.format(path, e)
+            return
+        self.__file_bytes = 0
+        self.__file_end_ts = dt.timestamp() + self.rotate_s if self.rotate_s is not None else None
+        with self.__lock:
+            self.__totals['files'] += 1
+            self.__counts['files'] += 1
+            self.__error = None
+        if self.fmt == 'pcap':
+            self.__buffer += PCAP_HEADER
+            self.__file_bytes += len(PCAP_HEADER)
+
+    def __close_file(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __flush(self):
+        if len(self.__buffer) > 0:
+            self.__write(self.__buffer)
+            self.__buffer = bytearray()
+
+    def __write(self, data):
+        if self.__file is None:
+            return
+        try:
+            self.__file.write(data)
+        except OSError as e:
+            with self.__lock:
+                self.__totals['write_errors'] += 1
+                self.__counts['write_errors'] += 1
+            logging.warning('Recording error: {}'.format(e))
+
+    @staticmethod
+    def __build_frame_header(group: str, port: int) -> tuple:
+        dst = bytes(int(x) for x in group.split('.'))
+        # Multicast MAC address 01:00:5E + lower 23 bits of group address
+        eth = bytes([0x01, 0x00, 0x5E, dst[1] & 0x7F, dst[2], dst[3]]) + b'\x02\x00\x00\x00\x00\x01' + b'\x08\x00'
+        return eth, dst, port
+
+    def __frame(self, data: bytes) -> bytes:
+        eth, dst, port = self.__frame_header
+        ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 28 + len(data), 0, 0x4000, 32, 17, 0, b'\x00\x00\x00\x00', dst)
+        checksum = sum(struct.unpack('>10H', ip))
+        checksum = (checksum & 0xFFFF) + (checksum >> 16)
+        checksum = ~((checksum & 0xFFFF) + (checksum >> 16)) & 0xFFFF
+        return b''.join((eth, ip[:10], struct.pack('>H', checksum), ip[12:],
+                         struct.pack('>HHHH', port, port, 8 + len(data), 0), data))
+
+    def report(self) -> dict:
+        """
+        :return: Recording counters of the stat interval: written datagrams and bytes, dropped datagrams (queue
+                 overflow or file can't be opened), created files and write errors, and error of opening file while
+                 datagrams are not recorded (None if recording)
+        """
+        with self.__lock:
+            counts = self.__counts
+            self.__counts = {name: 0 for name in counts}
+            counts['error'] = self.__error
+        counts['queue'] = self.__queue.qsize()
+        return counts
+
+    def get_totals(self) -> dict:
+        with self.__lock:
+            return dict(self.__totals, error=self.__error)
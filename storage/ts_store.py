@@ -0,0 +1,306 @@
+"""
+Columnar on-disk time-series store for interval statistics. Every series (group, PID, metric) is kept in its own
+files of fixed-width binary records, chunked by time, with automatic rollups (1 s -> 1 min -> 1 h). Queries read only
+the chunk files overlapping requested time range through mmap and find range bounds by binary search.
+
+Layout: <root>/<group>/<resolution>/<chunk start>/<series>.bin
+    raw records (resolution 1s):   <dd    timestamp, value
+    rollup records (1m, 1h):       <ddddd timestamp (bucket start), min, max, sum, count
+"""
+import argparse
+import collections
+import datetime
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+
+RAW = struct.Struct('<dd')
+ROLLUP = struct.Struct('<ddddd')
+
+# resolution -> (bucket length in seconds, chunk length in seconds, record format)
+RESOLUTIONS = {
+    '1s': (1, 3600, RAW),
+    '1m': (60, 86400, ROLLUP),
+    '1h': (3600, 30 * 86400, ROLLUP),
+}
+
+
+def series_name(pid: int, metric: str) -> str:
+    """
+    :param pid: PID or -1 for program (all PIDs)
+    :param metric: Metric name ('bitrate' or PidStat counter name)
+    :return: series name used as file name
+    """
+    return '{}.{}'.format('program' if pid == -1 else '0x{:04X}'.format(pid), metric)
+
+
+def group_dir(group: str) -> str:
+    return ''.join(c if c.isalnum() or c in '.-' else '_' for c in group)
+
+
+class _Rollup:
+    """ Accumulator of one rollup bucket """
+    __slots__ = ('start', 'min', 'max', 'sum', 'count')
+
+    def __init__(self, start: float):
+        self.start = start
+        self.min = None
+        self.max = None
+        self.sum = 0.0
+        self.count = 0
+
+    def add(self, vmin: float, vmax: float, vsum: float, count: int):
+        self.min = vmin if self.min is None or vmin < self.min else self.min
+        self.max = vmax if self.max is None or vmax > self.max else self.max
+        self.sum += vsum
+        self.count += count
+
+    def pack(self) -> bytes:
+        return ROLLUP.pack(self.start, self.min, self.max, self.sum, self.count)
+
+
+class TimeSeriesStore:
+    """
+    Class for appending interval statistics and querying time ranges. Bitrates are stored for every interval, raw
+    error counters (deltas) only for intervals where they are not zero, so sparse error series stay small. Rollups
+    account every interval (zeros included), so their min and count are exact. When started, results are appended
+    by a background writer thread, so the statistics thread is never blocked by disk writes
+    """
+    def __init__(self, root: str, max_open_files=256, queue_size=64):
+        """
+        Initialize object
+
+        :param root: Store directory (created if not exists)
+        :param max_open_files: Maximum number of open series files. Least recently written files above are closed
+        :param queue_size: Maximum number of results waiting for writer thread. Results above are dropped
+        """
+        self.root = root
+        self.max_open_files = max_open_files
+        os.makedirs(root, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__files = collections.OrderedDict()    # (group, resolution, series) -> (chunk start, file object), LRU
+        self.__rollups = dict()     # (group, resolution, series) -> _Rollup of current bucket
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__thread = None
+        self.__totals = {'results': 0, 'dropped': 0}
+
+    def start(self):
+        """ Start writer thread appending intervals passed to on_interval handlers """
+        self.__thread = threading.Thread(target=self.__run, name='ts-store-writer', daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                break
+            self.append_interval(*item)
+
+    # Writing
+
+    def __file(self, group: str, resolution: str, series: str, t: float):
+        chunk_s = RESOLUTIONS[resolution][1]
+        chunk = int(t // chunk_s * chunk_s)
+        key = (group, resolution, series)
+        current = self.__files.get(key)
+        if current is not None and current[0] == chunk:
+            self.__files.move_to_end(key)
+            return current[1]
+        if current is not None:
+            del self.__files[key]
+            current[1].close()
+        while len(self.__files) >= self.max_open_files:
+            self.__files.popitem(last=False)[1][1].close()
+        path = os.path.join(self.root, group_dir(group), resolution, str(chunk))
+        os.makedirs(path, exist_ok=True)
+        f = open(os.path.join(path, series + '.bin'), 'ab')
+        self.__files[key] = (chunk, f)
+        return f
+
+    def __roll(self, group: str, resolution: str, series: str, t: float, vmin: float, vmax: float, vsum: float,
+               count: int):
+        """ Add value to the rollup bucket of resolution. Completed bucket is written and rolled up further """
+        bucket_s = RESOLUTIONS[resolution][0]
+        start = t // bucket_s * bucket_s
+        key = (group, resolution, series)
+        rollup = self.__rollups.get(key)
+        if rollup is not None and rollup.start != start:
+            self.__write_rollup(group, resolution, series, rollup)
+            rollup = None
+        if rollup is None:
+            rollup = _Rollup(start)
+            self.__rollups[key] = rollup
+        rollup.add(vmin, vmax, vsum, count)
+
+    def __write_rollup(self, group: str, resolution: str, series: str, rollup: _Rollup):
+        self.__file(group, resolution, series, rollup.start).write(rollup.pack())
+        if resolution == '1m':
+            self.__roll(group, '1h', series, rollup.start, rollup.min, rollup.max, rollup.sum, rollup.count)
+
+    def append(self, group: str, series: str, t: float, value: float, raw=True):
+        """
+        Append one sample. Samples of the series must be appended in time order
+
+        :param group: Group name (e.g. multicast address:port)
+        :param series: Series name (see series_name)
+        :param t: UNIX timestamp
+        :param value: Sample value
+        :param raw: Write raw record. If False, the sample is accounted in rollups only
+        """
+        with self.__lock:
+            if raw:
+                self.__file(group, '1s', series, t).write(RAW.pack(t, value))
+            self.__roll(group, '1m', series, t, value, value, value, 1)
+
+    def append_interval(self, group: str, interval: dict):
+        """
+        Append interval statistics
+
+        :param group: Group name
+        :param interval: Interval deltas of all counters of program and PIDs (see Statistics.interval)
+        """
+        t = interval['dt'].timestamp()
+        for pid, item in [(-1, interval['program'])] + sorted(interval['pids'].items()):
+            self.append(group, series_name(pid, 'bitrate'), t, item['bitrate'])
+            # Zero error counters are not written as raw records, but are accounted in rollups
+            for name, value in item.items():
+                if name not in ('bitrate', 'Packet_count'):
+                    self.append(group, series_name(pid, name), t, value, raw=value != 0)
+        self.flush()
+        self.__totals['results'] += 1
+
+    def on_interval(self, group: str):
+        """
+        :return: handler for Statistics.onIntervalReady event which appends intervals of the group (by writer thread
+                 if started)
+        """
+        def handler(interval):
+            if self.__thread is None:
+                self.append_interval(group, interval)
+                return
+            try:
+                self.__queue.put_nowait((group, interval))
+            except queue.Full:
+                self.__totals['dropped'] += 1
+                logging.warning('Time-series store {}: writer is too slow, interval statistics of {} are dropped'
+                                .format(self.root, group))
+        return handler
+
+    def flush(self):
+        """ Flush written records, so they are visible for queries of other processes """
+        with self.__lock:
+            for chunk, f in self.__files.values():
+                f.flush()
+
+    def close(self):
+        """ Append queued results, write incomplete rollup buckets and close all files """
+        if self.__thread is not None:
+            self.__queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+        with self.__lock:
+            for resolution in ('1m', '1h'):
+                for key in [key for key in self.__rollups if key[1] == resolution]:
+                    self.__write_rollup(key[0], resolution, key[2], self.__rollups.pop(key))
+            for chunk, f in self.__files.values():
+                f.close()
+            self.__files = collections.OrderedDict()
+
+    def get_totals(self) -> dict:
+        """
+        :return: Number of appended and dropped (writer queue is full) interval results
+        """
+        return dict(self.__totals)
+
+    # Reading
+
+    def groups(self) -> list:
+        return sorted(os.listdir(self.root))
+
+    def series(self, group: str, resolution='1s') -> list:
+        """
+        :return: sorted list of series names of the group
+        """
+        names = set()
+        path = os.path.join(self.root, group_dir(group), resolution)
+        if os.path.isdir(path):
+            for chunk in os.listdir(path):
+                names.update(name[:-4] for name in os.listdir(os.path.join(path, chunk)) if name.endswith('.bin'))
+        return sorted(names)
+
+    def query(self, group: str, series: str, start: float, end: float, resolution='1s') -> list:
+        """
+        Read records of time range [start, end)
+
+        :param group: Group name
+        :param series: Series name (see series_name)
+        :param start: UNIX timestamp of range start
+        :param end: UNIX timestamp of range end
+        :param resolution: '1s' - raw samples (t, value), '1m' or '1h' - rollups (t, min, max, sum, count)
+        :return: list of record tuples
+        """
+        bucket_s, chunk_s, record = RESOLUTIONS[resolution]
+        path = os.path.join(self.root, group_dir(group), resolution)
+        if not os.path.isdir(path):
+            return []
+        chunks = sorted(int(chunk) for chunk in os.listdir(path))
+        result = list()
+        for chunk in chunks:
+            if chunk + chunk_s <= start or chunk >= end:
+                continue
+            file_name = os.path.join(path, str(chunk), series + '.bin')
+            if os.path.isfile(file_name):
+                result.extend(self.__read_range(file_name, record, start, end))
+        return result
+
+    @staticmethod
+    def __read_range(file_name: str, record: struct.Struct, start: float, end: float) -> list:
+        size = os.path.getsize(file_name) // record.size * record.size
+        if size == 0:
+            return []
+        with open(file_name, 'rb') as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as m:
+            count = size // record.size
+
+            def lower_bound(t: float) -> int:
+                lo, hi = 0, count
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if struct.unpack_from('<d', m, mid * record.size)[0] < t:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                return lo
+
+            first, last = lower_bound(start), lower_bound(end)
+            return list(record.iter_unpack(m[first * record.size:last * record.size]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query time-series store of interval statistics')
+    parser.add_argument('root', help='store directory')
+    parser.add_argument('group', nargs='?', default=None, help='group name (list groups if omitted)')
+    parser.add_argument('series', nargs='?', default=None, help='series name, e.g. 0x0100.bitrate (list if omitted)')
+    parser.add_argument('-f', '--start', default=None, help='range start (ISO date and time). Default is 1 hour ago')
+    parser.add_argument('-t', '--end', default=None, help='range end (ISO date and time). Default is now')
+    parser.add_argument('-r', '--resolution', choices=list(RESOLUTIONS), default='1s', help='resolution')
+    args = vars(parser.parse_args())
+
+    store = TimeSeriesStore(args['root'])
+    if args['group'] is None:
+        print('\n'.join(store.groups()))
+    elif args['series'] is None:
+        print('\n'.join(store.series(args['group'], args['resolution'])))
+    else:
+        end = datetime.datetime.fromisoformat(args['end']) if args['end'] else datetime.datetime.now()
+        start = (datetime.datetime.fromisoformat(args['start']) if args['start']
+                 else end - datetime.timedelta(hours=1))
+        for rec in store.query(args['group'], args['series'], start.timestamp(), end.timestamp(),
+                               args['resolution']):
+            print(datetime.datetime.fromtimestamp(rec[0]), *rec[1:])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Helpers of analyzer tests: synthetic streams (see bench.ts_generator) are analyzed the way readers do it
+"""
+import json
+from ts.ts_reader import TSReader
+from ts.ts_stat import Statistics
+
+
+def analyze(chunks, datagrams=True, check_timing=True, ts_reader=None, sections=None, **kwargs) -> (list, dict):
+    """
+    Read TS data through TSReader and Statistics wired as in pcap_reader
+
+    :param chunks: Iterable of (datetime, TS data) tuples
+    :param datagrams: If True chunks are network datagrams (inter-arrival and MDI statistics are collected)
+    :param check_timing: If False arrival time is not stream time (SI repetition and PCR timing are not checked, as
+                         in tsfile_reader)
+    :param ts_reader: TSReader object. Default is a new TSReader
+    :param sections: Report sections of Statistics: name -> (function, final function)
+    :param kwargs: Arguments of Statistics (pcap is True by default)
+    :return: (list of interval statistics, final statistics)
+    """
+    ts_reader = ts_reader if ts_reader is not None else TSReader()
+    kwargs.setdefault('pcap', True)
+    stats = Statistics(anomalies=ts_reader.anomalies, **kwargs)
+    ts_reader.si.check_timing = stats.pcr.check_timing = check_timing
+    for name, (func, final_func) in (sections if sections is not None else dict()).items():
+        stats.add_report_section(name, func, final_func)
+    intervals = list()
+    stats.onStatReady += lambda stat_result: intervals.append(json.loads(stat_result))
+    if datagrams:
+        ts_reader.onDatagramReceived += stats.update_datagram
+    ts_reader.onPacketDecoded += stats.update_stat
+    ts_reader.onPatReceived += stats.update_programs_info
+    ts_reader.onPmtReceived += stats.update_programs_info
+    ts_reader.onCatReceived += stats.update_programs_info
+    ts_reader.onProgramSdtReceived += stats.update_programs_info
+    try:
+        for dt, data in chunks:
+            ts_reader.read(data, dt)
+    finally:
+        stat = stats.get_stat()
+    return intervals, stat
@@ -0,0 +1,34 @@
+import datetime
+import unittest
+from bench.ts_generator import TSGenerator, datagrams
+from tests.helpers import analyze
+from ts.ts_bitrate import BitrateMeter
+
+
+class BitrateMeterTest(unittest.TestCase):
+    def test_totals_cover_reported_bins(self):
+        """ Whole-run statistics include bins drained by interval reports """
+        meter = BitrateMeter(psize=188, bin_ms=10, window_s=1)
+        start = datetime.datetime(2026, 1, 1)
+        for i in range(300):
+            dt = start + datetime.timedelta(milliseconds=10 * i)
+            for n in range(1 if i < 100 else 2):
+                meter.add(256, dt)
+            if i % 50 == 49:
+                meter.report()
+        meter.add(256, start + datetime.timedelta(seconds=3))
+        self.assertEqual(meter.report()['pids'][256]['min'], 2 * 150400)
+        totals = meter.get_totals()['pids'][256]
+        self.assertEqual((totals['min'], totals['max'], totals['p99']), (150400, 2 * 150400, 2 * 150400))
+        self.assertEqual(totals['mean'], round(500 * 150400 / 300))
+
+    def test_final_report_has_totals(self):
+        gen = TSGenerator(bitrate=4000000)
+        intervals, stat = analyze(((gen.dt(t), data) for t, data in datagrams(gen.packets(5), 7)), interval_s=1)
+        program = stat['bitrate_stat']['program']
+        self.assertIsNotNone(program['mean'])
+        self.assertAlmostEqual(program['mean'], 4000000, delta=40000)
+
+
+if __name__ == '__main__':
+    unittest.main()
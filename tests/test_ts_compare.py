@@ -0,0 +1,60 @@
+import unittest
+from bench.ts_generator import TSGenerator, datagrams, PACKET_SIZE
+from ts.ts_compare import StreamComparator, StreamSummary
+from ts.ts_reader import TSReader
+from ts.ts_stat import Statistics
+
+
+def corrupt(data: bytes) -> bytes:
+    """ Flip the last payload byte of video packets which do not start PES """
+    packets = list()
+    for pos in range(0, len(data), PACKET_SIZE):
+        packet = data[pos:pos + PACKET_SIZE]
+        if (packet[1] & 0x1F) << 8 | packet[2] == 256 and not packet[1] & 0x40 and packet[3] & 0x10:
+            packet = packet[:-1] + bytes([packet[-1] ^ 0xFF])
+        packets.append(packet)
+    return b''.join(packets)
+
+
+class StreamComparatorTest(unittest.TestCase):
+    def compare(self, corrupt_every=None, **kwargs) -> dict:
+        comparator = StreamComparator()
+        readers = list()
+        for name in ('main', 'backup'):
+            ts_reader = TSReader(summary=StreamSummary(**kwargs))
+            stats = Statistics(pcap=True, anomalies=ts_reader.anomalies)
+            ts_reader.onPacketDecoded += stats.update_stat
+            ts_reader.onPatReceived += stats.update_programs_info
+            ts_reader.onPmtReceived += stats.update_programs_info
+            comparator.add_stream(name, ts_reader, stats, ts_reader.summary)
+            readers.append((ts_reader, stats))
+        gen = TSGenerator(bitrate=4000000)
+        try:
+            for i, (t, data) in enumerate(datagrams(gen.packets(5), 7)):
+                readers[0][0].read(data, gen.dt(t))
+                if corrupt_every is not None and i % corrupt_every == 0:
+                    data = corrupt(data)
+                readers[1][0].read(data, gen.dt(t))
+        finally:
+            for ts_reader, stats in readers:
+                stats.get_stat()
+        comparator.flush()
+        return comparator.get_totals()
+
+    def test_copies_match(self):
+        totals = self.compare()
+        self.assertGreater(totals['matched'], 300)
+        self.assertEqual(totals['diverged'], 0)
+
+    def test_corrupted_payload_diverges(self):
+        """ Corruption after the first packet of PES is found by hash of the whole PES """
+        totals = self.compare(corrupt_every=50)
+        self.assertGreater(totals['diverged'], 0)
+
+    def test_hashed_packets_limit(self):
+        """ Corruption after hash_packets packets of PES is not compared """
+        self.assertEqual(self.compare(corrupt_every=50, hash_packets=1)['diverged'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+from bench.ts_generator import TSGenerator, datagrams
+from tests.helpers import analyze
+from ts.ts_freeze import FreezeDetector
+from ts.ts_reader import TSReader
+
+
+class FreezeDetectorTest(unittest.TestCase):
+    def test_final_report_has_key_frame_sizes(self):
+        """ Key frame sizes of the final report cover intervals drained by interval reports """
+        gen = TSGenerator(bitrate=4000000)
+        freeze_detector = FreezeDetector()
+        intervals, stat = analyze(((gen.dt(t), data) for t, data in datagrams(gen.packets(5), 7)),
+                                  ts_reader=TSReader(freeze_detector=freeze_detector), interval_s=1,
+                                  sections={'freeze': (freeze_detector.report, freeze_detector.get_totals)})
+        self.assertGreater(len(intervals), 3)
+        totals = stat['freeze'][0]
+        self.assertGreater(totals['key_frames'], 3)
+        self.assertIsNotNone(totals['key_frame_bytes'])
+        self.assertGreater(totals['key_frame_bytes']['min'], 0)
+        self.assertFalse(totals['frozen'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from bench.ts_generator import TSGenerator, write_ts
+from tsfile_reader import tsfile_reader
+
+
+class IndexedFileReadTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'clean.ts')
+        write_ts(self.path, TSGenerator(bitrate=4000000).packets(30))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def read(self, **kwargs) -> dict:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return tsfile_reader(self.path, **kwargs)
+
+    def test_pid_filter_keeps_pcr_accuracy(self):
+        """ PCR_AC is measured by file offsets of PCR packets, not by their positions in the filtered stream """
+        stat = self.read(pids={256})
+        pcr = stat['pcr'][0]
+        self.assertEqual(pcr['errors']['PCR_accuracy_error'], 0)
+        self.assertLess(pcr['PCR_AC_ns'], 500)
+
+    def test_range_keeps_si_repetition(self):
+        """ Primed SI sections are timed by stream time, so the first section of the range is not a repetition """
+        stat = self.read(start_s=5, end_s=25)
+        self.assertEqual(stat['si']['errors']['SDT_error'], 0)
+        self.assertEqual(stat['si']['errors']['SI_repetition_error'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import datetime
+import unittest
+from bench.ts_generator import TSGenerator, datagrams, PACKET_SIZE
+from tests.helpers import analyze
+
+
+class PcrMeasurementsTest(unittest.TestCase):
+    def test_clean_stream_has_no_timing_errors(self):
+        """ PCRs inside 7-packet datagrams are timed by their position, so a clean CBR stream has no jitter """
+        gen = TSGenerator(bitrate=4000000)
+        intervals, stat = analyze(((gen.dt(t), data) for t, data in datagrams(gen.packets(45), 7)), interval_s=10)
+        pcr = stat['pcr'][0]
+        self.assertEqual(pcr['errors'], {'PCR_accuracy_error': 0, 'PCR_OJ_error': 0, 'PCR_FO_error': 0,
+                                         'PCR_DR_error': 0})
+        self.assertEqual(pcr['discontinuities'], 0)
+        for interval in intervals[:-1]:
+            self.assertLess(interval['pcr'][0]['PCR_OJ_ns'], 1000)
+            self.assertLess(abs(interval['pcr'][0]['PCR_FO_Hz']), 1)
+
+    def test_file_read_measures_accuracy_only(self):
+        """ Arrival time of a file read faster than real time is not stream time """
+        gen = TSGenerator(bitrate=4000000)
+        packets = b''.join(packet for t, packet in gen.packets(5))
+        chunk = PACKET_SIZE * 7
+        chunks = ((datetime.datetime.now(), packets[pos:pos + chunk]) for pos in range(0, len(packets), chunk))
+        intervals, stat = analyze(chunks, datagrams=False, check_timing=False, pcap=False, interval_s=60)
+        pcr = stat['pcr'][0]
+        self.assertEqual(pcr['discontinuities'], 0)
+        self.assertEqual(sum(pcr['errors'].values()), 0)
+        self.assertIsNone(pcr['PCR_FO_Hz'])
+        self.assertIsNotNone(pcr['PCR_AC_ns'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import datetime
+import struct
+import unittest
+from ts.ts_rtp import RtpLayer
+
+TS_PACKET = b'\x47\x1f\xff\x10' + b'\xff' * 184
+
+
+def rtp(seq: int) -> bytes:
+    """ RTP datagram (MP2T payload type) with one null TS packet """
+    return struct.pack('>BBHLL', 0x80, 33, seq & 0xFFFF, seq * 3600 & 0xFFFFFFFF, 1) + TS_PACKET
+
+
+class RtpLayerTest(unittest.TestCase):
+    def read(self, layer: RtpLayer, seqs):
+        dt = datetime.datetime(2026, 1, 1)
+        for seq in seqs:
+            self.assertEqual(layer.strip(rtp(seq), dt), TS_PACKET)
+
+    def test_late_packet_reported_in_next_interval(self):
+        """ Late packet cancels the loss counted in previous interval without negative interval counters """
+        layer = RtpLayer()
+        self.read(layer, [1, 2, 4, 5])
+        self.assertEqual(layer.report()['lost'], 1)
+        self.read(layer, [3, 6])
+        report = layer.report()
+        self.assertEqual((report['lost'], report['reordered'], report['duplicates']), (0, 1, 0))
+        totals = layer.get_totals()
+        self.assertEqual((totals['lost'], totals['reordered'], totals['packets']), (0, 1, 6))
+
+    def test_reordered_and_duplicate(self):
+        layer = RtpLayer()
+        self.read(layer, [65534, 0, 65535, 65535, 1])
+        report = layer.report()
+        self.assertEqual((report['lost'], report['reordered'], report['duplicates']), (0, 1, 1))
+
+    def test_backward_jump_is_resync(self):
+        """ Restart of sequence numbers is not a reordered packet """
+        layer = RtpLayer()
+        self.read(layer, [60000, 60001, 3, 4, 5])
+        report = layer.report()
+        self.assertEqual((report['lost'], report['reordered'], report['resyncs']), (0, 0, 1))
+
+    def test_forward_jump_is_resync(self):
+        layer = RtpLayer()
+        self.read(layer, [3, 4, 60000, 60001])
+        report = layer.report()
+        self.assertEqual((report['lost'], report['reordered'], report['resyncs']), (0, 0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import datetime
+import tempfile
+import unittest
+from storage.ts_store import TimeSeriesStore, series_name
+
+COUNTERS = ('Packet_count', 'CC_errors', 'PCR_repetition_error')
+
+
+def interval(dt: datetime.datetime, cc_errors=0) -> dict:
+    """ Interval deltas in format of Statistics.interval """
+    item = dict({name: 0 for name in COUNTERS}, Packet_count=2660, CC_errors=cc_errors, bitrate=4000000)
+    return {'dt': dt, 'program': dict(item), 'pids': {256: dict(item)}, 'programs': {}}
+
+
+class TimeSeriesStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.start = datetime.datetime(2026, 1, 1, 12, 0)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def fill(self, store: TimeSeriesStore):
+        handler = store.on_interval('239.1.1.1:1234')
+        for i in range(60):
+            handler(interval(self.start + datetime.timedelta(seconds=i), cc_errors=3 if i == 30 else 0))
+        store.close()
+
+    def check(self, store: TimeSeriesStore):
+        t = self.start.timestamp()
+        raw = store.query('239.1.1.1:1234', series_name(256, 'CC_errors'), t, t + 60)
+        self.assertEqual(raw, [(t + 30, 3.0)])
+        for pid in (-1, 256):
+            rollup = store.query('239.1.1.1:1234', series_name(pid, 'CC_errors'), t, t + 60, resolution='1m')
+            self.assertEqual(rollup, [(t, 0.0, 3.0, 3.0, 60.0)])
+        rollup = store.query('239.1.1.1:1234', series_name(256, 'bitrate'), t, t + 60, resolution='1m')
+        self.assertEqual(rollup, [(t, 4000000.0, 4000000.0, 240000000.0, 60.0)])
+        self.assertEqual(store.get_totals(), {'results': 60, 'dropped': 0})
+
+    def test_clean_intervals_are_rolled_up(self):
+        """ Clean intervals are accounted in rollups, so min and count cover every interval """
+        store = TimeSeriesStore(self.dir.name)
+        self.fill(store)
+        self.check(store)
+
+    def test_writer_thread(self):
+        store = TimeSeriesStore(self.dir.name, queue_size=100)
+        store.start()
+        self.fill(store)
+        self.check(store)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1 +1,3 @@
-__all__ = ['ts_parser', 'ts_reader', 'ts_stat']
+__all__ = ['ts_parser', 'ts_reader', 'ts_stat', 'ts_anomaly', 'ts_profiler', 'ts_pcr', 'ts_bitrate', 'ts_mdi',
+           'ts_rtp', 'ts_pes', 'ts_es', 'ts_freeze', 'ts_section', 'ts_descriptors', 'ts_alarm', 'ts_index',
+           'ts_compare']
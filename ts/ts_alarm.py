@@ -0,0 +1,314 @@
+"""
+Rule-based alarms evaluated on interval deltas of Statistics (see Statistics.interval). Rules are declarative
+(metric, comparison, threshold, scope) and have raise/clear hysteresis: alarm is raised when the condition holds for
+raise_after consecutive intervals and cleared when it does not hold for clear_after consecutive intervals. Events are
+generated on transitions only, so an alarm which stays active is reported once
+"""
+import json
+import logging
+import operator
+import threading
+
+from events.event import Event
+from ts.ts_stat import PidStat
+
+OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '==': operator.eq,
+             '!=': operator.ne}
+# Rule scope -> key of Statistics.interval: whole TS, elementary/other PIDs, programs of PAT
+SCOPES = {'program': 'program', 'pid': 'pids', 'service': 'programs'}
+METRICS = PidStat.COUNTERS + ('bitrate',)
+# stream_type -> kind of elementary stream for PID rules
+STREAM_KINDS = {1: 'video', 2: 'video', 16: 'video', 27: 'video', 36: 'video', 66: 'video',
+                3: 'audio', 4: 'audio', 15: 'audio', 17: 'audio', 129: 'audio', 135: 'audio'}
+SEVERITIES = ('critical', 'major', 'minor', 'warning')
+
+DEFAULT_RULES = [
+    {'name': 'ts_sync_loss', 'metric': 'TS_sync_loss', 'op': '>', 'threshold': 0, 'severity': 'critical',
+     'clear_after': 5},
+    {'name': 'pat_error', 'metric': 'PAT_error', 'op': '>', 'threshold': 0, 'severity': 'critical', 'clear_after': 5},
+    {'name': 'pmt_error', 'metric': 'PMT_error', 'op': '>', 'threshold': 0, 'scope': 'service',
+     'severity': 'critical', 'clear_after': 5},
+    {'name': 'video_cc_errors', 'metric': 'CC_errors', 'op': '>', 'threshold': 0, 'scope': 'pid', 'kind': 'video',
+     'raise_after': 3, 'clear_after': 3},
+    {'name': 'audio_cc_errors', 'metric': 'CC_errors', 'op': '>', 'threshold': 0, 'scope': 'pid', 'kind': 'audio',
+     'raise_after': 3, 'clear_after': 3, 'severity': 'minor'},
+    {'name': 'video_bitrate_low', 'metric': 'bitrate', 'op': '<', 'threshold': 100000, 'scope': 'pid',
+     'kind': 'video', 'raise_after': 3, 'clear_after': 3},
+    {'name': 'pcr_repetition_error', 'metric': 'PCR_repetition_error', 'op': '>', 'threshold': 0, 'scope': 'pid',
+     'raise_after': 3, 'clear_after': 3, 'severity': 'minor'},
+]
+
+
+class AlarmRule:
+    """ Declarative alarm rule: <metric> <op> <threshold> for <raise_after> consecutive intervals """
+    def __init__(self, name: str, metric: str, op='>', threshold=0, scope='program', pids=None, kind=None,
+                 programs=None, raise_after=1, clear_after=1, severity='major'):
+        """
+        Initialize object
+
+        :param name: Rule name (reported in alarm events)
+        :param metric: Interval delta counter (see PidStat.COUNTERS) or 'bitrate' (bit/s)
+        :param op: Comparison operator (see OPERATORS)
+        :param threshold: Value compared with the metric
+        :param scope: 'program' (whole TS), 'pid' (each PID) or 'service' (each program of PAT)
+        :param pids: PIDs the rule is applied to ('pid' scope). Default is all PIDs
+        :param kind: Kind of elementary stream the rule is applied to ('pid' scope): 'video' or 'audio'
+        :param programs: Program numbers the rule is applied to ('service' scope). Default is all programs
+        :param raise_after: Number of consecutive intervals the condition holds before alarm is raised
+        :param clear_after: Number of consecutive intervals the condition does not hold before alarm is cleared
+        :param severity: Alarm severity (see SEVERITIES)
+        """
+        if metric not in METRICS:
+            raise ValueError('Unknown metric {} of alarm rule {}'.format(metric, name))
+        if op not in OPERATORS:
+            raise ValueError('Unknown operator {} of alarm rule {}'.format(op, name))
+        if scope not in SCOPES:
+            raise ValueError('Unknown scope {} of alarm rule {}'.format(scope, name))
+        if severity not in SEVERITIES:
+            raise ValueError('Unknown severity {} of alarm rule {}'.format(severity, name))
+        if raise_after < 1 or clear_after < 1:
+            raise ValueError('raise_after and clear_after of alarm rule {} must be positive'.format(name))
+        self.name = name
+        self.metric = metric
+        self.op = op
+        self.threshold = threshold
+        self.scope = scope
+        self.pids = frozenset(pids) if pids is not None else None
+        self.kind = kind
+        self.programs = frozenset(programs) if programs is not None else None
+        self.raise_after = raise_after
+        self.clear_after = clear_after
+        self.severity = severity
+        self.compare = OPERATORS[op]
+
+    def applies_to(self, target: int, kind: str) -> bool:
+        """
+        :param target: PID ('pid' scope) or program number ('service' scope)
+        :param kind: Kind of elementary stream of the PID or None
+        :return: True if the rule is applied to the target
+        """
+        if self.scope == 'pid':
+            return (self.pids is None or target in self.pids) and (self.kind is None or self.kind == kind)
+        if self.scope == 'service':
+            return self.programs is None or target in self.programs
+        return True
+
+    def __repr__(self):
+        return 'AlarmRule({} {} {} {} for {})'.format(self.name, self.metric, self.op, self.threshold,
+                                                     self.raise_after)
+
+
+def load_rules(path: str) -> list:
+    """
+    Load alarm rules from JSON file (list of AlarmRule arguments)
+
+    :param path: Path to JSON file or 'default' for DEFAULT_RULES
+    :return: list of AlarmRule objects
+    """
+    if path == 'default':
+        rules = DEFAULT_RULES
+    else:
+        with open(path) as f:
+            rules = json.load(f)
+    return [AlarmRule(**rule) for rule in rules]
+
+
+class AlarmEngine:
+    """
+    Class for evaluating alarm rules on interval deltas of one or more monitored groups. Rules are grouped by scope
+    once, so each interval item (TS, PID, program) of each group is visited once per evaluation whatever the number
+    of rules is. All groups are evaluated in one pass by evaluate() (see start() for multi-channel monitoring)
+    """
+    def __init__(self, rules: list):
+        """
+        Initialize object
+
+        :param rules: list of AlarmRule objects
+        """
+        self.rules = tuple(rules)
+        self.__scope_rules = {scope: tuple(rule for rule in self.rules if rule.scope == scope) for scope in SCOPES}
+        self.__sources = dict()     # group -> [Statistics, last evaluated interval, Programs, pid -> stream kind]
+        self.__states = dict()      # (group, rule name, target) -> [active, intervals held, intervals not held]
+        self.__events = dict()      # group -> alarm events not reported yet
+        self.__raised = dict()      # group -> number of raised alarms
+        self.__lock = threading.Lock()
+        self.__timer = None
+        self.__interval_s = None
+
+        # Events
+        self.onAlarm = Event()      # Fired for each raised or cleared alarm with alarm event dictionary
+
+    def add_source(self, group: str, stats, attach=True):
+        """
+        Register monitored group
+
+        :param group: Group name (e.g. multicast address:port)
+        :param stats: Statistics object
+        :param attach: If True the group is evaluated as soon as its interval deltas are ready and 'alarms' section
+                       is added to its interval reports. Otherwise the group is evaluated by evaluate() only
+        """
+        with self.__lock:
+            self.__sources[group] = [stats, None, None, dict()]
+            self.__events[group] = list()
+            self.__raised[group] = 0
+        if attach:
+            stats.onIntervalReady += lambda interval: self.evaluate((group,))
+            stats.add_report_section('alarms', lambda: self.report(group), lambda: self.get_totals(group))
+
+    def remove_source(self, group: str):
+        with self.__lock:
+            self.__sources.pop(group, None)
+            self.__events.pop(group, None)
+            self.__raised.pop(group, None)
+            self.__states = {key: state for key, state in self.__states.items() if key[0] != group}
+
+    def evaluate(self, groups=None) -> list:
+        """
+        Evaluate rules on the last interval deltas of groups. Groups which interval is already evaluated are skipped
+
+        :param groups: Groups to evaluate. Default is all groups
+        :return: list of alarm events (raised and cleared alarms)
+        """
+        events = list()
+        with self.__lock:
+            for group in (groups if groups is not None else list(self.__sources)):
+                source = self.__sources.get(group)
+                if source is None:
+                    continue
+                interval = source[0].interval
+                if interval is None or interval is source[1]:
+                    continue
+                source[1] = interval
+                self.__evaluate_interval(group, source, interval, events)
+        for event in events:
+            self.onAlarm.fire(event=event)
+        return events
+
+    def __evaluate_interval(self, group: str, source: list, interval: dict, events: list):
+        dt = str(interval['dt'])
+        for rule in self.__scope_rules['program']:
+            self.__evaluate_rule(group, rule, None, interval['program'], dt, events)
+        pid_rules = self.__scope_rules['pid']
+        if len(pid_rules) > 0:
+            kinds = self.__stream_kinds(source)
+            for pid, item in interval['pids'].items():
+                kind = kinds.get(pid)
+                for rule in pid_rules:
+                    if rule.applies_to(pid, kind):
+                        self.__evaluate_rule(group, rule, pid, item, dt, events)
+        service_rules = self.__scope_rules['service']
+        for program_number, item in interval['programs'].items():
+            for rule in service_rules:
+                if rule.applies_to(program_number, None):
+                    self.__evaluate_rule(group, rule, program_number, item, dt, events)
+
+    @staticmethod
+    def __stream_kinds(source: list) -> dict:
+        # Statistics.programs is replaced on PSI updates, so kinds are rebuilt on PSI changes only
+        programs = source[0].programs
+        if programs is not source[2]:
+            kinds = dict()
+            for pmt_pid in programs.get_pmt_pids():
+                pmt = programs.get_prog_pmt(pmt_pid)
+                if pmt is not None:
+                    for stream in pmt.streams:
+                        if stream['stream_type'] in STREAM_KINDS:
+                            kinds[stream['elementary_pid']] = STREAM_KINDS[stream['stream_type']]
+            source[2] = programs
+            source[3] = kinds
+        return source[3]
+
+    def __evaluate_rule(self, group: str, rule: AlarmRule, target, item: dict, dt: str, events: list):
+        value = item[rule.metric]
+        key = (group, rule.name, target)
+        state = self.__states.get(key)
+        if rule.compare(value, rule.threshold):
+            if state is None:
+                state = self.__states[key] = [False, 0, 0]
+            state[1] += 1
+            state[2] = 0
+            if not state[0] and state[1] >= rule.raise_after:
+                state[0] = True
+                self.__raised[group] += 1
+                events.append(self.__event(group, rule, target, item, value, dt, 'raised'))
+        elif state is not None:
+            state[1] = 0
+            state[2] += 1
+            if not state[0]:
+                del self.__states[key]
+            elif state[2] >= rule.clear_after:
+                del self.__states[key]
+                events.append(self.__event(group, rule, target, item, value, dt, 'cleared'))
+
+    def __event(self, group: str, rule: AlarmRule, target, item: dict, value, dt: str, state: str) -> dict:
+        event = {'dt': dt, 'group': group, 'rule': rule.name, 'severity': rule.severity, 'scope': rule.scope,
+                 'target': target, 'state': state, 'metric': rule.metric, 'value': value,
+                 'threshold': rule.threshold}
+        if rule.scope == 'service':
+            event['service_name'] = item.get('service_name')
+        self.__events[group].append(event)
+        logging.warning('{}: {} alarm {} {}{} ({}={}, {} {})'.format(
+            dt, group, rule.name, state, self.__target_text(rule.scope, target), rule.metric, value, rule.op,
+            rule.threshold))
+        return event
+
+    @staticmethod
+    def __target_text(scope: str, target) -> str:
+        if scope == 'pid':
+            return ' on PID=0x{:04X}'.format(target)
+        if scope == 'service':
+            return ' on program {}'.format(target)
+        return ''
+
+    def get_active(self, group=None) -> list:
+        """
+        :param group: Group name. Default is all groups
+        :return: list of active alarms {'group', 'rule', 'target'}
+        """
+        with self.__lock:
+            return [{'group': key[0], 'rule': key[1], 'target': key[2]} for key, state in self.__states.items()
+                    if state[0] and (group is None or key[0] == group)]
+
+    def report(self, group: str) -> dict:
+        """
+        :param group: Group name
+        :return: Alarm events of the group since previous report and its active alarms (or None if there are no
+                 events and no active alarms)
+        """
+        active = self.get_active(group)
+        with self.__lock:
+            events = self.__events.get(group, list())
+            self.__events[group] = list()
+        if len(events) == 0 and len(active) == 0:
+            return None
+        return {'events': events, 'active': [{'rule': alarm['rule'], 'target': alarm['target']} for alarm in active]}
+
+    def get_totals(self, group: str) -> dict:
+        """
+        :param group: Group name
+        :return: Number of raised alarms and alarms active at the end of monitoring
+        """
+        return {'raised': self.__raised.get(group, 0),
+                'active': [{'rule': alarm['rule'], 'target': alarm['target']} for alarm in self.get_active(group)]}
+
+    def start(self, interval_s=1):
+        """
+        Start periodic evaluation of all groups in one pass (groups added with attach=False)
+
+        :param interval_s: Evaluation period in seconds (not longer than statistics interval of the groups)
+        """
+        self.__interval_s = interval_s
+        self.__timer = threading.Timer(interval_s, self.__on_timer)
+        self.__timer.daemon = True
+        self.__timer.start()
+
+    def __on_timer(self):
+        self.evaluate()
+        if self.__interval_s is not None:
+            self.start(self.__interval_s)
+
+    def stop(self):
+        self.__interval_s = None
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
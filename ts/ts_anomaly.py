@@ -0,0 +1,97 @@
+import datetime
+import logging
+import threading
+import time
+
+
+class AnomalyCounter:
+    """
+    Class for counting stream anomalies (missing decoders, parsing and CRC errors, etc.) per (PID, kind) in the hot
+    path. Instead of logging each occurrence, counters are summarized and logged once per statistics interval
+    """
+    def __init__(self, log_first=True, max_first_logs=10, max_summary_records=20, min_flush_interval_s=0,
+                 logger=None):
+        """
+        Initialize the object
+
+        :param log_first: If True (by default) the first occurrence of each (PID, kind) is logged in full
+        :param max_first_logs: Maximum number of first occurrences logged in full between two flushes
+        :param max_summary_records: Maximum number of (PID, kind) records in one summary. The rest is collapsed
+        :param min_flush_interval_s: Minimum time between two summaries. Counters are accumulated meanwhile
+        :param logger: Logger to be used. Default is the root logger
+        """
+        self.__log_first = log_first
+        self.__max_first_logs = max_first_logs
+        self.__max_summary_records = max_summary_records
+        self.__min_flush_interval_s = min_flush_interval_s
+        self.__logger = logger if logger is not None else logging.getLogger()
+        self.__lock = threading.Lock()
+        self.__counts = dict()          # (pid, kind) -> occurrences since last flush
+        self.__totals = dict()          # (pid, kind) -> occurrences since start
+        self.__first_logs = 0
+        self.__last_flush = None
+
+    def count(self, pid: int, kind: str, msg=None, *args):
+        """
+        Count anomaly occurrence. Message is formatted only if it has to be logged
+
+        :param pid: PID of TS packet where anomaly occurred (-1 if not related to PID)
+        :param kind: Short anomaly name, e.g. 'no_decoder', 'pmt_parsing_error'
+        :param msg: Message format string logged for the first occurrence
+        :param args: Arguments for message format string
+        """
+        key = (pid, kind)
+        with self.__lock:
+            n = self.__counts.get(key)
+            if n is not None:
+                self.__counts[key] = n + 1
+                return
+            self.__counts[key] = 1
+            if key in self.__totals or not self.__log_first or self.__first_logs >= self.__max_first_logs:
+                return
+            self.__first_logs += 1
+        if msg is None:
+            msg = '{}'
+            args = (kind,)
+        self.__logger.warning('PID=0x{:04X}: {}'.format(pid & 0xFFFF, msg.format(*args)))
+
+    def flush(self, dt=None) -> dict:
+        """
+        Log one summary record for anomalies counted since last flush
+
+        :param dt: Timestamp to be shown in the summary. Default is current date and time
+        :return: dictionary {(pid, kind): count} with counters included into summary or None if summary is postponed
+        """
+        now = time.monotonic()
+        with self.__lock:
+            if (self.__last_flush is not None and self.__min_flush_interval_s > 0
+                    and now - self.__last_flush < self.__min_flush_interval_s):
+                return None
+            counts = self.__counts
+            self.__counts = dict()
+            self.__first_logs = 0
+            self.__last_flush = now
+            for key, n in counts.items():
+                self.__totals[key] = self.__totals.get(key, 0) + n
+        if len(counts) > 0:
+            records = sorted(counts.items(), key=lambda k: k[1], reverse=True)
+            summary = ['PID=0x{:04X} {}={}'.format(pid & 0xFFFF, kind, n)
+                       for (pid, kind), n in records[:self.__max_summary_records]]
+            if len(records) > self.__max_summary_records:
+                summary.append('... {} more (total {})'.format(
+                    len(records) - self.__max_summary_records,
+                    sum(n for key, n in records[self.__max_summary_records:])))
+            self.__logger.warning('{}: anomalies: {}'.format(dt if dt is not None else datetime.datetime.now(),
+                                                              ', '.join(summary)))
+        return counts
+
+    def get_totals(self) -> dict:
+        """
+        :return: dictionary {(pid, kind): count} with all anomalies counted since start (including not flushed)
+        """
+        with self.__lock:
+            totals = dict(self.__totals)
+            for key, n in self.__counts.items():
+                totals[key] = totals.get(key, 0) + n
+        return totals
+
@@ -0,0 +1,178 @@
+import array
+import collections
+import datetime
+import heapq
+import math
+
+
+class BitrateMeter:
+    """
+    Class for measuring per-PID and program bitrate in fine-grained bins (e.g. 10 ms) to catch micro-bursts hidden by
+    interval average. Packet counts of completed bins are kept in preallocated ring buffers covering the sliding
+    window, so per packet cost is one counter increment and reductions run over array slices. Whole-run statistics are
+    kept as histograms of bin counts (number of bins per packet count), updated once per completed bin
+    """
+    def __init__(self, psize=188, bin_ms=10, window_s=10, percentile=99):
+        """
+        Initialize object
+
+        :param psize: TS packet size in bytes
+        :param bin_ms: Bin length in milliseconds
+        :param window_s: Sliding window length in seconds (ring buffer size). Should not be less than stat interval
+        :param percentile: Percentile reported in addition to min/max/mean
+        """
+        self.bin_s = bin_ms / 1000
+        self.bins = max(1, int(round(window_s / self.bin_s)))
+        self.percentile = percentile
+        self.__bin_bitrate = psize * 8 / self.bin_s     # bitrate of one packet per bin
+        self.__rings = dict()           # pid -> array of packet counts per bin (-1 for program)
+        self.__counts = dict()          # pid -> packet count of current bin
+        self.__totals = dict()          # pid -> Counter of packet counts of completed bins since start
+        self.__bin = None               # absolute index of current bin
+        self.__reported_bin = None      # absolute index of the first bin not reported yet
+        self.__first_bin = None         # absolute index of the first bin
+        self.__dt = None                # last datetime (packets of one datagram share it)
+        self.__ring(-1)
+
+    def __ring(self, pid: int):
+        self.__rings[pid] = array.array('I', bytes(4 * self.bins))
+        totals = self.__totals.setdefault(pid, collections.Counter())
+        if self.__bin is not None and self.__bin > self.__first_bin:
+            # PID had no packets in bins completed before it appeared
+            totals[0] += self.__bin - self.__first_bin
+
+    def add(self, pid: int, dt: datetime.datetime):
+        """
+        Count packet
+
+        :param pid: PID of the packet
+        :param dt: Arrival time of the packet
+        """
+        if dt is not self.__dt:
+            self.__dt = dt
+            b = int(dt.timestamp() / self.bin_s)
+            if b != self.__bin:
+                self.__close(b)
+        n = self.__counts.get(pid)
+        self.__counts[pid] = 1 if n is None else n + 1
+
+    def __close(self, b: int):
+        """ Store counts of current bin (and zeros for empty bins up to b) into ring buffers """
+        if self.__bin is None:
+            self.__bin = self.__reported_bin = self.__first_bin = b
+            return
+        if b < self.__bin:      # time went backwards: counts are added to the current bin
+            return
+        for pid, count in self.__counts.items():
+            if pid not in self.__rings:
+                self.__ring(pid)
+        total = sum(self.__counts.values())
+        for pid, ring in self.__rings.items():
+            count = total if pid == -1 else self.__counts.get(pid, 0)
+            ring[self.__bin % self.bins] = count
+            for empty in range(self.__bin + 1, min(b, self.__bin + 1 + self.bins)):
+                ring[empty % self.bins] = 0
+            totals = self.__totals[pid]
+            totals[count] += 1
+            if b > self.__bin + 1:
+                totals[0] += b - self.__bin - 1
+        self.__counts = dict()
+        self.__bin = b
+
+    def __slice(self, ring: array.array, start: int, end: int) -> array.array:
+        """ Counts of absolute bins [start, end) """
+        start = max(start, end - self.bins)
+        i, j = start % self.bins, end % self.bins
+        if end - start == self.bins and i == j:
+            return ring[i:] + ring[:i]
+        return ring[i:j] if i <= j else ring[i:] + ring[:j]
+
+    def __reduce(self, counts: array.array) -> dict:
+        n = len(counts)
+        if n == 0:
+            return {'min': None, 'max': None, 'mean': None, 'p{}'.format(self.percentile): None}
+        k = self.__bin_bitrate
+        rank = max(0, math.ceil(self.percentile / 100 * n) - 1)
+        # Only the bins above (or below) the rank are selected, not the whole interval sorted
+        if rank >= n // 2:
+            value = heapq.nlargest(n - rank, counts)[-1]
+        else:
+            value = heapq.nsmallest(rank + 1, counts)[-1]
+        return {'min': round(min(counts) * k), 'max': round(max(counts) * k), 'mean': round(sum(counts) * k / n),
+                'p{}'.format(self.percentile): round(value * k)}
+
+    def __reduce_totals(self, totals: collections.Counter) -> dict:
+        n = sum(totals.values())
+        if n == 0:
+            return self.__reduce(array.array('I'))
+        k = self.__bin_bitrate
+        rank = max(0, math.ceil(self.percentile / 100 * n) - 1)
+        values = sorted(totals)
+        value = values[-1]
+        for value in values:
+            rank -= totals[value]
+            if rank < 0:
+                break
+        return {'min': round(values[0] * k), 'max': round(values[-1] * k),
+                'mean': round(sum(value * count for value, count in totals.items()) * k / n),
+                'p{}'.format(self.percentile): round(value * k)}
+
+    def get_state(self) -> dict:
+        """
+        :return: State for checkpoint (see ts_checkpoint): ring buffers, counts of current bin, bin indexes and
+                 whole-run histograms
+        """
+        return {'bins': self.bins, 'bin_s': self.bin_s,
+                'rings': {pid: ring.tobytes() for pid, ring in self.__rings.items()}, 'counts': dict(self.__counts),
+                'bin': self.__bin, 'reported_bin': self.__reported_bin, 'first_bin': self.__first_bin,
+                'totals': {pid: dict(totals) for pid, totals in self.__totals.items()}}
+
+    def set_state(self, state: dict, live=False, shift_s=0.0):
+        """
+        :param state: State returned by get_state
+        :param live: If True the stream is resumed after a gap: bins start again at the first packet after the gap
+                     (the gap is not reported as zero bitrate), whole-run histograms are kept
+        :param shift_s: Arrival times are shifted by this number of seconds (pause between checkpoint and resume)
+        """
+        if state['bins'] != self.bins or state['bin_s'] != self.bin_s or state['bin'] is None:
+            return
+        self.__totals = {pid: collections.Counter(totals) for pid, totals in state['totals'].items()}
+        if live:
+            return
+        shift = int(round(shift_s / self.bin_s))
+        self.__rings = dict()
+        for pid, data in state['rings'].items():
+            # Position of bin in ring buffer depends on its absolute index
+            ring = array.array('I', data)
+            self.__rings[pid] = ring[-shift % self.bins:] + ring[:-shift % self.bins]
+        self.__counts = dict(state['counts'])
+        self.__bin = state['bin'] + shift
+        self.__reported_bin = state['reported_bin'] + shift
+        self.__first_bin = state['first_bin'] + shift
+        self.__dt = None
+
+    def report(self, window=False) -> dict:
+        """
+        Bitrate statistics of completed bins since previous report (or of the sliding window)
+
+        :param window: If True statistics of the whole sliding window are returned and previous report is not moved
+        :return: dictionary {'program': {min, max, mean, pNN}, 'pids': {pid: {...}}} (bits per second)
+        """
+        if self.__bin is None:
+            return {'program': self.__reduce(array.array('I')), 'pids': dict()}
+        end = self.__bin
+        start = max(end - self.bins, self.__first_bin) if window else self.__reported_bin
+        if not window:
+            self.__reported_bin = end
+        return {'program': self.__reduce(self.__slice(self.__rings[-1], start, end)),
+                'pids': {pid: self.__reduce(self.__slice(ring, start, end))
+                         for pid, ring in self.__rings.items() if pid != -1}}
+
+    def get_totals(self) -> dict:
+        """
+        Bitrate statistics of all completed bins since start (or resume)
+
+        :return: dictionary {'program': {min, max, mean, pNN}, 'pids': {pid: {...}}} (bits per second)
+        """
+        return {'program': self.__reduce_totals(self.__totals[-1]),
+                'pids': {pid: self.__reduce_totals(totals) for pid, totals in self.__totals.items() if pid != -1}}
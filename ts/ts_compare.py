@@ -0,0 +1,284 @@
+"""
+Comparison of redundant copies of one channel (e.g. main and backup streams from two headends). Each stream is parsed
+once by its own TSReader and Statistics; StreamSummary collects (PID, PTS, payload hash, arrival time) of each PES
+start and the last PCR of the stream. StreamComparator joins the summaries and interval deltas of the streams once
+per stat interval:
+    errors and bitrate - difference of TR 101 290 error counters and bitrates of the interval (healthier stream)
+    PSI versions       - PAT and PMT versions of the streams
+    delay              - median difference of arrival times of PES with the same PID and PTS (positive if the second
+                         stream arrives later)
+    PCR offset         - stream time (PCR) of the second stream minus stream time of the first one at the same
+                         arrival time (non zero for streams which are not timestamped by the same source)
+    content divergence - PES with the same PID and PTS but different payload hash (CRC-32 of elementary stream data
+                         of the whole PES or of its first hash_packets packets), and PES missing in one of the streams
+                         within window_s
+"""
+import threading
+import zlib
+
+from events.event import Event
+from ts.ts_pcr import PCR_CLOCK, PCR_WRAP
+from ts.ts_stat import PidStat
+
+HASH_PACKETS = None         # TS packets of PES hashed for content comparison (None - whole PES)
+MAX_RECORDS = 10000         # Maximum PES records kept per stream between intervals
+MAX_LAG_INTERVALS = 3       # Intervals of one stream waiting for the other one before the other is treated as absent
+_ABSENT = (None, (), 0, None, None)     # Interval entry of absent stream
+
+
+class StreamSummary:
+    """ Class for collecting summary of one stream for comparison (see TSReader summary) """
+    def __init__(self, hash_packets=HASH_PACKETS, max_records=MAX_RECORDS):
+        """
+        Initialize object
+
+        :param hash_packets: Number of TS packets of PES (PES start included) which elementary stream data is hashed
+                             by CRC-32. Default is the whole PES. Payload is hashed incrementally as packets arrive,
+                             so PES is recorded when it is complete (next PES of the PID starts) or hash_packets are
+                             hashed
+        :param max_records: Maximum number of PES records kept until taken by comparator. Records above are dropped
+        """
+        self.hash_packets = hash_packets
+        self.max_records = max_records
+        self.__records = list()         # (pid, pts, crc, dt) of PES hashed since previous take
+        self.__hashing = dict()         # pid -> [pts, crc, number of hashed packets, dt] of PES being hashed
+        self.__dropped = 0
+        self.__pcr_pid = None           # Stream time is measured by the first PCR PID
+        self.__pcr = None               # (pcr, dt) of the last PCR
+        self.__lock = threading.Lock()
+
+    def packet(self, pid: int, packet: bytes, payload: int, pusi: int):
+        """
+        Account packet with payload of elementary stream PID (called before pes for PES start)
+
+        :param pid: PID of the packet
+        :param packet: TS packet bytes
+        :param payload: Payload byte number in the packet
+        :param pusi: payload_unit_start_indicator of the packet
+        """
+        state = self.__hashing.get(pid)
+        if state is None:
+            return
+        if pusi:
+            self.__record(pid)
+            return
+        state[1] = zlib.crc32(memoryview(packet)[payload:], state[1])
+        state[2] += 1
+        if self.hash_packets is not None and state[2] >= self.hash_packets:
+            self.__record(pid)
+
+    def pes(self, pid: int, pts: int, packet: bytes, payload: int, dt):
+        """
+        Account PES start
+
+        :param pid: PID of the packet
+        :param pts: PTS of the PES
+        :param packet: TS packet bytes
+        :param payload: Payload byte number in the packet (PES start)
+        :param dt: Arrival time of the packet
+        """
+        start = payload + 9 + packet[payload + 8]
+        self.__hashing[pid] = [pts, zlib.crc32(memoryview(packet)[start:]), 1, dt]
+        if self.hash_packets is not None and self.hash_packets <= 1:
+            self.__record(pid)
+
+    def __record(self, pid: int):
+        """ Hashing of PES of PID is completed """
+        pts, crc, hashed, dt = self.__hashing.pop(pid)
+        with self.__lock:
+            if len(self.__records) < self.max_records:
+                self.__records.append((pid, pts, crc, dt))
+            else:
+                self.__dropped += 1
+
+    def pcr(self, pid: int, pcr: int, dt):
+        """
+        :param pid: PCR PID
+        :param pcr: PCR value (27 MHz)
+        :param dt: Arrival time of the packet
+        """
+        if self.__pcr_pid is None:
+            self.__pcr_pid = pid
+        if pid == self.__pcr_pid:
+            self.__pcr = (pcr, dt)
+
+    def take(self) -> tuple:
+        """
+        :return: (PES records since previous take, number of dropped records, last (pcr, dt) or None)
+        """
+        with self.__lock:
+            records, dropped = self.__records, self.__dropped
+            self.__records = list()
+            self.__dropped = 0
+        return records, dropped, self.__pcr
+
+
+class _Stream:
+    """ Stream registered in comparator """
+    __slots__ = ('name', 'reader', 'summary', 'intervals', 'pending', 'totals')
+
+    def __init__(self, name: str, reader, summary: StreamSummary):
+        self.name = name
+        self.reader = reader
+        self.summary = summary
+        self.intervals = list()         # Interval deltas waiting for the interval of the other stream
+        self.pending = dict()           # (pid, pts) -> (crc, dt) of PES not matched yet
+        self.totals = {'intervals': 0, 'absent': 0, 'errors': 0, 'healthier': 0, 'missing': 0, 'dropped': 0}
+
+
+class StreamComparator:
+    """
+    Class for comparing two copies of one channel. Intervals of the streams are joined in order, PES are joined by
+    PID and PTS
+    """
+    def __init__(self, window_s=5.0):
+        """
+        Initialize object
+
+        :param window_s: PES not found in the other stream within this time are counted as missing
+        """
+        self.window_s = window_s
+        self.__streams = list()
+        self.__totals = {'intervals': 0, 'matched': 0, 'diverged': 0, 'psi_differences': 0}
+        self.__lock = threading.Lock()      # Intervals may be generated by statistics timer threads
+        self.result = None                  # Result of the last compared interval
+
+        # Events
+        self.onCompareReady = Event()       # Fired for each compared interval with result
+
+    def add_stream(self, name: str, reader, stats, summary: StreamSummary):
+        """
+        Register stream (two streams are compared)
+
+        :param name: Stream name (e.g. 'main' or multicast address:port)
+        :param reader: TSReader object of the stream (created with summary)
+        :param stats: Statistics object of the stream
+        :param summary: StreamSummary object of the reader
+        """
+        if len(self.__streams) == 2:
+            raise ValueError('Only two streams can be compared')
+        stream = _Stream(name, reader, summary)
+        self.__streams.append(stream)
+
+        def on_interval(interval: dict):
+            self.__on_interval(stream, interval)
+        stats.onIntervalReady += on_interval
+
+    def __on_interval(self, stream: _Stream, interval: dict):
+        with self.__lock:
+            records, dropped, pcr = stream.summary.take()
+            programs = stream.reader.get_programs_data()
+            pmts = [programs.get_prog_pmt(pid) for pid in programs.get_pmt_pids()]
+            psi = {'pat': programs.pat.ver_num if programs.pat is not None else None,
+                   'pmt': {pmt.prog_num: pmt.ver_num for pmt in pmts if pmt is not None}}
+            stream.intervals.append((interval, records, dropped, pcr, psi))
+            if len(self.__streams) < 2:
+                return
+            if any(len(item.intervals) == 0 for item in self.__streams) and len(stream.intervals) <= MAX_LAG_INTERVALS:
+                return
+            # The other stream does not deliver intervals (no packets received since start): it is absent
+            self.__compare_next()
+
+    def flush(self):
+        """ Compare intervals waiting for the other stream (at the end of analysis) """
+        with self.__lock:
+            while len(self.__streams) == 2 and any(len(item.intervals) > 0 for item in self.__streams):
+                self.__compare_next()
+
+    def __compare_next(self):
+        result = self.__compare(*(item.intervals.pop(0) if len(item.intervals) > 0 else _ABSENT
+                                  for item in self.__streams))
+        self.result = result
+        if self.onCompareReady.getHandlerCount() > 0:
+            self.onCompareReady.fire(result=result)
+
+    def __compare(self, first: tuple, second: tuple) -> dict:
+        streams = self.__streams
+        matched = diverged = 0
+        delays = list()
+        # New PES of each stream are looked up among not matched PES of the other stream
+        for this, other, (interval, records, dropped, pcr, psi) in ((streams[0], streams[1], first),
+                                                                    (streams[1], streams[0], second)):
+            sign = 1 if this is streams[1] else -1
+            this.totals['dropped'] += dropped
+            for pid, pts, crc, dt in records:
+                match = other.pending.pop((pid, pts), None)
+                if match is None:
+                    this.pending[(pid, pts)] = (crc, dt)
+                    continue
+                matched += 1
+                if crc != match[0]:
+                    diverged += 1
+                delays.append(sign * (dt - match[1]).total_seconds())
+        # PES not found in the other stream within window are missing there
+        missing = dict()
+        last_dt = max(entry[0]['dt'] for entry in (first, second) if entry[0] is not None)
+        for this, other in ((streams[0], streams[1]), (streams[1], streams[0])):
+            expired = [key for key, (crc, dt) in this.pending.items()
+                       if (last_dt - dt).total_seconds() > self.window_s]
+            for key in expired:
+                del this.pending[key]
+            missing[other.name] = len(expired)
+            other.totals['missing'] += len(expired)
+
+        result = {'dt': str(last_dt), 'streams': dict()}
+        errors = list()
+        for stream, (interval, records, dropped, pcr, psi) in zip(streams, (first, second)):
+            stream.totals['intervals'] += 1
+            if interval is None:
+                errors.append(None)
+                stream.totals['absent'] += 1
+                result['streams'][stream.name] = {'present': False}
+                continue
+            program = interval['program']
+            count = sum(program[name] for name in PidStat.COUNTERS[1:])
+            errors.append(count)
+            stream.totals['errors'] += count
+            result['streams'][stream.name] = {'present': True, 'bitrate': program['bitrate'], 'errors': count,
+                                              'stat': {name: program[name] for name in PidStat.COUNTERS[1:]
+                                                       if program[name] != 0},
+                                              'psi': psi, 'pes': len(records)}
+        healthier = None
+        if None in errors:
+            result['errors_diff'] = result['bitrate_diff'] = None
+            healthier = streams[0] if errors[0] is not None else streams[1]
+        else:
+            result['errors_diff'] = errors[1] - errors[0]
+            result['bitrate_diff'] = second[0]['program']['bitrate'] - first[0]['program']['bitrate']
+            if errors[0] != errors[1]:
+                healthier = streams[0] if errors[0] < errors[1] else streams[1]
+        if healthier is not None:
+            healthier.totals['healthier'] += 1
+        result['healthier'] = healthier.name if healthier is not None else None
+        result['psi_equal'] = first[4] == second[4] if None not in errors else None
+        result['pes'] = {'matched': matched, 'diverged': diverged, 'missing': missing}
+        result['delay_ms'] = None
+        if len(delays) > 0:
+            delays.sort()
+            result['delay_ms'] = round(delays[len(delays) // 2] * 1000, 3)
+        result['pcr_offset_ms'] = self.__pcr_offset_ms(first[3], second[3])
+        self.__totals['intervals'] += 1
+        self.__totals['matched'] += matched
+        self.__totals['diverged'] += diverged
+        self.__totals['psi_differences'] += 1 if result['psi_equal'] is False else 0
+        return result
+
+    @staticmethod
+    def __pcr_offset_ms(first, second):
+        if first is None or second is None:
+            return None
+        # Stream time of the first stream is moved to the arrival time of the second PCR
+        pcr_first = first[0] + int((second[1] - first[1]).total_seconds() * PCR_CLOCK)
+        offset = (second[0] - pcr_first) % PCR_WRAP
+        if offset > PCR_WRAP // 2:
+            offset -= PCR_WRAP
+        return round(offset * 1000 / PCR_CLOCK, 3)
+
+    def get_totals(self) -> dict:
+        """
+        :return: Totals of the comparison: compared intervals, matched and diverged PES, intervals with different
+                 PSI versions and per stream totals (errors, intervals the stream was absent or healthier, PES
+                 missing in the stream)
+        """
+        with self.__lock:
+            return dict(self.__totals, streams={stream.name: dict(stream.totals) for stream in self.__streams})
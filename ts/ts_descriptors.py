@@ -0,0 +1,340 @@
+import array
+import logging
+import struct
+
+"""
+Lazy descriptor loops (ISO/IEC 13818-1 2.6, ETSI EN 300 468 6). Descriptor loop of a section is kept as
+(tag, offset, length) entries over the section buffer and descriptor_data is decoded on first access by decoder
+registered for the tag (see register_decoder). Descriptors without registered decoder are returned as raw bytes
+"""
+
+DECODERS = dict()       # descriptor_tag -> function(data: bytes) -> decoded descriptor_data
+
+
+def register_decoder(tag: int, decoder=None):
+    """
+    Register decoder of descriptor_data for descriptor tag. Can be used as decorator
+
+    :param tag: descriptor_tag
+    :param decoder: Function which gets descriptor_data bytes and returns decoded value
+    :return: decoder
+    """
+    if decoder is None:
+        return lambda func: register_decoder(tag, func)
+    DECODERS[tag] = decoder
+    return decoder
+
+
+def decode_text(data: bytes):
+    """
+    Decode DVB text (EN 300 468 Annex A). Only single byte ISO/IEC 8859 character tables are decoded, otherwise bytes
+    are returned as is
+    """
+    if len(data) > 0 and 1 <= data[0] <= 11:
+        return data[1:].decode('iso-8859-' + str(data[0] + 4), errors='replace')
+    return data
+
+
+def _text(data: bytes, pos: int) -> tuple:
+    """ Decode text with 8-bit length at pos. :return: (text or None if empty, next position) """
+    length = data[pos]
+    return (decode_text(data[pos + 1:pos + 1 + length]) if length > 0 else None), pos + 1 + length
+
+
+def _bcd(data: bytes) -> int:
+    value = 0
+    for b in data:
+        value = value * 100 + (b >> 4) * 10 + (b & 15)
+    return value
+
+
+class Descriptor:
+    """ Descriptor of a descriptor loop. descriptor_data is decoded on first access and memoized """
+    __slots__ = ('tag', '__buffer', '__offset', '__length', '__data')
+
+    def __init__(self, tag: int, buffer: bytes, offset: int, length: int):
+        self.tag = tag
+        self.__buffer = buffer
+        self.__offset = offset
+        self.__length = length
+        self.__data = None
+
+    @property
+    def raw(self) -> bytes:
+        """ descriptor_data bytes """
+        return bytes(self.__buffer[self.__offset:self.__offset + self.__length])
+
+    @property
+    def data(self):
+        """ Decoded descriptor_data (raw bytes if there is no decoder for the tag or data is malformed) """
+        if self.__data is None:
+            decoder = DECODERS.get(self.tag)
+            data = self.raw
+            if decoder is not None:
+                try:
+                    data = decoder(data)
+                except Exception as err:
+                    logging.warning('Descriptor tag=0x{:02X} decoding error:{}'.format(self.tag, err))
+            self.__data = data
+        return self.__data
+
+    def __getitem__(self, key: str):
+        # Descriptors are accessed as {'descriptor_tag', 'descriptor_data'} dictionaries
+        if key == 'descriptor_tag':
+            return self.tag
+        if key == 'descriptor_data':
+            return self.data
+        raise KeyError(key)
+
+    def __eq__(self, other):
+        return isinstance(other, Descriptor) and self.tag == other.tag and self.raw == other.raw
+
+    def __repr__(self):
+        return str({'descriptor_tag': self.tag, 'descriptor_data': self.data})
+
+
+class DescriptorList:
+    """
+    Sequence of descriptors of one descriptor loop. Only the loop structure is parsed when the object is created,
+    Descriptor objects are created on access
+    """
+    __slots__ = ('__buffer', '__entries', '__items')
+
+    def __init__(self, buffer: bytes, start=0, end=None):
+        """
+        :param buffer: Section (or packet) bytes
+        :param start: Position of the first descriptor
+        :param end: Position after the last descriptor (end of buffer if None)
+        """
+        if end is None:
+            end = len(buffer)
+        self.__buffer = buffer
+        self.__entries = array.array('H')     # tag, offset, length per descriptor
+        self.__items = None
+        pos = start
+        while pos < end:
+            if pos + 2 > end or pos + 2 + buffer[pos + 1] > end:
+                raise ValueError('descriptor length exceeds descriptor loop')
+            self.__entries.extend((buffer[pos], pos + 2, buffer[pos + 1]))
+            pos += 2 + buffer[pos + 1]
+
+    def __len__(self):
+        return len(self.__entries) // 3
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if self.__items is None:
+            self.__items = [None] * len(self)
+        item = self.__items[index]
+        if item is None:
+            entries = self.__entries
+            item = self.__items[index] = Descriptor(entries[3 * index], self.__buffer, entries[3 * index + 1],
+                                                    entries[3 * index + 2])
+        return item
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def tags(self) -> list:
+        """ Descriptor tags without creating Descriptor objects """
+        return list(self.__entries[0::3])
+
+    def find(self, tag: int) -> Descriptor:
+        """ :return: The first descriptor with the tag or None """
+        for index, value in enumerate(self.__entries[0::3]):
+            if value == tag:
+                return self[index]
+        return None
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+@register_decoder(9)
+def _ca(data: bytes) -> dict:
+    ca_system_id, ca_pid = struct.unpack('>HH', data[0:4])
+    return {'ca_system_id': ca_system_id, 'ca_pid': ca_pid & 8191, 'private_data': data[4:]}
+
+
+@register_decoder(10)
+def _iso_639_language(data: bytes) -> dict:
+    return {'languages': [{'ISO_639_language_code': data[pos:pos + 3].decode('latin-1'), 'audio_type': data[pos + 3]}
+                          for pos in range(0, len(data) - 3, 4)]}
+
+
+@register_decoder(64)
+def _network_name(data: bytes) -> dict:
+    return {'network_name': decode_text(data)}
+
+
+@register_decoder(65)
+def _service_list(data: bytes) -> dict:
+    return {'service_list': [{'service_id': service_id, 'service_type': service_type}
+                             for service_id, service_type in struct.iter_unpack('>HB', data[:len(data) // 3 * 3])]}
+
+
+@register_decoder(67)
+def _satellite_delivery_system(data: bytes) -> dict:
+    b = data[6]
+    return {'frequency_GHz': _bcd(data[0:4]) / 100000, 'orbital_position': _bcd(data[4:6]) / 10,
+            'west_east_flag': b >> 7, 'polarization': (b >> 5) & 3, 'modulation_system': (b >> 2) & 1,
+            'modulation_type': b & 3, 'symbol_rate_Msymbol_s': _bcd(data[7:11]) // 10 / 10000,
+            'FEC_inner': data[10] & 15}
+
+
+@register_decoder(68)
+def _cable_delivery_system(data: bytes) -> dict:
+    return {'frequency_MHz': _bcd(data[0:4]) / 10000, 'FEC_outer': data[5] & 15, 'modulation': data[6],
+            'symbol_rate_Msymbol_s': _bcd(data[7:11]) // 10 / 10000, 'FEC_inner': data[10] & 15}
+
+
+@register_decoder(71)
+def _bouquet_name(data: bytes) -> dict:
+    return {'bouquet_name': decode_text(data)}
+
+
+@register_decoder(72)
+def _service(data: bytes) -> dict:
+    service_provider_name, pos = _text(data, 1)
+    service_name, pos = _text(data, pos)
+    return {'service_type': data[0], 'service_provider_name': service_provider_name, 'service_name': service_name}
+
+
+@register_decoder(73)
+def _country_availability(data: bytes) -> dict:
+    return {'country_availability_flag': data[0] >> 7,
+            'country_codes': [data[pos:pos + 3].decode('latin-1') for pos in range(1, len(data) - 2, 3)]}
+
+
+@register_decoder(74)
+def _linkage(data: bytes) -> dict:
+    transport_stream_id, original_network_id, service_id, linkage_type = struct.unpack('>HHHB', data[0:7])
+    return {'transport_stream_id': transport_stream_id, 'original_network_id': original_network_id,
+            'service_id': service_id, 'linkage_type': linkage_type, 'private_data': data[7:]}
+
+
+@register_decoder(77)
+def _short_event(data: bytes) -> dict:
+    event_name, pos = _text(data, 3)
+    text, pos = _text(data, pos)
+    return {'ISO_639_language_code': data[0:3].decode('latin-1'), 'event_name': event_name, 'text': text}
+
+
+@register_decoder(78)
+def _extended_event(data: bytes) -> dict:
+    items = list()
+    pos = 5
+    end = pos + data[4]
+    while pos < end:
+        description, pos = _text(data, pos)
+        item, pos = _text(data, pos)
+        items.append({'item_description': description, 'item': item})
+    text, pos = _text(data, pos)
+    return {'descriptor_number': data[0] >> 4, 'last_descriptor_number': data[0] & 15,
+            'ISO_639_language_code': data[1:4].decode('latin-1'), 'items': items, 'text': text}
+
+
+@register_decoder(80)
+def _component(data: bytes) -> dict:
+    return {'stream_content': data[0] & 15, 'component_type': data[1], 'component_tag': data[2],
+            'ISO_639_language_code': data[3:6].decode('latin-1'), 'text': decode_text(data[6:]) or None}
+
+
+@register_decoder(82)
+def _stream_identifier(data: bytes) -> dict:
+    return {'component_tag': data[0]}
+
+
+@register_decoder(83)
+def _ca_identifier(data: bytes) -> dict:
+    return {'ca_system_id': [value[0] for value in struct.iter_unpack('>H', data[:len(data) // 2 * 2])]}
+
+
+@register_decoder(84)
+def _content(data: bytes) -> dict:
+    return {'content': [{'content_nibble_level_1': data[pos] >> 4, 'content_nibble_level_2': data[pos] & 15,
+                         'user_byte': data[pos + 1]} for pos in range(0, len(data) - 1, 2)]}
+
+
+@register_decoder(85)
+def _parental_rating(data: bytes) -> dict:
+    return {'ratings': [{'country_code': data[pos:pos + 3].decode('latin-1'), 'rating': data[pos + 3]}
+                        for pos in range(0, len(data) - 3, 4)]}
+
+
+@register_decoder(86)
+@register_decoder(70)
+def _teletext(data: bytes) -> dict:
+    return {'teletext': [{'ISO_639_language_code': data[pos:pos + 3].decode('latin-1'),
+                          'teletext_type': data[pos + 3] >> 3, 'magazine_number': data[pos + 3] & 7,
+                          'page_number': '{:02X}'.format(data[pos + 4])} for pos in range(0, len(data) - 4, 5)]}
+
+
+@register_decoder(88)
+def _local_time_offset(data: bytes) -> dict:
+    offsets = list()
+    for pos in range(0, len(data) - 12, 13):
+        b = data[pos + 3]
+        offsets.append({'country_code': data[pos:pos + 3].decode('latin-1'), 'country_region_id': b >> 2,
+                        'polarity': b & 1, 'local_time_offset_min': _bcd(data[pos + 4:pos + 5]) * 60
+                        + _bcd(data[pos + 5:pos + 6]), 'time_of_change': data[pos + 6:pos + 11],
+                        'next_time_offset_min': _bcd(data[pos + 11:pos + 12]) * 60 + _bcd(data[pos + 12:pos + 13])})
+    return {'offsets': offsets}
+
+
+@register_decoder(89)
+def _subtitling(data: bytes) -> dict:
+    subtitles = list()
+    for pos in range(0, len(data) - 7, 8):
+        composition_page_id, ancillary_page_id = struct.unpack('>HH', data[pos + 4:pos + 8])
+        subtitles.append({'ISO_639_language_code': data[pos:pos + 3].decode('latin-1'),
+                          'subtitling_type': data[pos + 3], 'composition_page_id': composition_page_id,
+                          'ancillary_page_id': ancillary_page_id})
+    return {'subtitles': subtitles}
+
+
+@register_decoder(90)
+def _terrestrial_delivery_system(data: bytes) -> dict:
+    return {'centre_frequency_Hz': struct.unpack('>L', data[0:4])[0] * 10, 'bandwidth': data[4] >> 5,
+            'constellation': data[5] >> 6, 'code_rate_HP': data[5] & 7, 'code_rate_LP': data[6] >> 5,
+            'guard_interval': (data[6] >> 3) & 3, 'transmission_mode': (data[6] >> 1) & 3}
+
+
+@register_decoder(95)
+def _private_data_specifier(data: bytes) -> dict:
+    return {'private_data_specifier': struct.unpack('>L', data[0:4])[0]}
+
+
+@register_decoder(98)
+def _frequency_list(data: bytes) -> dict:
+    frequencies = data[1:1 + (len(data) - 1) // 4 * 4]
+    return {'coding_type': data[0] & 3,
+            'centre_frequencies': [value[0] for value in struct.iter_unpack('>L', frequencies)]}
+
+
+@register_decoder(102)
+def _data_broadcast_id(data: bytes) -> dict:
+    return {'data_broadcast_id': struct.unpack('>H', data[0:2])[0], 'id_selector': data[2:]}
+
+
+@register_decoder(106)
+@register_decoder(122)
+def _ac3(data: bytes) -> dict:
+    return {'flags': data[0], 'additional_info': data[1:]}
+
+
+@register_decoder(124)
+def _aac(data: bytes) -> dict:
+    return {'profile_and_level': data[0], 'additional_info': data[1:]}
+
+
+@register_decoder(127)
+def _extension(data: bytes) -> dict:
+    return {'descriptor_tag_extension': data[0], 'selector': data[1:]}
@@ -0,0 +1,285 @@
+from ts.ts_pes import PTS_CLOCK, decode_timestamp, timestamp_delta
+
+"""
+Video elementary stream scanner. Pictures are found by start codes (00 00 01) without decoding video:
+    MPEG-2 (ISO/IEC 13818-2 6.2.3)  - picture_start_code 0x00, picture_coding_type: 1 - I, 2 - P, 3 - B
+    H.264 (ITU-T H.264 7.3.3)       - slice NAL units (1, 5) with first_mb_in_slice = 0, slice_type: P, B, I, SP, SI
+    HEVC (ITU-T H.265 7.3.6)        - VCL NAL units with first_slice_segment_in_pic_flag = 1. IRAP pictures
+                                      (NAL unit types 16-21) are I, other pictures are not classified
+"""
+
+CODECS = {1: 'mpeg2', 2: 'mpeg2', 27: 'h264', 36: 'hevc'}      # stream_type -> codec
+FRAME_TYPES = ('I', 'P', 'B', 'other')
+_I, _P, _B, _OTHER = range(len(FRAME_TYPES))
+_H264_SLICE_TYPES = (_P, _B, _I, _P, _I)        # slice_type % 5: P, B, I, SP, SI
+# Bytes needed after start code prefix to classify picture
+_HEADER_BYTES = {'mpeg2': 3, 'h264': 5, 'hevc': 3}
+_MAX_FRAME_INTERVAL = PTS_CLOCK                  # Longer intervals between pictures (1 s) are not accounted
+
+
+def _read_ue(bits: int, pos: int, width=32) -> (int, int):
+    """
+    Read unsigned Exp-Golomb code
+
+    :param bits: Integer containing width bits of data
+    :param pos: Bit position (0 - most significant bit)
+    :return: (value, next bit position). Value is None if code is longer than data
+    """
+    zeros = 0
+    while pos < width and not (bits >> (width - 1 - pos)) & 1:
+        zeros += 1
+        pos += 1
+    pos += 1
+    if pos + zeros > width:
+        return None, width
+    return (1 << zeros) - 1 + ((bits >> (width - pos - zeros)) & ((1 << zeros) - 1)), pos + zeros
+
+
+def _classify(codec: str, data: bytes, pos: int) -> int:
+    """
+    :param data: Elementary stream bytes
+    :param pos: Position after start code prefix
+    :return: frame type index (see FRAME_TYPES) if start code begins a new picture, otherwise None
+    """
+    code = data[pos]
+    if codec == 'h264':
+        nal_type = code & 31
+        if nal_type != 1 and nal_type != 5:
+            return None
+        bits = int.from_bytes(data[pos + 1:pos + 5], 'big')
+        first_mb, bit = _read_ue(bits, 0)
+        if first_mb != 0:
+            return None
+        if nal_type == 5:
+            return _I
+        slice_type, bit = _read_ue(bits, bit)
+        return _OTHER if slice_type is None else _H264_SLICE_TYPES[slice_type % 5]
+    if codec == 'hevc':
+        nal_type = (code >> 1) & 63
+        if (nal_type > 9 and nal_type < 16) or nal_type > 21 or not data[pos + 2] & 128:
+            return None
+        return _I if nal_type >= 16 else _OTHER
+    if code != 0:
+        return None
+    coding_type = (data[pos + 2] >> 3) & 7
+    return coding_type - 1 if 1 <= coding_type <= 3 else _OTHER
+
+
+def _account(acc: list, value):
+    """ Add value into [min, max, sum, count] accumulator """
+    if acc[3] == 0 or value < acc[0]:
+        acc[0] = value
+    if acc[3] == 0 or value > acc[1]:
+        acc[1] = value
+    acc[2] += value
+    acc[3] += 1
+
+
+def _merge(target: list, source: list):
+    """ Add [min, max, sum, count] accumulator source into target """
+    if source[3] == 0:
+        return
+    if target[3] == 0 or source[0] < target[0]:
+        target[0] = source[0]
+    if target[3] == 0 or source[1] > target[1]:
+        target[1] = source[1]
+    target[2] += source[2]
+    target[3] += source[3]
+
+
+def _summary(acc: list, k=None) -> dict:
+    """ min/max/mean of accumulator (multiplied by k if set) """
+    if acc[3] == 0:
+        return None
+    if k is None:
+        return {'min': acc[0], 'max': acc[1], 'mean': round(acc[2] / acc[3], 3)}
+    return {'min': round(acc[0] * k, 3), 'max': round(acc[1] * k, 3), 'mean': round(acc[2] / acc[3] * k, 3)}
+
+
+class _EsState:
+    """ Scanner state and interval accumulators of one video PID """
+    __slots__ = ('codec', 'searching', 'carry', 'ts', 'rai_at_start', 'last_ts', 'i_ts', 'gop_frames', 'counts',
+                 'gops', 'i_intervals', 'frame_intervals', 'totals')
+
+    def __init__(self, codec: str):
+        self.codec = codec
+        self.searching = False      # Picture header of current PES is not found yet
+        self.carry = b''            # Tail of previous payload (start code may be split between packets)
+        self.ts = None              # Decoding timestamp of current PES (until its first picture)
+        self.rai_at_start = False   # random_access_indicator of the packet which started current PES
+        self.last_ts = None
+        self.i_ts = None
+        self.gop_frames = None      # Number of pictures since last I-picture
+        self.totals = None
+        self.reset()
+
+    def reset(self):
+        """ Start new interval. Completed interval is added to totals """
+        if self.totals is not None:
+            for name, value in self.counts.items():
+                self.totals['counts'][name] += value
+            for name in ('gops', 'i_intervals', 'frame_intervals'):
+                _merge(self.totals[name], getattr(self, name))
+        else:
+            self.totals = {'counts': dict.fromkeys(FRAME_TYPES + ('frames', 'rai', 'rai_missing'), 0),
+                           'gops': [0, 0, 0, 0], 'i_intervals': [0, 0, 0, 0], 'frame_intervals': [0, 0, 0, 0]}
+        self.counts = dict.fromkeys(FRAME_TYPES + ('frames', 'rai', 'rai_missing'), 0)
+        self.gops = [0, 0, 0, 0]            # GOP length in pictures (min, max, sum, count)
+        self.i_intervals = [0, 0, 0, 0]     # Interval between I-pictures in 90 kHz ticks
+        self.frame_intervals = [0, 0, 0, 0]     # Interval between pictures in 90 kHz ticks
+
+
+class EsScanner:
+    """
+    Class for GOP and picture type analysis of video PIDs. Start codes are found with bytes.find over packet
+    payloads. By default only the beginning of each PES is scanned until its first picture header (one access unit
+    per PES is used for video in DVB, see ETSI TS 101 154), so packets of the rest of the picture are skipped
+    """
+    def __init__(self, scan_whole_pes=False):
+        """
+        Initialize object
+
+        :param scan_whole_pes: If True whole PES payloads are scanned (streams with several pictures per PES)
+        """
+        self.scan_whole_pes = scan_whole_pes
+        self.__streams = dict()     # pid -> _EsState
+
+    def set_program(self, pmt):
+        """
+        Register video PIDs of the program
+
+        :param pmt: PMT object of the program
+        """
+        for stream in pmt.streams:
+            codec = CODECS.get(stream['stream_type'])
+            state = self.__streams.get(stream['elementary_pid'])
+            if codec is not None and (state is None or state.codec != codec):
+                self.__streams[stream['elementary_pid']] = _EsState(codec)
+
+    def packet(self, pid: int, packet: bytes, payload: int, pusi: int, rai: int):
+        """
+        Scan payload of the packet
+
+        :param pid: PID of the packet
+        :param packet: TS packet bytes
+        :param payload: Payload byte number in the packet
+        :param pusi: payload_unit_start_indicator of the packet
+        :param rai: random_access_indicator of the packet
+        """
+        state = self.__streams.get(pid)
+        if state is None:
+            return
+        if rai:
+            state.counts['rai'] += 1
+        if pusi:
+            data = packet[payload:]
+            state.searching = False
+            state.carry = b''
+            if len(data) < 9 or data[0] != 0 or data[1] != 0 or data[2] != 1:
+                return
+            flags = data[7] >> 6
+            if flags == 3 and data[8] >= 10 and len(data) >= 19:
+                state.ts = decode_timestamp(data, 14)
+            elif flags >= 2 and data[8] >= 5 and len(data) >= 14:
+                state.ts = decode_timestamp(data, 9)
+            else:
+                state.ts = None
+            state.rai_at_start = bool(rai)
+            state.searching = True
+            data = data[9 + data[8]:]
+        elif not state.searching:
+            return
+        else:
+            data = state.carry + packet[payload:]
+        self.__scan(state, data)
+
+    def __scan(self, state: _EsState, data: bytes):
+        header_bytes = _HEADER_BYTES[state.codec]
+        pos = data.find(b'\x00\x00\x01')
+        while pos >= 0:
+            if pos + 3 + header_bytes > len(data):
+                # Picture header is split between packets
+                state.carry = data[pos:]
+                return
+            frame_type = _classify(state.codec, data, pos + 3)
+            if frame_type is not None:
+                self.__frame(state, frame_type)
+                if not self.scan_whole_pes:
+                    state.searching = False
+                    state.carry = b''
+                    return
+            pos = data.find(b'\x00\x00\x01', pos + 3)
+        state.carry = data[-2:]
+
+    @staticmethod
+    def __frame(state: _EsState, frame_type: int):
+        counts = state.counts
+        counts['frames'] += 1
+        counts[FRAME_TYPES[frame_type]] += 1
+        ts = state.ts
+        state.ts = None         # Timestamp belongs to the first picture of PES only
+        if ts is not None:
+            if state.last_ts is not None:
+                delta = timestamp_delta(ts - state.last_ts)
+                if 0 < delta <= _MAX_FRAME_INTERVAL:
+                    _account(state.frame_intervals, delta)
+            state.last_ts = ts
+        if frame_type == _I:
+            if state.gop_frames is not None:
+                _account(state.gops, state.gop_frames)
+            state.gop_frames = 0
+            if ts is not None:
+                if state.i_ts is not None:
+                    delta = timestamp_delta(ts - state.i_ts)
+                    if delta > 0:
+                        _account(state.i_intervals, delta)
+                state.i_ts = ts
+            if not state.rai_at_start:
+                counts['rai_missing'] += 1
+        if state.gop_frames is not None:
+            state.gop_frames += 1
+        state.rai_at_start = False
+
+    @staticmethod
+    def __result(pid: int, state: _EsState, counts: dict, gops: list, i_intervals: list,
+                 frame_intervals: list) -> dict:
+        k = 1000 / PTS_CLOCK
+        frame_interval = _summary(frame_intervals, k)
+        return dict(pid=pid, codec=state.codec, **counts, gop=_summary(gops), i_interval_ms=_summary(i_intervals, k),
+                    frame_interval_ms=frame_interval,
+                    fps=round(1000 / frame_interval['mean'], 3) if frame_interval is not None else None)
+
+    def report(self) -> list:
+        """
+        GOP statistics since previous report
+
+        :return: list of {'pid', 'codec', 'frames', 'I', 'P', 'B', 'other', 'rai', 'rai_missing' (I-pictures without
+                 random_access_indicator), 'gop' (length in pictures), 'i_interval_ms', 'frame_interval_ms'
+                 ({min, max, mean}), 'fps'} or None if there are no video PIDs
+        """
+        if len(self.__streams) == 0:
+            return None
+        result = list()
+        for pid, state in sorted(self.__streams.items()):
+            result.append(self.__result(pid, state, state.counts, state.gops, state.i_intervals,
+                                        state.frame_intervals))
+            state.reset()
+        return result
+
+    def get_totals(self) -> list:
+        """
+        :return: GOP statistics since start including not reported yet (see report)
+        """
+        if len(self.__streams) == 0:
+            return None
+        result = list()
+        for pid, state in sorted(self.__streams.items()):
+            totals = state.totals
+            counts = {name: value + state.counts[name] for name, value in totals['counts'].items()}
+            accs = list()
+            for name in ('gops', 'i_intervals', 'frame_intervals'):
+                acc = list(totals[name])
+                _merge(acc, getattr(state, name))
+                accs.append(acc)
+            result.append(self.__result(pid, state, counts, *accs))
+        return result
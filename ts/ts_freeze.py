@@ -0,0 +1,234 @@
+import datetime
+import logging
+import zlib
+from ts.ts_es import CODECS
+
+"""
+Frozen picture and black picture detection without decoding video:
+    frozen - consecutive key frames (PES started in packet with random_access_indicator) of video PID have identical
+             payload fingerprint (CRC-32 of first packets after the first one, which carries PES header, parameter
+             sets, SEI and slice header) for at least min_duration_s
+    black  - key frames are smaller than black_max_bytes for at least min_duration_s (black or static pictures are
+             compressed into very small intra frames)
+Durations are measured by PTS of key frames (stream time), so they are valid when arrival time is not stream time
+(e.g. TS-file is read). Arrival time is used for key frames without PTS and across PTS jumps
+"""
+
+PTS_CLOCK = 90000
+PTS_WRAP = 1 << 33
+MAX_PTS_STEP_S = 10.0       # Larger PTS difference of consecutive key frames is a PTS jump (arrival time is used)
+
+
+class _Condition:
+    """ State of one detected condition (frozen or black) of PID """
+    __slots__ = ('since', 'active', 'events', 'reported_events')
+
+    def __init__(self):
+        self.since = None           # Time of the first key frame of the condition
+        self.active = False         # Condition lasts at least min_duration_s
+        self.events = 0
+        self.reported_events = 0
+
+    def update(self, present: bool, t: float, min_duration_s: float, start=None) -> int:
+        """
+        :param present: Condition is present at key frame
+        :param t: Time of key frame in seconds (see _PidState.t)
+        :param min_duration_s: Minimum duration of condition
+        :param start: Time when condition has started (t if None)
+        :return: 1 if condition started, -1 if it ended, otherwise 0
+        """
+        if not present:
+            self.since = None
+            if self.active:
+                self.active = False
+                return -1
+            return 0
+        if self.since is None:
+            self.since = start if start is not None else t
+        if not self.active and t - self.since >= min_duration_s:
+            self.active = True
+            self.events += 1
+            return 1
+        return 0
+
+    def duration_s(self, t: float) -> float:
+        return round(t - self.since, 3) if self.active and t is not None else 0
+
+
+def _merge_sizes(total: list, sizes: list) -> list:
+    """ Merge key frame sizes (min, max, sum, count) into total """
+    if sizes[3] > 0:
+        if total[3] == 0 or sizes[0] < total[0]:
+            total[0] = sizes[0]
+        if total[3] == 0 or sizes[1] > total[1]:
+            total[1] = sizes[1]
+        total[2] += sizes[2]
+        total[3] += sizes[3]
+    return total
+
+
+class _PidState:
+    __slots__ = ('hashing', 'crc', 'hashed', 'size', 'dt', 'pts', 'last_crc', 'last_dt', 'last_pts', 'last_t',
+                 'key_frames', 'reported_key_frames', 'sizes', 'sizes_total', 'frozen', 'black')
+
+    def __init__(self):
+        self.hashing = False        # Key frame is being fingerprinted
+        self.crc = 0
+        self.hashed = 0             # Number of hashed packets of current key frame
+        self.size = 0               # Payload bytes of current key frame
+        self.dt = None              # Arrival time of current key frame
+        self.pts = None             # PTS of current key frame
+        self.last_crc = None        # Fingerprint of previous key frame
+        self.last_dt = None
+        self.last_pts = None
+        self.last_t = None          # Time of previous key frame in seconds (PTS based, continuous)
+        self.key_frames = 0
+        self.reported_key_frames = 0
+        self.sizes = [0, 0, 0, 0]   # Key frame size since last report (min, max, sum, count)
+        self.sizes_total = [0, 0, 0, 0]     # the same for reported intervals
+        self.frozen = _Condition()
+        self.black = _Condition()
+
+
+class FreezeDetector:
+    """
+    Class for frozen and black picture detection on video PIDs. Key frame payloads are hashed incrementally with
+    zlib.crc32 over packet payload views as packets arrive, so nothing is buffered and the cost is limited to
+    hash_packets packets per key frame
+    """
+    def __init__(self, min_duration_s=5.0, hash_packets=32, black_max_bytes=4096):
+        """
+        Initialize object
+
+        :param min_duration_s: Minimum duration of identical (or small) key frames to report frozen (black) picture
+        :param hash_packets: Number of packets of key frame payload included into fingerprint
+        :param black_max_bytes: Key frames with smaller PES payload are considered black (0 - disable detection)
+        """
+        self.min_duration_s = min_duration_s
+        self.hash_packets = hash_packets
+        self.black_max_bytes = black_max_bytes
+        self.__streams = dict()     # pid -> _PidState
+
+    def set_program(self, pmt, video_types=tuple(CODECS)):
+        """
+        Register video PIDs of the program
+
+        :param pmt: PMT object of the program
+        :param video_types: stream_type values of video streams
+        """
+        for stream in pmt.streams:
+            if stream['stream_type'] in video_types and stream['elementary_pid'] not in self.__streams:
+                self.__streams[stream['elementary_pid']] = _PidState()
+
+    def packet(self, pid: int, packet: bytes, payload: int, pusi: int, rai: int, dt: datetime.datetime):
+        """
+        Account packet of video PID
+
+        :param pid: PID of the packet
+        :param packet: TS packet bytes
+        :param payload: Payload byte number in the packet
+        :param pusi: payload_unit_start_indicator of the packet
+        :param rai: random_access_indicator of the packet
+        :param dt: Arrival time of the packet
+        """
+        state = self.__streams.get(pid)
+        if state is None:
+            return
+        if pusi:
+            if state.hashing:
+                self.__key_frame(pid, state)
+            state.hashing = bool(rai)
+            if rai:
+                state.crc = 0
+                state.hashed = 0
+                state.size = len(packet) - payload
+                state.dt = dt
+                state.pts = None
+                # PES header with PTS (PTS_DTS_flags '10' or '11')
+                if len(packet) >= payload + 14 and packet[payload + 7] & 0x80:
+                    b = packet[payload + 9:payload + 14]
+                    state.pts = ((((b[0] >> 1) & 7) << 30) | (b[1] << 22) | ((b[2] >> 1) << 15) | (b[3] << 7)
+                                 | (b[4] >> 1))
+            return
+        if state.hashing:
+            state.size += len(packet) - payload
+            if state.hashed < self.hash_packets:
+                state.crc = zlib.crc32(memoryview(packet)[payload:], state.crc)
+                state.hashed += 1
+
+    def __key_frame(self, pid: int, state: _PidState):
+        """ Key frame is complete (next PES started) """
+        state.hashing = False
+        state.key_frames += 1
+        sizes = state.sizes
+        if sizes[3] == 0 or state.size < sizes[0]:
+            sizes[0] = state.size
+        if sizes[3] == 0 or state.size > sizes[1]:
+            sizes[1] = state.size
+        sizes[2] += state.size
+        sizes[3] += 1
+        t = self.__time(state)
+        # Key frames without payload after the first packet are not fingerprinted
+        if state.hashed > 0:
+            # Picture is frozen since previous key frame
+            change = state.frozen.update(state.crc == state.last_crc, t, self.min_duration_s, state.last_t)
+            if change != 0:
+                logging.warning('{}: PID=0x{:04X} picture {}'.format(state.dt, pid,
+                                                                     'frozen' if change > 0 else 'is not frozen'))
+            state.last_crc = state.crc
+        if self.black_max_bytes > 0:
+            change = state.black.update(state.size < self.black_max_bytes, t, self.min_duration_s)
+            if change != 0:
+                logging.warning('{}: PID=0x{:04X} {}'.format(state.dt, pid, 'black picture suspected' if change > 0
+                                                             else 'picture is not black'))
+        state.last_dt = state.dt
+        state.last_pts = state.pts
+        state.last_t = t
+
+    @staticmethod
+    def __time(state: _PidState) -> float:
+        """ Time of current key frame: time of previous key frame plus PTS difference (or arrival time difference) """
+        if state.last_t is None:
+            return 0.0
+        if state.pts is not None and state.last_pts is not None:
+            step = (state.pts - state.last_pts) % PTS_WRAP / PTS_CLOCK
+            if step <= MAX_PTS_STEP_S:
+                return state.last_t + step
+        return state.last_t + max((state.dt - state.last_dt).total_seconds(), 0.0)
+
+    def report(self, final=False) -> list:
+        """
+        Detection results since previous report
+
+        :param final: If True events and key frame sizes since start are reported
+        :return: list of {'pid', 'key_frames', 'key_frame_bytes' ({min, max, mean} since previous report), 'frozen',
+                 'frozen_s', 'freeze_events', 'black', 'black_s', 'black_events'} or None if there are no video PIDs
+        """
+        if len(self.__streams) == 0:
+            return None
+        result = list()
+        for pid, state in sorted(self.__streams.items()):
+            sizes = _merge_sizes(list(state.sizes_total), state.sizes) if final else state.sizes
+            key_frames = state.key_frames if final else state.key_frames - state.reported_key_frames
+            pid_result = {'pid': pid, 'key_frames': key_frames,
+                          'key_frame_bytes': ({'min': sizes[0], 'max': sizes[1], 'mean': round(sizes[2] / sizes[3])}
+                                              if sizes[3] > 0 else None)}
+            for name, condition in (('frozen', state.frozen), ('black', state.black)):
+                pid_result[name] = condition.active
+                pid_result[name + '_s'] = condition.duration_s(state.last_t)
+                pid_result[('freeze' if name == 'frozen' else name) + '_events'] = (
+                    condition.events if final else condition.events - condition.reported_events)
+                if not final:
+                    condition.reported_events = condition.events
+            if not final:
+                state.reported_key_frames = state.key_frames
+                _merge_sizes(state.sizes_total, state.sizes)
+                state.sizes = [0, 0, 0, 0]
+            result.append(pid_result)
+        return result
+
+    def get_totals(self) -> list:
+        """
+        :return: detection results with events since start (see report)
+        """
+        return self.report(final=True)
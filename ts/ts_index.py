@@ -0,0 +1,324 @@
+"""
+Sidecar index of recorded TS-files (<file>.idx, JSON). The file is split into blocks of block_packets TS packets; for
+each block the index keeps byte offset, stream time of its first byte, PCR anchors (offset and stream time of each PCR
+packet of the reference PCR PID), first PCR and PTS, random access and PES start positions, PSI versions in force with
+offsets of the last PAT/CAT/SDT/PMT packets before the block and CC state of each PID. Stream time of any byte is
+interpolated between PCR anchors. TS-file can then be analyzed from any packet with correct PSI and CC state, for a
+time range and/or PIDs only, without parsing the file from the start (see tsfile_reader). The file is accessed
+through mmap
+"""
+import argparse
+import bisect
+import json
+import mmap
+import os
+
+from ts.ts_parser import TSParser
+from ts.ts_pcr import PCR_CLOCK, PCR_WRAP
+
+INDEX_VERSION = 2
+BLOCK_PACKETS = 4096                # ~0.8 s of 8 Mbit/s stream
+MAX_PCR_STEP = PCR_CLOCK * 10       # Larger PCR steps (discontinuities) do not advance stream time
+PSI_PIDS = (0, 1, 17)               # PAT, CAT, SDT/BAT
+MAX_PSI_PACKETS = 32                # Maximum packets of one PSI section kept for priming
+
+
+def index_path(path: str) -> str:
+    return path + '.idx'
+
+
+class TSIndex:
+    """ Class for building, storing and using sidecar index of TS-file """
+    def __init__(self, path: str, psize=188, block_packets=BLOCK_PACKETS, blocks=None, size=0):
+        """
+        Initialize object
+
+        :param path: Path to TS-file
+        :param psize: TS packet size
+        :param block_packets: Number of TS packets per block
+        :param blocks: List of block entries (see build)
+        :param size: Size of indexed TS-file (index is rebuilt if the file size is changed)
+        """
+        self.path = path
+        self.psize = psize
+        self.block_packets = block_packets
+        self.blocks = blocks if blocks is not None else list()
+        self.size = size
+        self.__times = [block['time_s'] for block in self.blocks]
+        self.__anchor_offsets = [offset for block in self.blocks for offset, time_s in block['pcrs']]
+        self.__anchor_times = [time_s for block in self.blocks for offset, time_s in block['pcrs']]
+
+    @classmethod
+    def build(cls, path: str, psize=188, block_packets=BLOCK_PACKETS) -> 'TSIndex':
+        """
+        Scan TS-file and build its index
+
+        :param path: Path to TS-file
+        :param psize: TS packet size
+        :param block_packets: Number of TS packets per block
+        :return: TSIndex object
+        """
+        parser = TSParser(psize=psize)
+        blocks = list()
+        cc = dict()                 # pid -> last continuity counter
+        psi_packets = dict()        # pid -> offsets of packets of the last PSI section (from PUSI packet)
+        versions = {'pat': None, 'pmt': dict()}
+        pmt_pids = set()
+        stream_pids = set()
+        pcr_pid = None
+        last_pcr = None
+        time_s = 0.0
+        block = None
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            for index in range(size // psize):
+                offset = index * psize
+                if index % block_packets == 0:
+                    block = {'offset': offset, 'packet': index, 'time_s': None, 'pcrs': list(), 'pcr': None,
+                             'pts': None, 'rai': list(), 'pusi': dict(), 'psi': {'pat': versions['pat'],
+                                                                                 'pmt': dict(versions['pmt'])},
+                             'psi_packets': sorted(o for offsets in psi_packets.values() for o in offsets),
+                             'cc': dict(cc)}
+                    blocks.append(block)
+                if mm[offset] != 0x47:
+                    continue
+                b1, b2, b3 = mm[offset + 1], mm[offset + 2], mm[offset + 3]
+                pid = ((b1 & 0x1F) << 8) | b2
+                pusi = b1 & 0x40
+                afc = (b3 >> 4) & 3
+                if afc & 1 and pid != 8191:
+                    cc[pid] = b3 & 15
+                payload = offset + 4
+                if afc & 2:
+                    af_length = mm[offset + 4]
+                    payload = offset + 5 + af_length
+                    if af_length > 0:
+                        flags = mm[offset + 5]
+                        if flags & 0x40:
+                            block['rai'].append(offset)
+                        if flags & 0x10 and pid == pcr_pid:
+                            b = mm[offset + 6:offset + 12]
+                            pcr = ((b[0] << 25 | b[1] << 17 | b[2] << 9 | b[3] << 1 | b[4] >> 7) * 300
+                                   + ((b[4] & 1) << 8 | b[5]))
+                            if last_pcr is not None:
+                                step = (pcr - last_pcr) % PCR_WRAP
+                                time_s += step / PCR_CLOCK if step < MAX_PCR_STEP else 0
+                            last_pcr = pcr
+                            if block['pcr'] is None:
+                                block['pcr'] = pcr
+                            block['pcrs'].append([offset, round(time_s, 9)])
+                if pid in PSI_PIDS or pid in pmt_pids:
+                    if pusi:
+                        psi_packets[pid] = [offset]
+                        if pid == 0 or pid in pmt_pids:
+                            pcr_pid = cls.__decode_psi(parser, mm, pid, payload, offset + psize, versions, pmt_pids,
+                                                       stream_pids, pcr_pid)
+                    elif pid in psi_packets and len(psi_packets[pid]) < MAX_PSI_PACKETS:
+                        psi_packets[pid].append(offset)
+                elif pusi and pid in stream_pids:
+                    if pid not in block['pusi']:
+                        block['pusi'][pid] = offset
+                    if block['pts'] is None and mm[payload:payload + 3] == b'\x00\x00\x01' and mm[payload + 7] & 0x80:
+                        b = mm[payload + 9:payload + 14]
+                        block['pts'] = {'pid': pid, 'pts': ((b[0] >> 1) & 7) << 30 | b[1] << 22 | (b[2] >> 1) << 15
+                                        | b[3] << 7 | b[4] >> 1}
+        index = cls(path, psize=psize, block_packets=block_packets, blocks=blocks, size=size)
+        # Time of the block start is interpolated (extrapolated) from PCR anchors around it
+        for block in blocks:
+            block['time_s'] = round(index.time_at(block['offset']), 9)
+        return cls(path, psize=psize, block_packets=block_packets, blocks=blocks, size=size)
+
+    @staticmethod
+    def __decode_psi(parser: TSParser, mm, pid: int, payload: int, end: int, versions: dict, pmt_pids: set,
+                     stream_pids: set, pcr_pid):
+        # Tables are decoded only when section version is changed
+        section = payload + 1 + mm[payload]
+        if section + 6 > end:
+            return pcr_pid
+        version = (mm[section + 5] >> 1) & 31
+        if pid == 0:
+            if version == versions['pat']:
+                return pcr_pid
+            pat = parser.decode_pat(mm[payload:end])
+            if pat is not None and pat.crc32_ok:
+                versions['pat'] = version
+                pmt_pids.clear()
+                pmt_pids.update(prog['program_map_PID'] for prog in pat.prog_nums if prog['program_number'] != 0)
+        elif version != versions['pmt'].get(pid):
+            pmt = parser.decode_pmt(mm[payload:end], pid)
+            if pmt is not None and pmt.crc32_ok:
+                versions['pmt'][pid] = version
+                stream_pids.update(stream['elementary_pid'] for stream in pmt.streams)
+                # Stream time is measured by PCR of the first program
+                return pmt.pcr_pid if pcr_pid is None else pcr_pid
+        return pcr_pid
+
+    def save(self, path=None):
+        """
+        :param path: Index file path. Default is <TS-file>.idx
+        """
+        with open(path if path is not None else index_path(self.path), 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'size': self.size, 'psize': self.psize,
+                       'block_packets': self.block_packets, 'blocks': self.blocks}, f)
+
+    @classmethod
+    def load(cls, path: str, index_file=None) -> 'TSIndex':
+        """
+        :param path: Path to TS-file
+        :param index_file: Index file path. Default is <TS-file>.idx
+        :return: TSIndex object or None if index does not exist or does not match the file
+        """
+        try:
+            with open(index_file if index_file is not None else index_path(path)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != INDEX_VERSION or data.get('size') != os.path.getsize(path):
+            return None
+        for block in data['blocks']:
+            # JSON object keys are strings
+            block['cc'] = {int(pid): cc for pid, cc in block['cc'].items()}
+            block['pusi'] = {int(pid): offset for pid, offset in block['pusi'].items()}
+            block['psi']['pmt'] = {int(pid): version for pid, version in block['psi']['pmt'].items()}
+        return cls(path, psize=data['psize'], block_packets=data['block_packets'], blocks=data['blocks'],
+                   size=data['size'])
+
+    @classmethod
+    def open(cls, path: str, psize=188) -> 'TSIndex':
+        """ Load index of TS-file or build and save it if it does not exist or is outdated """
+        index = cls.load(path)
+        if index is None or index.psize != psize:
+            index = cls.build(path, psize=psize)
+            try:
+                index.save()
+            except OSError:
+                pass
+        return index
+
+    def time_at(self, offset: int) -> float:
+        """
+        :param offset: Byte offset in TS-file
+        :return: Stream time in seconds of the byte, linearly interpolated between the nearest PCR anchors (0 if the
+                 file has less than two PCR anchors)
+        """
+        offsets, times = self.__anchor_offsets, self.__anchor_times
+        if len(offsets) < 2:
+            return times[0] if len(times) > 0 else 0.0
+        i = min(max(bisect.bisect_right(offsets, offset), 1), len(offsets) - 1)
+        o0, o1, t0, t1 = offsets[i - 1], offsets[i], times[i - 1], times[i]
+        return t0 + (offset - o0) * (t1 - t0) / (o1 - o0)
+
+    def locate(self, mm, time_s=None) -> tuple:
+        """
+        Find the first TS packet not earlier than time_s
+
+        :param mm: mmap (or bytes) of TS-file
+        :param time_s: Stream time in seconds. Default is the file start
+        :return: (block number, packet offset, stream time of the packet, CC state of PIDs before the packet)
+        """
+        if len(self.blocks) == 0:
+            return 0, 0, 0.0, dict()
+        block = self.find_block(time_s) if time_s is not None else 0
+        cc = dict(self.blocks[block]['cc'])
+        offset = self.blocks[block]['offset']
+        end = len(mm) - len(mm) % self.psize
+        # Packets skipped inside the block update CC state only
+        while time_s is not None and offset < end and self.time_at(offset) < time_s:
+            if mm[offset] == 0x47 and mm[offset + 3] & 0x10:
+                pid = ((mm[offset + 1] & 0x1F) << 8) | mm[offset + 2]
+                if pid != 8191:
+                    cc[pid] = mm[offset + 3] & 15
+            offset += self.psize
+        return block, offset, self.time_at(offset), cc
+
+    def find_block(self, time_s: float) -> int:
+        """
+        :param time_s: Stream time in seconds from the first PCR
+        :return: Number of the last block starting not later than time_s
+        """
+        return max(0, bisect.bisect_right(self.__times, time_s) - 1)
+
+    def prime_data(self, mm, block: int, end=None) -> bytes:
+        """
+        :param mm: mmap (or bytes) of TS-file
+        :param block: Block number
+        :param end: Offset of the first analyzed packet inside the block (see locate). Default is the block start
+        :return: list of (byte offset, packet) of the last PAT/CAT/SDT/PMT packets before the block and PAT/CAT/SDT/PMT
+                 packets of the block before end in file order (to be read before the analyzed part at their stream
+                 times, see TSReader.prime)
+        """
+        psize = self.psize
+        entry = self.blocks[block]
+        offsets = list(entry['psi_packets'])
+        psi_pids = set(PSI_PIDS) | set(entry['psi']['pmt'])
+        for offset in range(entry['offset'], end if end is not None else entry['offset'], psize):
+            if ((mm[offset + 1] & 0x1F) << 8 | mm[offset + 2]) in psi_pids:
+                offsets.append(offset)
+        return [(offset, mm[offset:offset + psize]) for offset in offsets]
+
+    def read_range(self, mm, start_s=None, end_s=None, pids=None, chunksize=7, start=None):
+        """
+        Iterate over TS data of time range. Each PCR anchor starts a new chunk, so PCR packets are timed exactly
+
+        :param mm: mmap (or bytes) of TS-file
+        :param start_s: Start stream time in seconds. Default is the file start
+        :param end_s: End stream time in seconds. Default is the file end
+        :param pids: Set of PIDs to be read (PSI/SI and PMT PIDs are always read). Default is all PIDs
+        :param chunksize: Maximum number of TS packets yielded at once
+        :param start: Offset of the first packet (see locate). Default is located by start_s
+        :return: iterator of (TS data, stream time in seconds of its first packet, byte offset of its first packet)
+                 tuples. Packets of TS data are adjacent in the file
+        """
+        psize = self.psize
+        if start is None:
+            start = self.locate(mm, start_s)[1]
+        end = len(mm) - len(mm) % psize
+        keep = None
+        if pids is not None:
+            first = self.find_block(start_s) if start_s is not None else 0
+            last = bisect.bisect_right(self.__times, end_s) if end_s is not None else len(self.blocks)
+            keep = set(pids) | set(range(32))
+            for block in self.blocks[first:last]:
+                keep.update(block['psi']['pmt'])
+        anchors = self.__anchor_offsets
+        anchor = bisect.bisect_right(anchors, start)
+        offset = start
+        while offset < end:
+            time_s = self.time_at(offset)
+            if end_s is not None and time_s > end_s:
+                break
+            chunk_end = min(end, offset + psize * chunksize)
+            if anchor < len(anchors) and anchors[anchor] < chunk_end:
+                chunk_end = anchors[anchor]
+                anchor += 1
+            if keep is None:
+                yield mm[offset:chunk_end], time_s, offset
+            else:
+                # Filtered chunk is split into runs of adjacent packets, so each run keeps its file offset
+                run = None
+                for pos in range(offset, chunk_end, psize):
+                    if ((mm[pos + 1] & 0x1F) << 8 | mm[pos + 2]) in keep:
+                        if run is None:
+                            run = pos
+                    elif run is not None:
+                        yield mm[run:pos], self.time_at(run), run
+                        run = None
+                if run is not None:
+                    yield mm[run:chunk_end], self.time_at(run), run
+            offset = chunk_end
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build sidecar index of TS-file')
+    parser.add_argument('source_file', help='full path to TS-file')
+    parser.add_argument('-b', '--block_packets', nargs='?', type=int, default=BLOCK_PACKETS,
+                        help='number of TS packets per index block')
+    args = parser.parse_args()
+    index = TSIndex.build(args.source_file, block_packets=args.block_packets)
+    index.save()
+    print('{}: {} blocks, {:.3f} s'.format(index_path(args.source_file), len(index.blocks),
+                                           index.blocks[-1]['time_s'] if len(index.blocks) > 0 else 0))
+
+
+if __name__ == '__main__':
+    main()
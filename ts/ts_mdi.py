@@ -0,0 +1,119 @@
+import array
+import bisect
+
+"""
+RFC 4445 - A Proposed Media Delivery Index (MDI)
+    DF  - Delay Factor: maximum difference between arrival of media data and its drain at media rate (virtual buffer
+          model), i.e. the buffer (in ms) needed to absorb network jitter
+    MLR - Media Loss Rate: number of lost media (TS) packets per second
+"""
+
+# Upper bounds (ms) of inter-arrival time histogram bins. The last bin counts everything above the last bound
+IAT_BOUNDS_MS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class MdiAnalyzer:
+    """
+    Class for network layer analysis of one group: datagram inter-arrival time histogram, MDI delay factor and media
+    loss rate. Each datagram is processed in O(1) with fixed-size histogram array. Arrival times can be taken from live
+    socket or pcap timestamps
+    """
+    def __init__(self, media_rate_bps=None, iat_bounds_ms=IAT_BOUNDS_MS):
+        """
+        Initialize object
+
+        :param media_rate_bps: Nominal media rate for virtual buffer drain. If None the rate measured during
+                               previous interval is used (DF is not available for the first interval)
+        :param iat_bounds_ms: Upper bounds of inter-arrival time histogram bins in milliseconds
+        """
+        self.media_rate_bps = media_rate_bps
+        self.iat_bounds_ms = tuple(iat_bounds_ms)
+        self.__hist = array.array('I', bytes(4 * (len(self.iat_bounds_ms) + 1)))
+        self.__last_t = None
+        self.__rate = None              # Drain rate (bytes/s)
+        self.__vb = 0.0                 # Virtual buffer size after last datagram (bytes)
+        self.__vb_t = None              # Time of last virtual buffer update
+        self.__interval_start = None
+        self.__reset_interval()
+
+    def __reset_interval(self):
+        self.__datagrams = 0
+        self.__bytes = 0
+        self.__lost = 0
+        self.__iat_sum = 0.0
+        self.__iat_count = 0
+        self.__iat_min = None
+        self.__iat_max = None
+        self.__vb_min = self.__vb
+        self.__vb_max = self.__vb
+        for i in range(len(self.__hist)):
+            self.__hist[i] = 0
+
+    def datagram(self, t: float, size: int):
+        """
+        Account received datagram
+
+        :param t: Arrival time in seconds (e.g. UNIX timestamp)
+        :param size: Media payload size in bytes (TS packets)
+        """
+        if self.__interval_start is None:
+            self.__interval_start = t
+        if self.__last_t is not None:
+            iat = t - self.__last_t
+            iat_ms = iat * 1000
+            self.__hist[bisect.bisect_left(self.iat_bounds_ms, iat_ms)] += 1
+            self.__iat_sum += iat
+            self.__iat_count += 1
+            if self.__iat_min is None or iat < self.__iat_min:
+                self.__iat_min = iat
+            if self.__iat_max is None or iat > self.__iat_max:
+                self.__iat_max = iat
+        self.__last_t = t
+
+        # Virtual buffer: filled by arrivals, drained at media rate
+        rate = self.media_rate_bps / 8 if self.media_rate_bps is not None else self.__rate
+        if rate is not None and self.__vb_t is not None:
+            vb = self.__vb - rate * (t - self.__vb_t)
+            if vb < self.__vb_min:
+                self.__vb_min = vb
+            vb += size
+            if vb > self.__vb_max:
+                self.__vb_max = vb
+            self.__vb = vb
+        self.__vb_t = t
+        self.__datagrams += 1
+        self.__bytes += size
+
+    def lost(self, packets: int):
+        """
+        Account lost media packets (e.g. detected by continuity counter gaps)
+
+        :param packets: Number of lost TS packets
+        """
+        self.__lost += packets
+
+    def report(self) -> dict:
+        """
+        Results of the interval since previous report
+
+        :return: dictionary with datagrams, DF_ms, MLR (packets/s), iat_ms (min/mean/max) and iat_hist (counts per
+                 bin, see iat_bounds_ms)
+        """
+        duration = (self.__last_t - self.__interval_start) if self.__last_t is not None else 0
+        rate = self.media_rate_bps / 8 if self.media_rate_bps is not None else self.__rate
+        result = {'datagrams': self.__datagrams,
+                  'DF_ms': (round((self.__vb_max - self.__vb_min) / rate * 1000, 3)
+                            if rate and self.__datagrams > 0 else None),
+                  'MLR': round(self.__lost / duration, 3) if duration > 0 else None,
+                  'iat_ms': {'min': None if self.__iat_min is None else round(self.__iat_min * 1000, 3),
+                             'mean': (round(self.__iat_sum / self.__iat_count * 1000, 3) if self.__iat_count > 0
+                                      else None),
+                             'max': None if self.__iat_max is None else round(self.__iat_max * 1000, 3)},
+                  'iat_hist': self.__hist.tolist()}
+        # Measured rate drains the virtual buffer during next interval
+        if duration > 0:
+            self.__rate = self.__bytes / duration
+        self.__interval_start = self.__last_t
+        self.__vb = 0.0
+        self.__reset_interval()
+        return result
@@ -1,85 +1,98 @@
+import datetime
 import struct
 from models import *
+from ts.ts_descriptors import DescriptorList, decode_text
 import logging
 
 
+def decode_utc_time(data: bytes) -> datetime.datetime:
+    """
+    Decode UTC time and date coded as 16 LSBs of Modified Julian Date followed by 6 digits in BCD (EN 300 468 Annex C)
+
+    :param data: 5 bytes
+    :return: datetime or None if all bits are set (undefined)
+    """
+    if data == b'\xFF\xFF\xFF\xFF\xFF':
+        return None
+    mjd = (data[0] << 8) | data[1]
+    return (datetime.datetime(1858, 11, 17) + datetime.timedelta(days=mjd, seconds=decode_bcd_duration(data[2:5])))
+
+
+def decode_bcd_duration(data: bytes) -> int:
+    """
+    Decode duration coded as 6 digits in BCD (hours, minutes, seconds)
+
+    :param data: 3 bytes
+    :return: duration in seconds
+    """
+    h, m, s = ((b >> 4) * 10 + (b & 15) for b in data[0:3])
+    return h * 3600 + m * 60 + s
+
+
 class DescriptorParser:
     @staticmethod
-    def decode_descriptors(pk: bytes) -> list:
-        pos = 0
-        pos2 = len(pk)
-        descriptors = list()
-        while pos < pos2:
-            descriptor_tag, descriptor_length = struct.unpack('>BB', pk[pos:pos+2])
-            pos += 2
-            if descriptor_tag == 9:  # CA_descriptor
-                ca_system_id, ca_pid = struct.unpack('>HH', pk[pos:pos+4])
-                ca_pid = ca_pid & 8191
-                descriptors.append({'descriptor_tag': descriptor_tag,
-                                    'descriptor_data': {'ca_system_id': ca_system_id, 'ca_pid': ca_pid,
-                                             'private_data': pk[pos+4:pos+descriptor_length]}})
-                pos += descriptor_length
-            elif descriptor_tag == 65:  # service_list_descriptor
-                service_list = list()
-                pos3 = pos + descriptor_length
-                while pos < pos3:
-                    service_id, service_type = struct.unpack('>HB', pk[pos:pos+3])
-                    pos += 3
-                    service_list.append({'service_id': service_id, 'service_type': service_type})
-                descriptors.append({'descriptor_tag': descriptor_tag,
-                                    'descriptor_data': {'service_list': service_list}})
-            elif descriptor_tag == 71:  # bouquet_name_descriptor
-                descriptors.append({'descriptor_tag': descriptor_tag,
-                                    'descriptor_data': {'bouquet_name': DescriptorParser.decode_text(pk[pos:pos+descriptor_length])}})
-            elif descriptor_tag == 72:  # service_descriptor
-                service_type, length = struct.unpack('>BB', pk[pos:pos+2])
-                if length > 0:
-                    service_provider_name = DescriptorParser.decode_text(pk[pos+2:pos+2+length])
-                else:
-                    service_provider_name = None
-                pos += 2 + length
-                length = pk[pos]
-                if length > 0:
-                    service_name = DescriptorParser.decode_text(pk[pos+1:pos+1+length])
-                else:
-                    service_name = None
-                pos += 1 + length
-                descriptors.append({'descriptor_tag': descriptor_tag, 'descriptor_data': {'service_type': service_type,
-                                    'service_provider_name': service_provider_name, 'service_name': service_name}})
-            elif descriptor_tag == 83:  # CA_identifier_descriptor
-                ca_system_id = list()
-                pos3 = pos + descriptor_length
-                while pos < pos3:
-                    ca_system_id.append(struct.unpack('>H', pk[pos:pos + 2])[0])
-                    pos += 2
-                descriptors.append({'descriptor_tag': descriptor_tag,
-                                    'descriptor_data': {'ca_system_id': ca_system_id}})
-            else:
-                descriptors.append({'descriptor_tag': descriptor_tag, 'descriptor_data': pk[pos:pos+descriptor_length]})
-                pos += descriptor_length
-        return descriptors
+    def decode_descriptors(pk: bytes, start=0, end=None) -> DescriptorList:
+        """
+        Decode descriptor loop. Descriptors are decoded lazily on access (see ts_descriptors)
+
+        :param pk: Bytes containing descriptor loop (section or packet bytes)
+        :param start: Position of descriptor loop
+        :param end: Position after descriptor loop (end of pk if None)
+        :return: list of descriptors accessed as {'descriptor_tag', 'descriptor_data'}
+        """
+        return DescriptorList(pk, start, end)
 
     @staticmethod
     def decode_text(pk: bytes):
-        if pk[0] in range(1, 11):
-            return pk[1:].decode('iso-8859-'+str(pk[0]+4))
-        else:
-            return pk
+        return decode_text(pk)
 
 
 class TSParser:
     """ Class for parsing TS packets """
-    def __init__(self, psize=188):
+    def __init__(self, psize=188, anomalies=None):
         """
         Initialize the object
 
         :param psize: TS packet size. Default is 188 bytes
+        :param anomalies: AnomalyCounter object for aggregated error logging. If None each error is logged
         """
         self.__psize = psize
+        self.anomalies = anomalies
         self.__resync = 0
         self.__pid_17_buffer = None
         self.__pmt_buffer = None
 
+    def get_state(self) -> dict:
+        """
+        :return: State of the parser for checkpoint (see ts_checkpoint): resync offset and incomplete sections
+        """
+        return {'resync': self.__resync,
+                'pid_17_buffer': dict(self.__pid_17_buffer) if self.__pid_17_buffer is not None else None,
+                'pmt_buffer': dict(self.__pmt_buffer) if self.__pmt_buffer is not None else None}
+
+    def set_state(self, state: dict, live=False):
+        """
+        :param state: State returned by get_state
+        :param live: If True the stream is resumed after a gap, so incomplete sections are dropped
+        """
+        self.__resync = state['resync']
+        if not live:
+            self.__pid_17_buffer = state['pid_17_buffer']
+            self.__pmt_buffer = state['pmt_buffer']
+
+    def _warning(self, pid: int, kind: str, msg: str):
+        """
+        Report parsing error to AnomalyCounter (if set) or log it directly
+
+        :param pid: PID of packet which caused the error (-1 if unknown)
+        :param kind: Short error name
+        :param msg: Full error message
+        """
+        if self.anomalies is not None:
+            self.anomalies.count(pid, kind, msg)
+        else:
+            logging.warning(msg)
+
     def parse(self, data: bytes, parse_ts=True) -> tuple:
         """
         Find the TS packets in bytes array and parse TS header if parse_ts=True. Returns each found TS packet one by one
@@ -148,8 +161,7 @@ class TSParser:
                         p.af_pcr = ((b14 << 1) + (b56 >> 15)) * 300 + (b56 & 511)
                         pos += 6
                     if p.af_opcrf:
-                        # p.af_opcr = packet[pos:(pos+6)]
-                        b14, b56 = struct.unpack('>LH', packet[6:12])
+                        b14, b56 = struct.unpack('>LH', packet[pos:(pos+6)])
                         p.af_opcr = ((b14 << 1) + (b56 >> 15)) * 300 + (b56 & 511)
                         pos += 6
                     if p.af_spf:
@@ -171,7 +183,7 @@ class TSParser:
                 p.payload = 5 + p.af_length
             return p
         except Exception as err:
-            logging.warning('TS packet parsing error:' + str(err))
+            self._warning(-1, 'ts_parsing_error', 'TS packet parsing error:' + str(err))
             return None
 
     def decode_pat(self, pat: bytes) -> PAT.PAT:
@@ -194,7 +206,7 @@ class TSParser:
             patdk.sec_num = pat[pos+6]
             patdk.last_sec_num = pat[pos+7]
             pos += 8
-            for i in range(int((section_length-9)/2)-1):
+            for i in range((section_length - 9) // 4):   # 4 bytes per program, without header and CRC
                 program_number, b34 = struct.unpack('>HH', pat[pos:pos+4])
                 p = b34 & 8191
                 if program_number == 0:
@@ -209,17 +221,18 @@ class TSParser:
                     patdk.crc32_ok = False
             except Exception as err:
                 patdk.crc32_ok = False
-                logging.warning('CAT CRC check error:' + str(err))
+                self._warning(0, 'crc_check_error', 'PAT CRC check error:' + str(err))
             return patdk
         except Exception as err:
-            logging.warning('PAT parsing error:' + str(err))
+            self._warning(0, 'pat_parsing_error', 'PAT parsing error:' + str(err))
             return None
 
-    def decode_pmt(self, pmt: bytes) -> PMT.PMT:
+    def decode_pmt(self, pmt: bytes, pid=-1) -> PMT.PMT:
         """
         Decode Program Map Table (PMT)
 
         :param pmt: PMT packet bytes
+        :param pid: PID of PMT packet (used for anomaly reporting only)
         :return: return decoded PMT object
         """
         pmtdk = None
@@ -231,23 +244,24 @@ class TSParser:
                 if section_length > (len(pmt)-3-p):
                     self.__pmt_buffer = {'section_length': section_length, 'buffer': pmt}
                 else:
-                    pmtdk = self._decode_pmt(pmt)
+                    pmtdk = self._decode_pmt(pmt, pid)
             else:
                 if self.__pmt_buffer['section_length'] > (len(self.__pmt_buffer['buffer']) + len(pmt)):
                     self.__pmt_buffer['buffer'] += pmt
                 else:
                     self.__pmt_buffer['buffer'] += pmt
-                    pmtdk = self._decode_pmt(self.__pmt_buffer['buffer'])
+                    pmtdk = self._decode_pmt(self.__pmt_buffer['buffer'], pid)
                     self.__pmt_buffer = None
         except Exception as err:
-            logging.warning('PMT parsing error:' + str(err))
+            self._warning(pid, 'pmt_parsing_error', 'PMT parsing error:' + str(err))
         return pmtdk
 
-    def _decode_pmt(self, pmt: bytes) -> PMT.PMT:
+    def _decode_pmt(self, pmt: bytes, pid=-1) -> PMT.PMT:
         """
         Internal method for Decode Program Map Table (PMT)
 
         :param pmt: PMT packet bytes
+        :param pid: PID of PMT packet (used for anomaly reporting only)
         :return: return decoded PMT object
         """
         pmtdk = PMT.PMT()
@@ -268,7 +282,7 @@ class TSParser:
             #pos += 12 + prog_info_length  # skip descriptor
             pos += 12
             if prog_info_length > 0:
-                pmtdk.descriptors = DescriptorParser.decode_descriptors(pmt[pos:pos+prog_info_length])
+                pmtdk.descriptors = DescriptorParser.decode_descriptors(pmt, pos, pos+prog_info_length)
             pos += prog_info_length
             while pos < pos_crc:
                 stream_type, elementary_pid, es_info_length = struct.unpack('>BHH', pmt[pos:pos+5])
@@ -283,10 +297,10 @@ class TSParser:
                     pmtdk.crc32_ok = False
             except Exception as err:
                 pmtdk.crc32_ok = False
-                logging.warning('PMT CRC check error:' + str(err))
+                self._warning(pid, 'crc_check_error', 'PMT CRC check error:' + str(err))
             return pmtdk
         except Exception as err:
-            logging.warning('PMT parsing error:' + str(err))
+            self._warning(pid, 'pmt_parsing_error', 'PMT parsing error:' + str(err))
             return None
 
     def decode_cat(self, cat: bytes) -> CAT.CAT:
@@ -311,7 +325,7 @@ class TSParser:
             catdk.last_sec_num = cat[pos+7]
             pos += 8
             if pos < pos_crc:
-                catdk.descriptors = DescriptorParser.decode_descriptors(cat[pos:pos_crc])
+                catdk.descriptors = DescriptorParser.decode_descriptors(cat, pos, pos_crc)
             try:
                 catdk.crc32 = (struct.unpack('>L', cat[pos_crc:pos_crc + 4]))[0]
                 crc_check = self.crc32mpeg2(cat[1+pointer_field:pos_crc])
@@ -319,10 +333,10 @@ class TSParser:
                     catdk.crc32_ok = False
             except Exception as err:
                 catdk.crc32_ok = False
-                logging.warning('CAT CRC check error:' + str(err))
+                self._warning(1, 'crc_check_error', 'CAT CRC check error:' + str(err))
             return catdk
         except Exception as err:
-            logging.warning('CAT parsing error:' + str(err))
+            self._warning(1, 'cat_parsing_error', 'CAT parsing error:' + str(err))
             return None
 
     def decode_pid_17(self, pk: bytes, parse_SDT=False, parse_BAT=False) -> dict:
@@ -382,7 +396,7 @@ class TSParser:
                             bat.crc32_ok = self._check_crc32_only(self.__pid_17_buffer['buffer'])
                     self.__pid_17_buffer = None
         except Exception as err:
-            logging.warning('PID 17 parsing error:' + str(err))
+            self._warning(17, 'pid_17_parsing_error', 'PID 17 parsing error:' + str(err))
         return {'sdt': sdt, 'bat': bat}
 
     def _decode_sdt(self, sdt: bytes) -> SDT.SDT:
@@ -415,7 +429,7 @@ class TSParser:
                 pos += 5
                 descriptors = []
                 if descriptors_loop_length > 0:
-                    descriptors = DescriptorParser.decode_descriptors(sdt[pos:pos+descriptors_loop_length])
+                    descriptors = DescriptorParser.decode_descriptors(sdt, pos, pos+descriptors_loop_length)
                     pos += descriptors_loop_length
                 sdtdk.services.append({'service_id': service_id, 'EIT_schedule_flag': EIT_schedule_flag,
                                        'EIT_present_following_flag': EIT_present_following_flag,
@@ -428,10 +442,10 @@ class TSParser:
                     sdtdk.crc32_ok = False
             except Exception as err:
                 sdtdk.crc32_ok = False
-                logging.warning('SDT CRC check error:' + str(err))
+                self._warning(17, 'crc_check_error', 'SDT CRC check error:' + str(err))
             return sdtdk
         except Exception as err:
-            logging.warning('SDT parsing error:' + str(err))
+            self._warning(17, 'sdt_parsing_error', 'SDT parsing error:' + str(err))
             return None
 
     def _decode_bat(self, bat: bytes) -> BAT.BAT:
@@ -450,7 +464,7 @@ class TSParser:
             descriptors_length = b12 & 4095
             pos += 10
             if descriptors_length > 0:
-                batdk.descriptors = DescriptorParser.decode_descriptors(bat[pos:pos + descriptors_length])
+                batdk.descriptors = DescriptorParser.decode_descriptors(bat, pos, pos + descriptors_length)
                 pos += descriptors_length
             b12 = struct.unpack('>H', bat[pos:pos+2])[0]
             pos += 2
@@ -461,7 +475,7 @@ class TSParser:
                 pos += 6
                 descriptors = []
                 if descriptors_loop_length > 0:
-                    descriptors = DescriptorParser.decode_descriptors(bat[pos:pos+descriptors_loop_length])
+                    descriptors = DescriptorParser.decode_descriptors(bat, pos, pos+descriptors_loop_length)
                     pos += descriptors_loop_length
                 batdk.transport_streams.append({'transport_stream_id': transport_stream_id,
                                                 'original_network_id': original_network_id, 'descriptors': descriptors})
@@ -472,10 +486,10 @@ class TSParser:
                     batdk.crc32_ok = False
             except Exception as err:
                 batdk.crc32_ok = False
-                logging.warning('BAT CRC check error:' + str(err))
+                self._warning(17, 'crc_check_error', 'BAT CRC check error:' + str(err))
             return batdk
         except Exception as err:
-            logging.warning('BAT parsing error:' + str(err))
+            self._warning(17, 'bat_parsing_error', 'BAT parsing error:' + str(err))
             return None
 
     def _check_crc32_only(self, pk: bytes) -> bool:
@@ -490,14 +504,126 @@ class TSParser:
             if crc32 == crc_check:
                 crc32_ok = True
         except Exception as err:
-            logging.warning('CRC check error:' + str(err))
+            self._warning(17, 'crc_check_error', 'CRC check error:' + str(err))
         return crc32_ok
 
-    def decode_pes(self, pes: bytes)-> PES.PES:
+    def _check_section_crc32(self, section: bytes, obj, pid: int, name: str):
+        """ Set crc32 and crc32_ok of decoded table object from complete section bytes """
+        try:
+            obj.crc32 = struct.unpack('>L', section[-4:])[0]
+            obj.crc32_ok = obj.crc32 == self.crc32mpeg2(section[:-4])
+        except Exception as err:
+            obj.crc32_ok = False
+            self._warning(pid, 'crc_check_error', name + ' CRC check error:' + str(err))
+
+    def decode_nit(self, section: bytes, pid=16) -> NIT.NIT:
+        """
+        Decode Network Information Table (NIT)
+
+        :param section: Complete section bytes starting from table_id (see ts_section.SectionAssembler)
+        :param pid: PID of NIT (used for anomaly reporting only)
+        :return: return decoded NIT object
+        """
+        nitdk = NIT.NIT()
+        try:
+            nitdk.table_id = section[0]
+            section_length, nitdk.network_id = struct.unpack('>HH', section[1:5])
+            pos_crc = 3 + (section_length & 4095) - 4
+            b = section[5]
+            nitdk.ver_num = (b & 62) >> 1
+            nitdk.cur_next_ind = b & 1
+            nitdk.sec_num, nitdk.last_sec_num, b12 = struct.unpack('>BBH', section[6:10])
+            pos = 10
+            descriptors_length = b12 & 4095
+            if descriptors_length > 0:
+                nitdk.descriptors = DescriptorParser.decode_descriptors(section, pos, pos + descriptors_length)
+            pos += descriptors_length
+            transport_stream_loop_end = pos + 2 + (struct.unpack('>H', section[pos:pos + 2])[0] & 4095)
+            pos += 2
+            while pos < min(transport_stream_loop_end, pos_crc):
+                transport_stream_id, original_network_id, b12 = struct.unpack('>HHH', section[pos:pos + 6])
+                descriptors_loop_length = b12 & 4095
+                pos += 6
+                descriptors = []
+                if descriptors_loop_length > 0:
+                    descriptors = DescriptorParser.decode_descriptors(section, pos, pos + descriptors_loop_length)
+                    pos += descriptors_loop_length
+                nitdk.transport_streams.append({'transport_stream_id': transport_stream_id,
+                                                'original_network_id': original_network_id,
+                                                'descriptors': descriptors})
+            self._check_section_crc32(section, nitdk, pid, 'NIT')
+            return nitdk
+        except Exception as err:
+            self._warning(pid, 'nit_parsing_error', 'NIT parsing error:' + str(err))
+            return None
+
+    def decode_eit(self, section: bytes, pid=18) -> EIT.EIT:
+        """
+        Decode Event Information Table (EIT)
+
+        :param section: Complete section bytes starting from table_id (see ts_section.SectionAssembler)
+        :param pid: PID of EIT (used for anomaly reporting only)
+        :return: return decoded EIT object
+        """
+        eitdk = EIT.EIT()
+        try:
+            eitdk.table_id = section[0]
+            section_length, eitdk.service_id = struct.unpack('>HH', section[1:5])
+            pos_crc = 3 + (section_length & 4095) - 4
+            b = section[5]
+            eitdk.ver_num = (b & 62) >> 1
+            eitdk.cur_next_ind = b & 1
+            (eitdk.sec_num, eitdk.last_sec_num, eitdk.transport_stream_id, eitdk.original_network_id,
+             eitdk.segment_last_sec_num, eitdk.last_table_id) = struct.unpack('>BBHHBB', section[6:14])
+            pos = 14
+            while pos < pos_crc:
+                event_id = struct.unpack('>H', section[pos:pos + 2])[0]
+                start_time = decode_utc_time(section[pos + 2:pos + 7])
+                duration = decode_bcd_duration(section[pos + 7:pos + 10])
+                b12 = struct.unpack('>H', section[pos + 10:pos + 12])[0]
+                descriptors_loop_length = b12 & 4095
+                pos += 12
+                descriptors = []
+                if descriptors_loop_length > 0:
+                    descriptors = DescriptorParser.decode_descriptors(section, pos, pos + descriptors_loop_length)
+                    pos += descriptors_loop_length
+                eitdk.events.append({'event_id': event_id, 'start_time': start_time, 'duration': duration,
+                                     'running_status': b12 >> 13, 'free_CA_mode': (b12 & 4096) >> 12,
+                                     'descriptors': descriptors})
+            self._check_section_crc32(section, eitdk, pid, 'EIT')
+            return eitdk
+        except Exception as err:
+            self._warning(pid, 'eit_parsing_error', 'EIT parsing error:' + str(err))
+            return None
+
+    def decode_tdt(self, section: bytes, pid=20) -> TDT.TDT:
+        """
+        Decode Time and Date Table (TDT) or Time Offset Table (TOT)
+
+        :param section: Complete section bytes starting from table_id (see ts_section.SectionAssembler)
+        :param pid: PID of TDT/TOT (used for anomaly reporting only)
+        :return: return decoded TDT object
+        """
+        tdtdk = TDT.TDT()
+        try:
+            tdtdk.table_id = section[0]
+            tdtdk.utc_time = decode_utc_time(section[3:8])
+            if tdtdk.table_id == 0x73:     # TOT
+                descriptors_length = struct.unpack('>H', section[8:10])[0] & 4095
+                if descriptors_length > 0:
+                    tdtdk.descriptors = DescriptorParser.decode_descriptors(section, 10, 10 + descriptors_length)
+                self._check_section_crc32(section, tdtdk, pid, 'TOT')
+            return tdtdk
+        except Exception as err:
+            self._warning(pid, 'tdt_parsing_error', 'TDT parsing error:' + str(err))
+            return None
+
+    def decode_pes(self, pes: bytes, pid=-1) -> PES.PES:
         """
         Decode Packetized Elementary Stream (PES)
 
         :param pes: PES packet bytes
+        :param pid: PID of PES packet (used for anomaly reporting only)
         :return: return decoded PES object
         """
         pesdk = PES.PES()
@@ -556,7 +682,7 @@ class TSParser:
                 pass
             return pesdk
         except Exception as err:
-            logging.warning('PES parsing error:' + str(err))
+            self._warning(pid, 'pes_parsing_error', 'PES parsing error:' + str(err))
             return None
 
     def crc32mpeg2(self, data: bytes) -> int:
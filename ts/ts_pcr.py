@@ -0,0 +1,308 @@
+import array
+import collections
+import math
+
+"""
+PCR measurements of ETSI TR 101 290 V1.3.1 (5.3.2.2 PCR_accuracy_error, Annex I PCR_FO, PCR_DR, PCR_OJ)
+    PCR_AC - difference between PCR value and PCR expected from byte position of the packet in the stream
+    PCR_OJ - overall jitter: difference between PCR value and packet arrival time (frequency offset removed)
+    PCR_FO - frequency offset of program clock from nominal 27 MHz measured against arrival time
+    PCR_DR - drift rate: change of PCR_FO per second (slope of last PCR_FO measurements)
+"""
+
+PCR_CLOCK = 27000000                # Program clock frequency (Hz)
+PCR_WRAP = (1 << 33) * 300          # PCR value wraps around after 2^33 base ticks
+
+# ISO/IEC 13818-1 system clock limits used by TR 101 290. PCR_OJ has no normative limit (depends on network)
+LIMITS = {
+    'PCR_AC_ns': 500,               # +-500 ns
+    'PCR_FO_Hz': 810,               # 27 MHz +-30 ppm
+    'PCR_DR_Hz_s': 0.075,           # 75 mHz/s
+    'PCR_OJ_ns': 25000,
+}
+
+
+def _fit(xs, ys) -> (float, float, list):
+    """
+    Least squares linear regression y = a + b * x
+
+    :return: (a, b, residuals)
+    """
+    n = len(xs)
+    mx = sum(xs) / n
+    my = sum(ys) / n
+    dx = [x - mx for x in xs]
+    sxx = sum(map(float.__mul__, dx, dx))
+    b = sum(map(lambda d, y: d * (y - my), dx, ys)) / sxx if sxx != 0 else 0.0
+    a = my - b * mx
+    return a, b, [y - a - b * x for x, y in zip(xs, ys)]
+
+
+class PcrPidAnalyzer:
+    """
+    Class for PCR analysis of one PCR PID within a segment (PCRs without discontinuity):
+        PCR_FO and PCR_OJ - incremental linear regression of PCR against arrival time. Sums are exponentially
+                            weighted with time constant fo_tau_s, so memory is bounded and network jitter is averaged.
+                            Sums are kept relative to an origin moved to the last PCR at each measurement, so they
+                            do not lose precision in long segments
+        PCR_AC            - regression of PCR against byte position over last window PCRs kept in preallocated ring
+                            buffers (computed once per statistics interval)
+    """
+    def __init__(self, window=256, fo_tau_s=30.0, fo_history=10, check_timing=True):
+        """
+        Initialize object
+
+        :param window: Number of last PCRs used for PCR_AC
+        :param fo_tau_s: Time constant of PCR_FO/PCR_OJ regression in seconds
+        :param fo_history: Number of last PCR_FO measurements used for PCR_DR
+        :param check_timing: If False only PCR_AC is measured (arrival time is not stream time, e.g. when TS-file is
+                             read faster than real time): PCR_OJ, PCR_FO, PCR_DR and discontinuities by arrival time
+                             are skipped
+        """
+        self.window = window
+        self.fo_tau_s = fo_tau_s
+        self.check_timing = check_timing
+        self.__pcr = array.array('q', bytes(8 * window))    # PCR relative to segment start (27 MHz ticks)
+        self.__pos = array.array('q', bytes(8 * window))    # byte position relative to segment start
+        self.__fo_history = collections.deque(maxlen=fo_history)     # (arrival time, PCR_FO) of last reports
+        self.__seq = 0                  # Number of PCRs added since start
+        self.__reported_seq = 0         # __seq at last report
+        self.discontinuities = 0
+        self.errors = {'PCR_accuracy_error': 0, 'PCR_OJ_error': 0, 'PCR_FO_error': 0, 'PCR_DR_error': 0}
+        self.reset()
+
+    def reset(self):
+        """ Start new segment (after discontinuity) """
+        self.__head = 0
+        self.__count = 0
+        self.__base = None              # (arrival time, PCR, byte position) of segment start
+        self.__last = None              # (arrival time, PCR) of last PCR relative to segment start
+        self.__sums = [0.0] * 5         # weighted sums: w, x, y, xx, xy (x - arrival time, y - PCR in seconds)
+        self.__origin = (0.0, 0)        # (arrival time, PCR) relative to segment start x and y of sums are relative to
+        self.__oj_max = None            # maximum absolute PCR_OJ since last report (s)
+        self.__fo_history.clear()
+
+    def __regression(self) -> (float, float):
+        """
+        :return: (a, b) of PCR = a + b * arrival time (relative to origin) or None if PCRs do not cover 1 s yet
+        """
+        sw, sx, sy, sxx, sxy = self.__sums
+        if self.__last is None or self.__last[0] < 1.0:
+            return None
+        d = sw * sxx - sx * sx
+        if d <= 0:
+            return None
+        b = (sw * sxy - sx * sy) / d
+        return (sy - b * sx) / sw, b
+
+    def add(self, pcr: int, t: float, pos: int, disc=False):
+        """
+        Add PCR
+
+        :param pcr: PCR value (27 MHz ticks)
+        :param t: Arrival time (seconds, e.g. UNIX timestamp)
+        :param pos: Byte position of the packet in the stream
+        :param disc: discontinuity_indicator of the packet
+        """
+        if self.__base is not None:
+            rel = (pcr - self.__base[1]) % PCR_WRAP
+            # PCR does not follow arrival time (jump without discontinuity_indicator or stream restart)
+            if (disc or rel < self.__last[1]
+                    or (self.check_timing and abs(rel / PCR_CLOCK - (t - self.__base[0])) > 1.0)):
+                self.discontinuities += 1
+                self.reset()
+        if self.__base is None:
+            self.__base = (t, pcr, pos)
+            rel = 0
+        x = t - self.__base[0] - self.__origin[0]
+        if self.check_timing:
+            y = (rel - self.__origin[1]) / PCR_CLOCK
+
+            # PCR_OJ against current regression line
+            line = self.__regression()
+            if line is not None:
+                oj = abs(y - line[0] - line[1] * x)
+                if self.__oj_max is None or oj > self.__oj_max:
+                    self.__oj_max = oj
+
+            # Update exponentially weighted sums
+            sums = self.__sums
+            w = math.exp(-(x + self.__origin[0] - self.__last[0]) / self.fo_tau_s) if self.__last is not None else 1.0
+            sums[0] = sums[0] * w + 1
+            sums[1] = sums[1] * w + x
+            sums[2] = sums[2] * w + y
+            sums[3] = sums[3] * w + x * x
+            sums[4] = sums[4] * w + x * y
+        self.__last = (x + self.__origin[0], rel)
+
+        # Ring buffers for PCR_AC
+        i = self.__head
+        self.__pcr[i] = rel
+        self.__pos[i] = pos - self.__base[2]
+        self.__head = (i + 1) % self.window
+        if self.__count < self.window:
+            self.__count += 1
+        self.__seq += 1
+
+    def __recenter(self):
+        """ Move origin of regression sums to the last PCR """
+        if self.__last is None:
+            return
+        dx = self.__last[0] - self.__origin[0]
+        dy = (self.__last[1] - self.__origin[1]) / PCR_CLOCK
+        sw, sx, sy, sxx, sxy = self.__sums
+        self.__sums = [sw, sx - sw * dx, sy - sw * dy, sxx - 2 * dx * sx + sw * dx * dx,
+                       sxy - dx * sy - dy * sx + sw * dx * dy]
+        self.__origin = self.__last
+
+    def get_state(self) -> dict:
+        """
+        :return: State for checkpoint (see ts_checkpoint): segment, regression sums, ring buffers and error counters
+        """
+        return {'pcr': self.__pcr.tobytes(), 'pos': self.__pos.tobytes(), 'fo_history': list(self.__fo_history),
+                'seq': self.__seq, 'reported_seq': self.__reported_seq, 'discontinuities': self.discontinuities,
+                'errors': dict(self.errors), 'head': self.__head, 'count': self.__count, 'base': self.__base,
+                'last': self.__last, 'sums': list(self.__sums), 'origin': self.__origin, 'oj_max': self.__oj_max}
+
+    def set_state(self, state: dict, live=False, shift_s=0.0):
+        """
+        :param state: State returned by get_state
+        :param live: If True the stream is resumed after a gap: error counters are kept and a new segment is started
+        :param shift_s: Arrival times are shifted by this number of seconds (pause between checkpoint and resume)
+        """
+        self.__seq = self.__reported_seq = state['seq']
+        self.discontinuities = state['discontinuities']
+        self.errors = dict(state['errors'])
+        self.reset()
+        if live:
+            return
+        self.__pcr = array.array('q', state['pcr'])
+        self.__pos = array.array('q', state['pos'])
+        self.__fo_history.extend(state['fo_history'])
+        self.__reported_seq = state['reported_seq']
+        self.__head = state['head']
+        self.__count = state['count']
+        base = state['base']
+        self.__base = (base[0] + shift_s, base[1], base[2]) if base is not None else None
+        self.__last = state['last']
+        self.__sums = list(state['sums'])
+        self.__origin = state['origin']
+        self.__oj_max = state['oj_max']
+
+    def __window(self, arr: array.array) -> list:
+        if self.__count < self.window:
+            return arr[:self.__count].tolist()
+        return arr[self.__head:].tolist() + arr[:self.__head].tolist()
+
+    def measure(self, limits=None) -> dict:
+        """
+        Compute measurements and count errors for PCRs received since previous call
+
+        :param limits: Dictionary of limits (see LIMITS)
+        :return: dictionary with PCR_AC_ns, PCR_OJ_ns (maximum absolute values), PCR_FO_Hz, PCR_DR_Hz_s (None if
+                 there are not enough PCRs) and new errors counters
+        """
+        limits = LIMITS if limits is None else limits
+        new = min(self.__seq - self.__reported_seq, self.__count)
+        self.__reported_seq = self.__seq
+        result = {'PCR_AC_ns': None, 'PCR_OJ_ns': None, 'PCR_FO_Hz': None, 'PCR_DR_Hz_s': None,
+                  'errors': {name: 0 for name in self.errors}}
+        errors = result['errors']
+
+        # PCR_AC: PCR against byte position (constant transport rate over the window)
+        if self.__count >= 3:
+            pcr_s = [p / PCR_CLOCK for p in self.__window(self.__pcr)]
+            a, b, residuals = _fit([float(p) for p in self.__window(self.__pos)], pcr_s)
+            ac = [abs(r) * 1e9 for r in residuals]
+            result['PCR_AC_ns'] = round(max(ac), 1)
+            errors['PCR_accuracy_error'] = sum(1 for r in ac[len(ac) - new:] if r > limits['PCR_AC_ns'])
+
+        # PCR_OJ since previous measurement
+        if self.__oj_max is not None:
+            result['PCR_OJ_ns'] = round(self.__oj_max * 1e9, 1)
+            self.__oj_max = None
+            if result['PCR_OJ_ns'] > limits['PCR_OJ_ns']:
+                errors['PCR_OJ_error'] = 1
+
+        # PCR_FO: slope of PCR against arrival time
+        line = self.__regression() if self.check_timing else None
+        if line is not None:
+            fo = (line[1] - 1) * PCR_CLOCK
+            result['PCR_FO_Hz'] = round(fo, 3)
+            # Errors are counted only when regression is settled (segment is longer than its time constant)
+            settled = self.__last[0] >= self.fo_tau_s
+            if settled and abs(fo) > limits['PCR_FO_Hz']:
+                errors['PCR_FO_error'] = 1
+
+            # PCR_DR: slope of last PCR_FO measurements
+            if settled and (len(self.__fo_history) == 0 or self.__last[0] > self.__fo_history[-1][0]):
+                self.__fo_history.append((self.__last[0], fo))
+            if len(self.__fo_history) >= 3:
+                a, dr, residuals = _fit([h[0] for h in self.__fo_history], [h[1] for h in self.__fo_history])
+                result['PCR_DR_Hz_s'] = round(dr, 6)
+                if abs(dr) > limits['PCR_DR_Hz_s']:
+                    errors['PCR_DR_error'] = 1
+
+        for name, value in errors.items():
+            self.errors[name] += value
+        self.__recenter()
+        return result
+
+
+class PcrAnalyzer:
+    """ Class for PCR analysis of all PCR PIDs of the stream """
+    def __init__(self, window=256, fo_tau_s=30.0, limits=None, check_timing=True):
+        """
+        Initialize object
+
+        :param window: Number of last PCRs per PID used for PCR_AC
+        :param fo_tau_s: Time constant of PCR_FO/PCR_OJ regression in seconds
+        :param limits: Dictionary of limits (see LIMITS)
+        :param check_timing: If False only PCR_AC is measured (see PcrPidAnalyzer)
+        """
+        self.window = window
+        self.fo_tau_s = fo_tau_s
+        self.check_timing = check_timing
+        self.limits = dict(LIMITS, **(limits if limits is not None else {}))
+        self.pids = dict()      # pid -> PcrPidAnalyzer
+
+    def add(self, pid: int, pcr: int, t: float, pos: int, disc=False):
+        """
+        Add PCR of PID (see PcrPidAnalyzer.add)
+        """
+        analyzer = self.pids.get(pid)
+        if analyzer is None:
+            analyzer = self.pids[pid] = PcrPidAnalyzer(self.window, self.fo_tau_s, check_timing=self.check_timing)
+        analyzer.add(pcr, t, pos, disc)
+
+    def get_state(self) -> dict:
+        """
+        :return: State for checkpoint (see ts_checkpoint): states of PCR PIDs
+        """
+        return {'pids': {pid: analyzer.get_state() for pid, analyzer in self.pids.items()}}
+
+    def set_state(self, state: dict, live=False, shift_s=0.0):
+        """
+        :param state: State returned by get_state
+        :param live: If True the stream is resumed after a gap (see PcrPidAnalyzer.set_state)
+        :param shift_s: Arrival times are shifted by this number of seconds
+        """
+        self.pids = dict()
+        for pid, pid_state in state['pids'].items():
+            analyzer = self.pids[pid] = PcrPidAnalyzer(self.window, self.fo_tau_s, check_timing=self.check_timing)
+            analyzer.set_state(pid_state, live=live, shift_s=shift_s)
+
+    def report(self, final=False) -> list:
+        """
+        :param final: If True totals of errors and discontinuities are reported instead of new errors
+        :return: list of {'pid', measurements...} for all PCR PIDs
+        """
+        result = list()
+        for pid, analyzer in self.pids.items():
+            measured = analyzer.measure(self.limits)
+            if final:
+                measured['errors'] = dict(analyzer.errors)
+                measured['discontinuities'] = analyzer.discontinuities
+            measured['pid'] = pid
+            result.append(measured)
+        return result
@@ -0,0 +1,316 @@
+import array
+
+"""
+PES timing analysis (ISO/IEC 13818-1 2.4.3.6, 2.7.4, 2.7.5):
+    PTS-PCR offset - difference between PTS of PES and system time clock at arrival of the PES header (interpolated
+                     from PCRs of the program by packet position). It is the time the access unit stays in decoder
+                     buffer: negative - PES arrived too late, more than 1 s - too early (buffer overflow)
+    A/V sync       - difference of audio and video PTS-PCR offsets of the program
+    Discontinuity  - decoding timestamp (DTS or PTS) does not increase or jumps more than 700 ms without
+                     PCR discontinuity_indicator
+"""
+
+PTS_CLOCK = 90000                   # PTS/DTS clock (Hz)
+PTS_WRAP = 1 << 33
+MAX_DELAY = PTS_CLOCK               # Maximum PTS-PCR offset (1 s)
+MAX_STEP = PTS_CLOCK * 7 // 10      # Maximum step between decoding timestamps of consecutive PES (700 ms)
+
+# Kind of elementary stream (by PES stream_id)
+KIND_UNKNOWN, KIND_VIDEO, KIND_AUDIO, KIND_OTHER = 0, 1, 2, 3
+KIND_NAMES = ('unknown', 'video', 'audio', 'other')
+
+# Columns of per-PID state array
+_KIND, _REMAINING, _LAST_TS = 0, 1, 2
+# Columns of per-PID counters array (counted since start)
+COUNTERS = ('pes', 'pts', 'length_errors', 'discontinuities', 'dts_errors', 'pts_late', 'pts_early')
+_PES, _PTS, _LENGTH_ERRORS, _DISCONTINUITIES, _DTS_ERRORS, _PTS_LATE, _PTS_EARLY = range(len(COUNTERS))
+# Columns of per-PID interval PTS-PCR offset array (90 kHz ticks)
+_OFF_MIN, _OFF_MAX, _OFF_SUM, _OFF_COUNT = 0, 1, 2, 3
+
+
+def timestamp_delta(delta: int) -> int:
+    """ Convert difference of 33-bit timestamps into signed value """
+    delta %= PTS_WRAP
+    return delta - PTS_WRAP if delta >= PTS_WRAP >> 1 else delta
+
+
+def decode_timestamp(data, pos: int) -> int:
+    """ Decode 33-bit PTS/DTS from 5 bytes """
+    return (((data[pos] & 14) << 29) | (data[pos + 1] << 22) | ((data[pos + 2] & 254) << 14) | (data[pos + 3] << 7)
+            | (data[pos + 4] >> 1))
+
+
+class PesTracker:
+    """
+    Class for following PES boundaries of elementary stream PIDs across TS packets without buffering payloads (only
+    PES header split between packets is kept until complete). Per-PID state, counters and last history PTS/DTS/STC
+    values are kept in preallocated integer arrays (one slot per PID), so memory does not grow with stream duration
+    """
+    def __init__(self, history=64):
+        """
+        Initialize object
+
+        :param history: Number of last PES timestamps kept per PID (see sequence)
+        """
+        self.history = history
+        self.__slots = dict()           # pid -> slot index
+        self.__state = array.array('q')         # kind, remaining PES bytes (-1 - unbounded), last decoding timestamp
+        self.__counters = array.array('q')
+        self.__reported = array.array('q')      # counters at last report
+        self.__offsets = array.array('q')       # min, max, sum, count of PTS-PCR offset since last report
+        self.__offsets_total = array.array('q')     # the same for reported intervals
+        self.__ring = array.array('q')          # history x (PTS, DTS, STC) per slot (-1 - not present)
+        self.__ring_head = array.array('q')     # number of PES added per slot
+        self.__header = dict()          # pid -> beginning of PES header split between packets
+        self.__pcr_pid = dict()         # elementary PID -> PCR PID of the program
+        self.__clocks = dict()          # PCR PID -> [PCR (27 MHz), packet index, 27 MHz ticks per packet]
+        self.__index = 0                # Packet index of the stream
+
+    def __slot(self, pid: int) -> int:
+        slot = self.__slots.get(pid)
+        if slot is None:
+            slot = self.__slots[pid] = len(self.__slots)
+            self.__state.extend((KIND_UNKNOWN, -1, -1))
+            self.__counters.extend([0] * len(COUNTERS))
+            self.__reported.extend([0] * len(COUNTERS))
+            self.__offsets.extend((0, 0, 0, 0))
+            self.__offsets_total.extend((0, 0, 0, 0))
+            self.__ring.extend([-1] * (3 * self.history))
+            self.__ring_head.append(0)
+        return slot
+
+    def set_program(self, pmt):
+        """
+        Associate elementary PIDs of the program with its PCR PID
+
+        :param pmt: PMT object of the program
+        """
+        for stream in pmt.streams:
+            self.__pcr_pid[stream['elementary_pid']] = pmt.pcr_pid
+
+    def tick(self):
+        """ Count TS packet of the stream (packet position is used for system time clock interpolation) """
+        self.__index += 1
+
+    def pcr(self, pid: int, pcr: int, disc=False):
+        """
+        Add PCR of the current packet
+
+        :param pid: PCR PID
+        :param pcr: PCR value (27 MHz ticks)
+        :param disc: discontinuity_indicator of the packet
+        """
+        clock = self.__clocks.get(pid)
+        if disc or clock is None:
+            if disc:
+                # Timestamps of the program may jump: decoding timestamps sequence is restarted
+                for es_pid, pcr_pid in self.__pcr_pid.items():
+                    if pcr_pid == pid and es_pid in self.__slots:
+                        self.__state[3 * self.__slots[es_pid] + _LAST_TS] = -1
+            self.__clocks[pid] = [pcr, self.__index, 0]
+            return
+        packets = self.__index - clock[1]
+        if packets > 0:
+            clock[2] = ((pcr - clock[0]) % (PTS_WRAP * 300)) / packets
+        clock[0] = pcr
+        clock[1] = self.__index
+
+    def __stc(self, pid: int) -> int:
+        """
+        :return: system time clock (90 kHz) of the current packet interpolated from PCRs of the program or None
+        """
+        clock = self.__clocks.get(self.__pcr_pid.get(pid))
+        if clock is None or clock[2] == 0:
+            return None
+        return int((clock[0] + (self.__index - clock[1]) * clock[2]) // 300) % PTS_WRAP
+
+    def packet(self, pid: int, packet: bytes, payload: int, pusi: int):
+        """
+        Follow PES of the packet
+
+        :param pid: PID of the packet
+        :param packet: TS packet bytes
+        :param payload: Payload byte number in the packet
+        :param pusi: payload_unit_start_indicator of the packet
+        """
+        slot = self.__slot(pid)
+        state = self.__state
+        i = 3 * slot
+        size = len(packet) - payload
+        if pusi:
+            if state[i + _REMAINING] > 0:
+                self.__counters[len(COUNTERS) * slot + _LENGTH_ERRORS] += 1     # previous PES is incomplete
+            self.__header.pop(pid, None)
+            if size >= 6 and packet[payload] == 0 and packet[payload + 1] == 0 and packet[payload + 2] == 1:
+                length = (packet[payload + 4] << 8) | packet[payload + 5]
+                state[i + _REMAINING] = length + 6 - size if length > 0 else -1
+                self.__counters[len(COUNTERS) * slot + _PES] += 1
+                if self.__parse_header(pid, slot, packet[payload:]) is None:
+                    self.__header[pid] = packet[payload:]
+            else:
+                state[i + _REMAINING] = -1
+            return
+        header = self.__header.get(pid)
+        if header is not None:
+            header += packet[payload:]
+            if self.__parse_header(pid, slot, header) is None and len(header) < 264:
+                self.__header[pid] = header
+            else:
+                del self.__header[pid]
+        remaining = state[i + _REMAINING]
+        if remaining >= 0:
+            remaining -= size
+            if remaining < 0:
+                self.__counters[len(COUNTERS) * slot + _LENGTH_ERRORS] += 1     # PES is longer than its length
+                remaining = -1
+            state[i + _REMAINING] = remaining
+
+    def __parse_header(self, pid: int, slot: int, pes: bytes):
+        """
+        Parse PES header and account its timestamps
+
+        :return: None if header is not complete yet
+        """
+        if len(pes) < 4:
+            return None
+        stream_id = pes[3]
+        i = 3 * slot
+        if self.__state[i + _KIND] == KIND_UNKNOWN:
+            self.__state[i + _KIND] = (KIND_VIDEO if stream_id >> 4 == 14 else KIND_AUDIO if stream_id >> 5 == 6
+                                       else KIND_OTHER)
+        # Streams without optional PES header (ISO/IEC 13818-1 Table 2-21)
+        if stream_id in (188, 190, 191, 240, 241, 242, 248, 255):
+            return False
+        if len(pes) < 9 or len(pes) < 9 + pes[8]:
+            return None
+        flags = pes[7] >> 6
+        if flags < 2 or pes[8] < (10 if flags == 3 else 5):
+            return False
+        pts = decode_timestamp(pes, 9)
+        dts = decode_timestamp(pes, 14) if flags == 3 else -1
+        self.__timestamps(pid, slot, pts, dts)
+        return True
+
+    def __timestamps(self, pid: int, slot: int, pts: int, dts: int):
+        counters = self.__counters
+        c = len(COUNTERS) * slot
+        counters[c + _PTS] += 1
+        if dts >= 0 and timestamp_delta(pts - dts) < 0:
+            counters[c + _DTS_ERRORS] += 1
+        # Decoding timestamps sequence
+        ts = dts if dts >= 0 else pts
+        last = self.__state[3 * slot + _LAST_TS]
+        if last >= 0:
+            step = timestamp_delta(ts - last)
+            if step <= 0 or step > MAX_STEP:
+                counters[c + _DISCONTINUITIES] += 1
+        self.__state[3 * slot + _LAST_TS] = ts
+        # PTS-PCR offset
+        stc = self.__stc(pid)
+        if stc is not None:
+            offset = timestamp_delta(pts - stc)
+            if offset < 0:
+                counters[c + _PTS_LATE] += 1
+            elif offset > MAX_DELAY:
+                counters[c + _PTS_EARLY] += 1
+            o = 4 * slot
+            offsets = self.__offsets
+            if offsets[o + _OFF_COUNT] == 0 or offset < offsets[o + _OFF_MIN]:
+                offsets[o + _OFF_MIN] = offset
+            if offsets[o + _OFF_COUNT] == 0 or offset > offsets[o + _OFF_MAX]:
+                offsets[o + _OFF_MAX] = offset
+            offsets[o + _OFF_SUM] += offset
+            offsets[o + _OFF_COUNT] += 1
+        # History
+        head = self.__ring_head[slot]
+        r = 3 * (self.history * slot + head % self.history)
+        self.__ring[r] = pts
+        self.__ring[r + 1] = dts
+        self.__ring[r + 2] = stc if stc is not None else -1
+        self.__ring_head[slot] = head + 1
+
+    def sequence(self, pid: int) -> list:
+        """
+        :return: list of (PTS, DTS, STC) of last PES of PID in 90 kHz ticks (DTS and STC are None if not available)
+        """
+        slot = self.__slots.get(pid)
+        if slot is None:
+            return []
+        head = self.__ring_head[slot]
+        result = list()
+        for n in range(max(0, head - self.history), head):
+            r = 3 * (self.history * slot + n % self.history)
+            pts, dts, stc = self.__ring[r:r + 3]
+            result.append((pts, dts if dts >= 0 else None, stc if stc >= 0 else None))
+        return result
+
+    @staticmethod
+    def __merge(target: array.array, source: array.array, o: int):
+        """ Merge offset accumulators of slot (o - first column) from source into target """
+        if source[o + _OFF_COUNT] == 0:
+            return
+        if target[o + _OFF_COUNT] == 0 or source[o + _OFF_MIN] < target[o + _OFF_MIN]:
+            target[o + _OFF_MIN] = source[o + _OFF_MIN]
+        if target[o + _OFF_COUNT] == 0 or source[o + _OFF_MAX] > target[o + _OFF_MAX]:
+            target[o + _OFF_MAX] = source[o + _OFF_MAX]
+        target[o + _OFF_SUM] += source[o + _OFF_SUM]
+        target[o + _OFF_COUNT] += source[o + _OFF_COUNT]
+
+    @staticmethod
+    def __offset_ms(offsets: array.array, o: int) -> dict:
+        count = offsets[o + _OFF_COUNT]
+        if count == 0:
+            return None
+        k = 1000 / PTS_CLOCK
+        return {'min': round(offsets[o + _OFF_MIN] * k, 3), 'max': round(offsets[o + _OFF_MAX] * k, 3),
+                'mean': round(offsets[o + _OFF_SUM] / count * k, 3)}
+
+    def report(self, final=False) -> list:
+        """
+        PES statistics since previous report
+
+        :param final: If True counters since start are reported
+        :return: list of {'pid', 'kind', counters..., 'pts_pcr_ms': {min, max, mean}, 'av_sync_ms'} (None if no PES)
+        """
+        if len(self.__slots) == 0:
+            return None
+        n = len(COUNTERS)
+        result = list()
+        offsets = dict()
+        for pid, slot in sorted(self.__slots.items()):
+            counters = self.__counters[n * slot:n * (slot + 1)]
+            if not final:
+                counters = [value - reported for value, reported in zip(counters, self.__reported[n * slot:])]
+            if final:
+                # Reported intervals and the current one
+                total = self.__offsets_total[4 * slot:4 * (slot + 1)]
+                self.__merge(total, self.__offsets[4 * slot:4 * (slot + 1)], 0)
+                offset = self.__offset_ms(total, 0)
+            else:
+                offset = self.__offset_ms(self.__offsets, 4 * slot)
+            offsets[pid] = offset
+            result.append(dict(pid=pid, kind=KIND_NAMES[self.__state[3 * slot + _KIND]], pts_pcr_ms=offset,
+                               **dict(zip(COUNTERS, counters))))
+        # A/V sync: audio offset against the first video PID of the same program
+        videos = dict()
+        for pid_result in result:
+            pcr_pid = self.__pcr_pid.get(pid_result['pid'])
+            if pid_result['kind'] == 'video' and offsets[pid_result['pid']] is not None and pcr_pid not in videos:
+                videos[pcr_pid] = offsets[pid_result['pid']]['mean']
+        for pid_result in result:
+            video = videos.get(self.__pcr_pid.get(pid_result['pid']))
+            if pid_result['kind'] == 'audio' and video is not None and offsets[pid_result['pid']] is not None:
+                pid_result['av_sync_ms'] = round(offsets[pid_result['pid']]['mean'] - video, 3)
+        if not final:
+            self.__reported = array.array('q', self.__counters)
+            for slot in self.__slots.values():
+                self.__merge(self.__offsets_total, self.__offsets, 4 * slot)
+            for i in range(len(self.__offsets)):
+                self.__offsets[i] = 0
+        return result
+
+    def get_totals(self) -> list:
+        """
+        :return: PES counters since start (see report)
+        """
+        return self.report(final=True)
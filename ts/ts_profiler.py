@@ -0,0 +1,92 @@
+import threading
+import time
+
+
+class Profiler:
+    """
+    Class for collecting hot-path profiling counters: packets, bytes, sections decoded/skipped and cumulative time
+    (ns) per processing stage and per PID role. Instrumentation is installed only when Profiler object is passed to
+    TSReader/Statistics, so there is no overhead when profiling is disabled
+    """
+    STAGES = ('parse', 'psi_decode', 'pes_decode', 'update_stat', 'report', 'print')
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.stages_ns = {stage: 0 for stage in self.STAGES}   # Shared by timed wrappers: never replaced
+        self.reset()
+
+    def reset(self):
+        """ Reset all counters """
+        with self.__lock:
+            self.packets = 0
+            self.bytes = 0
+            self.sections_decoded = 0
+            self.sections_skipped = 0
+            for stage in self.stages_ns:
+                self.stages_ns[stage] = 0
+            self.roles_ns = dict()          # PID role -> cumulative ns
+            self.roles_packets = dict()     # PID role -> packets
+
+    def add_parse(self, ns: int, size: int):
+        """
+        Account parsing of one TS packet
+
+        :param ns: Parsing time in nanoseconds
+        :param size: Packet size in bytes
+        """
+        self.packets += 1
+        self.bytes += size
+        self.stages_ns['parse'] += ns
+
+    def add_role(self, role: str, ns: int):
+        """
+        Account processing of one TS packet (decoding and statistics) by PID role
+
+        :param role: PID role ('pat', 'cat', 'pmt', 'sdt_bat', 'nit', 'si', 'stream', 'other', 'known', 'null',
+                     'unknown' or 'invalid' for packets which were not decoded)
+        :param ns: Processing time in nanoseconds
+        """
+        self.roles_ns[role] = self.roles_ns.get(role, 0) + ns
+        self.roles_packets[role] = self.roles_packets.get(role, 0) + 1
+
+    def add_stage(self, stage: str, ns: int):
+        """
+        :param stage: Stage name (see STAGES)
+        :param ns: Time in nanoseconds
+        """
+        self.stages_ns[stage] += ns
+
+    def timed(self, stage: str, func, section=False):
+        """
+        Wrap function for measuring its cumulative execution time
+
+        :param stage: Stage name (see STAGES)
+        :param func: Function to be wrapped
+        :param section: If True result of function is counted as decoded section (skipped if None or empty)
+        :return: wrapped function
+        """
+        perf_counter_ns = time.perf_counter_ns
+        stages_ns = self.stages_ns
+
+        def wrapper(*args, **kwargs):
+            start = perf_counter_ns()
+            result = func(*args, **kwargs)
+            stages_ns[stage] += perf_counter_ns() - start
+            if section:
+                if result is None or (isinstance(result, dict) and not any(result.values())):
+                    self.sections_skipped += 1
+                else:
+                    self.sections_decoded += 1
+            return result
+        return wrapper
+
+    def get_profile(self) -> dict:
+        """
+        :return: dictionary with all counters (JSON serializable)
+        """
+        with self.__lock:
+            roles = {role: {'packets': self.roles_packets[role], 'ns': ns,
+                            'ns_per_packet': round(ns / self.roles_packets[role])}
+                     for role, ns in self.roles_ns.items()}
+            return {'packets': self.packets, 'bytes': self.bytes, 'sections_decoded': self.sections_decoded,
+                    'sections_skipped': self.sections_skipped, 'stages_ns': dict(self.stages_ns), 'roles': roles}
@@ -1,22 +1,52 @@
 from ts.ts_parser import TSParser
+from ts.ts_anomaly import AnomalyCounter
+from ts.ts_section import SiTables
 from models import *
 import datetime
 import logging
+import time
 from events.event import Event
 
 
 class TSReader:
     """ Class for reading TS packets stream"""
-    def __init__(self):
+    def __init__(self, anomalies=None, profiler=None, rtp=None, pes_tracker=None, es_scanner=None,
+                 freeze_detector=None, summary=None):
         """
         Initialize object
 
-        :param statistics: Statistics calss object (if statistic needed)
+        :param anomalies: AnomalyCounter object for aggregated anomaly logging. New one is created if None
+        :param profiler: Profiler object for hot-path profiling (see ts_profiler). No instrumentation if None
+        :param rtp: RtpLayer object (see ts_rtp) for datagrams which may carry RTP header. Data is read as is if None
+        :param pes_tracker: PesTracker object (see ts_pes) for PES timing analysis of program streams. No analysis if
+                            None
+        :param es_scanner: EsScanner object (see ts_es) for GOP analysis of video streams. No analysis if None
+        :param freeze_detector: FreezeDetector object (see ts_freeze) for frozen and black picture detection of video
+                                streams. No detection if None
+        :param summary: StreamSummary object (see ts_compare) collecting PTS, payload hashes and PCR of program streams
+                        for comparison with another stream. Not collected if None
         """
-        self.__ts_parser = TSParser()
+        self.anomalies = anomalies if anomalies is not None else AnomalyCounter()
+        self.__ts_parser = TSParser(anomalies=self.anomalies)
+        self.profiler = profiler
+        self.rtp = rtp
+        self.pes_tracker = pes_tracker
+        self.es_scanner = es_scanner
+        self.freeze_detector = freeze_detector
+        self.summary = summary
+        if profiler is not None:
+            # Decoders are wrapped by timed functions only when profiling is enabled
+            for name in ('decode_pat', 'decode_cat', 'decode_pid_17', 'decode_pmt', 'decode_nit', 'decode_eit',
+                         'decode_tdt'):
+                setattr(self.__ts_parser, name, profiler.timed('psi_decode', getattr(self.__ts_parser, name),
+                                                               section=True))
+            self.__ts_parser.decode_pes = profiler.timed('pes_decode', self.__ts_parser.decode_pes)
+        # SI sections decoding and repetition monitoring (see ts_section)
+        self.si = SiTables(self.__ts_parser, anomalies=self.anomalies)
         self.__programs = Programs.Programs()
 
         # Events
+        self.onDatagramReceived = Event()       # Fired for each read data (datagram) to collect network statistic
         self.onPacketDecoded = Event()          # Fired for each decoded packet to collect statistic
         self.onPatReceived = Event()            # Fired when PAT received or updated
         self.onPmtReceived = Event()            # Fired when PMT received or updated
@@ -24,7 +54,9 @@ class TSReader:
         self.onProgramSdtReceived = Event()     # Fired when SDT related to Program ID received or updated
         self.onSdtReceived = Event()            # Fired when any SDT received
         self.onBatReceived = Event()            # Fired when any BAT received
-        self.onNitReceived = Event()            # Will be fired when NIT received or updated
+        self.onNitReceived = Event()            # Fired when NIT received or updated
+        self.onEitReceived = Event()            # Fired when EIT section received or updated
+        self.onTdtReceived = Event()            # Fired when TDT or TOT received
 
         self.known_pids = set()
         self.known_pids.add(0)      # 0x0000 - Program Association Table (PAT)
@@ -50,20 +82,74 @@ class TSReader:
     def get_programs_data(self) -> Programs.Programs:
         return self.__programs
 
+    def get_state(self) -> dict:
+        """
+        :return: State for checkpoint (see ts_checkpoint): parser state, programs and SI tables. PES, ES, freeze and
+                 RTP analyzers are not included (they synchronize on the stream by themselves)
+        """
+        return {'parser': self.__ts_parser.get_state(), 'programs': self.__programs.get_state(),
+                'si': self.si.get_state()}
+
+    def set_state(self, state: dict, live=False):
+        """
+        :param state: State returned by get_state
+        :param live: If True the stream is resumed after a gap (monitor restart), so incomplete sections are dropped
+        """
+        self.__ts_parser.set_state(state['parser'], live=live)
+        self.__programs.set_state(state['programs'])
+        self.si.set_state(state['si'], live=live)
+
+    def prime(self, data: bytes, dt: datetime):
+        """
+        Read PSI packets preceding the analyzed part of the stream (e.g. when TS-file is analyzed from the middle, see
+        ts_index). Tables are decoded and their events are fired, but packets are not passed to statistics
+
+        :param data: TS packets
+        :param dt: Date and time of the packets
+        """
+        on_packet_decoded = self.onPacketDecoded
+        self.onPacketDecoded = Event()
+        try:
+            self.read(data, dt)
+        finally:
+            self.onPacketDecoded = on_packet_decoded
+
     def read(self, data: bytes, dt: datetime, parse_ts=True):
         """
         Read clean TS stream packets (without IP/UDP layer) and prepare statistics
 
-        :param data: Clean TS stream packet (may include several TS packets inside)
+        :param data: Clean TS stream packet (may include several TS packets inside) or RTP packet if rtp is set
         :param dt: Date and time when TS stream packet arrived
         :param parse_ts: If True (by default) method parse TS header for each TS packet
         """
+        if self.rtp is not None:
+            data = self.rtp.strip(data, dt)
+        if self.onDatagramReceived.getHandlerCount() > 0:
+            self.onDatagramReceived.fire(dt=dt, size=len(data))
+        self.si.tick(dt)
+        profiler = self.profiler
+        pes_tracker = self.pes_tracker
+        es_scanner = self.es_scanner
+        freeze_detector = self.freeze_detector
+        summary = self.summary
+        if profiler is not None:
+            t_end = time.perf_counter_ns()
         for pk, dpk, rsync in self.__ts_parser.parse(data, parse_ts):
             # print('\t' + str(dpk))
+            if profiler is not None:
+                t_start = time.perf_counter_ns()
+                profiler.add_parse(t_start - t_end, len(pk))
             if dpk is not None:
                 dpk.dt = dt
+                if pes_tracker is not None:
+                    pes_tracker.tick()
+                    if dpk.af_pcrf and dpk.tsh_pid in self.__programs.get_pcr_pids():
+                        pes_tracker.pcr(dpk.tsh_pid, dpk.af_pcr, dpk.af_disc == 1)
+                if summary is not None and dpk.af_pcrf and dpk.tsh_pid in self.__programs.get_pcr_pids():
+                    summary.pcr(dpk.tsh_pid, dpk.af_pcr, dt)
                 if dpk.tsh_pid == 0:
                     # 0x0000 - Program Association Table (PAT)
+                    role = 'pat'
                     pat = self.__ts_parser.decode_pat(pk[dpk.payload:])
                     if self.__programs.pat is None:
                         self.__programs.pat = pat
@@ -96,6 +182,7 @@ class TSReader:
                         self.onPacketDecoded.fire(dpk, rsync, pat=pat, crc32_ok=pat.crc32_ok)
                 elif dpk.tsh_pid == 1:
                     # 0x0001 - Conditional Access Table (CAT)
+                    role = 'cat'
                     cat = self.__ts_parser.decode_cat(pk[dpk.payload:])
                     if self.__programs.cat is None:
                         self.__programs.cat = cat
@@ -109,20 +196,26 @@ class TSReader:
                         self.onPacketDecoded.fire(dpk, rsync, cat=cat, crc32_ok=cat.crc32_ok)
                 elif dpk.tsh_pid == 17:
                     # 0x0011 - SDT, BAT, ST
+                    role = 'sdt_bat'
                     # print(dpk.dt)
                     parse_SDT = False
                     # Parse SDT only if we need Programs SDT or information about each SDT received
                     # Parse BAT only if we need information about each BAT received
-                    if self.onProgramSdtReceived.getHandlerCount() > 0 and self.__programs.sdt is None:
-                        if self.__programs.sdt is None:
-                            parse_SDT = True
+                    if self.onProgramSdtReceived.getHandlerCount() > 0 and not self.__programs.has_all_services():
+                        parse_SDT = True
                     if self.onSdtReceived.getHandlerCount() > 0:
                         parse_SDT = True
+                    if dpk.tsh_afc in [1, 3]:
+                        # Repetition monitoring only, SDT and BAT are decoded below
+                        self.si.packet(17, pk[dpk.payload:], dpk.tsh_pusi, dt, decode=False)
                     res = self.__ts_parser.decode_pid_17(pk[dpk.payload:],
                                      parse_SDT=parse_SDT,
                                      parse_BAT=(True if self.onBatReceived.getHandlerCount() > 0 else False))
                     # Analyzing SDT
                     if res['sdt'] is not None:
+                        # Services of all programs (MPTS). The first service is kept in Programs.sdt
+                        services_changed = (self.onProgramSdtReceived.getHandlerCount() > 0 and res['sdt'].crc32_ok
+                                            and self.__programs.update_services(res['sdt']))
                         if (self.onProgramSdtReceived.getHandlerCount() > 0 and self.__programs.sdt is None
                                 and self.__programs.pat is not None):
                             for service in res['sdt'].services:
@@ -133,7 +226,12 @@ class TSReader:
                                             sdt.services = [service]
                                             self.__programs.sdt = sdt
                                             self.onProgramSdtReceived.fire(dt=dt, programs=self.__programs, sdt=sdt)
+                                            services_changed = False
                                             break
+                                    if self.__programs.sdt is not None:
+                                        break
+                        if services_changed:
+                            self.onProgramSdtReceived.fire(dt=dt, programs=self.__programs, sdt=self.__programs.sdt)
                         if self.onSdtReceived.getHandlerCount() > 0:
                             self.onSdtReceived.fire(dt=dt, programs=self.__programs, sdt=res['sdt'])
                     # Analyzing BAT
@@ -149,10 +247,17 @@ class TSReader:
                         self.onPacketDecoded.fire(dpk, rsync, crc32_ok=crc32_ok)
                 elif dpk.tsh_pid in self.__programs.get_pmt_pids():
                     # Program Map Table
-                    pmt = self.__ts_parser.decode_pmt(pk[dpk.payload:])
+                    role = 'pmt'
+                    pmt = self.__ts_parser.decode_pmt(pk[dpk.payload:], dpk.tsh_pid)
                     if pmt is not None:
                         if self.__programs.get_prog_pmt(dpk.tsh_pid) is None:
                             self.__programs.set_prog_pmt(dpk.tsh_pid, pmt)
+                            if self.pes_tracker is not None:
+                                self.pes_tracker.set_program(pmt)
+                            if self.es_scanner is not None:
+                                self.es_scanner.set_program(pmt)
+                            if self.freeze_detector is not None:
+                                self.freeze_detector.set_program(pmt)
                             if self.onPmtReceived.getHandlerCount() > 0:
                                 self.onPmtReceived.fire(dt=dt, programs=self.__programs, pmt=pmt)
                         elif pmt.crc32 != self.__programs.get_prog_pmt(dpk.tsh_pid).crc32 and pmt.crc32_ok:
@@ -179,37 +284,72 @@ class TSReader:
                                 warn_str += ': streams differences are {}'
                                 warn_lst.append(set_difference)
                             self.__programs.update_prog_pmt(dpk.tsh_pid, pmt)
+                            if self.pes_tracker is not None:
+                                self.pes_tracker.set_program(pmt)
+                            if self.es_scanner is not None:
+                                self.es_scanner.set_program(pmt)
+                            if self.freeze_detector is not None:
+                                self.freeze_detector.set_program(pmt)
                             logging.warning(warn_str.format(*warn_lst))
                             if self.onPmtReceived.getHandlerCount() > 0:
                                 self.onPmtReceived.fire(dt=dt, programs=self.__programs, pmt=pmt)
                     if self.onPacketDecoded.getHandlerCount() > 0:
                         self.onPacketDecoded.fire(dpk, rsync, pmt=pmt, crc32_ok=pmt.crc32_ok)
-                elif dpk.tsh_pid in self.__programs.get_net_pids():
-                    # Network Information Table
-                    logging.warning('NIT - no decoder')
+                elif dpk.tsh_pid in (16, 18, 20) or dpk.tsh_pid in self.__programs.get_net_pids():
+                    # 0x0010 - NIT, 0x0012 - EIT, 0x0014 - TDT, TOT
+                    role = 'nit' if dpk.tsh_pid != 18 and dpk.tsh_pid != 20 else 'si'
+                    crc32_ok = None
+                    if dpk.tsh_afc in [1, 3]:
+                        tables, crc32_ok = self.si.packet(dpk.tsh_pid, pk[dpk.payload:], dpk.tsh_pusi, dt)
+                        for table in tables:
+                            if isinstance(table, NIT.NIT):
+                                if self.onNitReceived.getHandlerCount() > 0:
+                                    self.onNitReceived.fire(dt=dt, programs=self.__programs, nit=table)
+                            elif isinstance(table, EIT.EIT):
+                                if self.onEitReceived.getHandlerCount() > 0:
+                                    self.onEitReceived.fire(dt=dt, programs=self.__programs, eit=table)
+                            elif self.onTdtReceived.getHandlerCount() > 0:
+                                self.onTdtReceived.fire(dt=dt, programs=self.__programs, tdt=table)
                     if self.onPacketDecoded.getHandlerCount() > 0:
-                        self.onPacketDecoded.fire(dpk, rsync)
+                        self.onPacketDecoded.fire(dpk, rsync, crc32_ok=crc32_ok)
                 elif dpk.tsh_pid in self.__programs.get_stream_pids():
                     # Program main streams
+                    role = 'stream'
                     pes = None
+                    if pes_tracker is not None and dpk.tsh_afc in [1, 3] and dpk.tsh_tsc == 0:
+                        pes_tracker.packet(dpk.tsh_pid, pk, dpk.payload, dpk.tsh_pusi)
+                    if es_scanner is not None and dpk.tsh_afc in [1, 3] and dpk.tsh_tsc == 0:
+                        es_scanner.packet(dpk.tsh_pid, pk, dpk.payload, dpk.tsh_pusi, dpk.af_random)
+                    if freeze_detector is not None and dpk.tsh_afc in [1, 3] and dpk.tsh_tsc == 0:
+                        freeze_detector.packet(dpk.tsh_pid, pk, dpk.payload, dpk.tsh_pusi, dpk.af_random, dt)
+                    if summary is not None and dpk.tsh_afc in [1, 3] and dpk.tsh_tsc == 0:
+                        summary.packet(dpk.tsh_pid, pk, dpk.payload, dpk.tsh_pusi)
                     if dpk.tsh_afc in [1, 3]:   # payload
                         p = pk[dpk.payload:dpk.payload+3]
                         if p == b'\x00\x00\x01' and pk[dpk.payload+3] >= 188:   # stream_id >= 188
                             # Packetized Elementary Stream (PES)
-                            pes = self.__ts_parser.decode_pes(pk[dpk.payload+3:])
+                            pes = self.__ts_parser.decode_pes(pk[dpk.payload+3:], dpk.tsh_pid)
+                            if summary is not None and pes.PTS is not None:
+                                summary.pes(dpk.tsh_pid, pes.PTS, pk, dpk.payload, dt)
                             #if pes.PTS_DTS_flags in [2, 3]:
                             #    print('{} - PID=0x{:04X} stream_type={} PTS={}'.format(dpk.dt, dpk.tsh_pid, pes.stream_type, pes.PTS/90000))
                     if self.onPacketDecoded.getHandlerCount() > 0:
                         self.onPacketDecoded.fire(dpk, rsync, pes=pes, pcr_pid=(True if dpk.tsh_pid in self.__programs.get_pcr_pids() else False))
                 elif dpk.tsh_pid in self.__programs.get_other_pids():
                     # Program other streams
+                    role = 'other'
                     if self.onPacketDecoded.getHandlerCount() > 0:
                         self.onPacketDecoded.fire(dpk, rsync, pcr_pid=(True if dpk.tsh_pid in self.__programs.get_pcr_pids() else False))
                 elif dpk.tsh_pid in self.known_pids and dpk.tsh_pid != 8191:   # 0x1FFF - Null Packet
                     # Known PIDs
-                    logging.warning('Known PID: 0x{:04X} - no decoder'.format(dpk.tsh_pid))
+                    role = 'known'
+                    self.anomalies.count(dpk.tsh_pid, 'no_decoder', 'Known PID: 0x{:04X} - no decoder', dpk.tsh_pid)
                     if self.onPacketDecoded.getHandlerCount() > 0:
                         self.onPacketDecoded.fire(dpk, rsync)
                 else:
+                    role = 'null' if dpk.tsh_pid == 8191 else 'unknown'
                     if self.onPacketDecoded.getHandlerCount() > 0:
                         self.onPacketDecoded.fire(dpk, rsync)
+            if profiler is not None:
+                t_end = time.perf_counter_ns()
+                profiler.add_role(role if dpk is not None else 'invalid', t_end - t_start)
@@ -0,0 +1,144 @@
+import datetime
+import struct
+
+"""
+RFC 3550 - RTP: A Transport Protocol for Real-Time Applications
+RFC 2250 - RTP Payload Format for MPEG1/MPEG2 Video (MP2T payload type 33, 90 kHz timestamp clock)
+"""
+
+RTP_CLOCK = 90000       # RTP timestamp clock of MP2T payload (Hz)
+TS_SYNC = 0x47
+
+
+def rtp_header_length(data: bytes) -> int:
+    """
+    Length of RTP header (fixed header, CSRC list and header extension)
+
+    :param data: Datagram payload
+    :return: header length or -1 if data is not RTP with TS payload
+    """
+    if len(data) < 12 or data[0] >> 6 != 2:
+        return -1
+    length = 12 + 4 * (data[0] & 15)
+    if data[0] & 0x10:      # header extension
+        if len(data) < length + 4:
+            return -1
+        length += 4 + 4 * struct.unpack('>H', data[length + 2:length + 4])[0]
+    if len(data) <= length or data[length] != TS_SYNC:
+        return -1
+    return length
+
+
+class RtpLayer:
+    """
+    Class for stripping RTP header from datagrams carrying TS (auto-detected against raw UDP) and collecting RTP
+    statistics of the flow: sequence loss, duplicates, reordering and interarrival jitter (RFC 3550 A.8)
+    """
+    def __init__(self, history=128):
+        """
+        Initialize object
+
+        :param history: Number of last sequence numbers kept for duplicates and reordering detection. Sequence number
+                        jumps over it (e.g. sender restart) resynchronize the flow instead of counting lost packets
+        """
+        self.mode = None                # None - not detected yet, 'rtp' or 'raw'
+        self.history = history
+        self.__seqs = dict()            # sequence number -> True for the last history packets (insertion ordered)
+        self.__missing = dict()         # sequence number -> True for the last history lost packets (insertion ordered)
+        self.__last_seq = None
+        self.__last_transit = None
+        self.jitter = 0.0               # Interarrival jitter in RTP clock units
+        self.__totals = {'packets': 0, 'lost': 0, 'duplicates': 0, 'reordered': 0, 'resyncs': 0}
+        self.__counts = dict(self.__totals)
+
+    def strip(self, data: bytes, dt: datetime.datetime) -> bytes:
+        """
+        Return TS data of the datagram (RTP header and padding removed)
+
+        :param data: Datagram payload
+        :param dt: Arrival date and time of the datagram
+        :return: TS data
+        """
+        if len(data) == 0:
+            return data
+        if self.mode != 'raw' or data[0] != TS_SYNC:
+            length = rtp_header_length(data)
+            if length < 0:
+                self.mode = 'raw' if data[0] == TS_SYNC else self.mode
+                return data
+            self.mode = 'rtp'
+            seq, timestamp = struct.unpack('>HL', data[2:8])
+            self.__packet(seq, timestamp, dt)
+            end = len(data)
+            if data[0] & 0x20:      # padding: the last byte is padding length
+                end -= data[-1]
+            return data[length:end]
+        return data
+
+    def __packet(self, seq: int, timestamp: int, dt: datetime.datetime):
+        counts = self.__counts
+        counts['packets'] += 1
+        if seq in self.__seqs:
+            counts['duplicates'] += 1
+            return
+        if self.__last_seq is not None:
+            delta = (seq - self.__last_seq) & 0xFFFF
+            if delta <= self.history:
+                for lost in range(self.__last_seq + 1, self.__last_seq + delta):
+                    self.__missing[lost & 0xFFFF] = True
+                while len(self.__missing) > self.history:
+                    del self.__missing[next(iter(self.__missing))]
+                counts['lost'] += delta - 1
+                self.__last_seq = seq
+            elif seq in self.__missing:
+                # Packet is older than the last one: it was counted as lost, but arrived late
+                del self.__missing[seq]
+                counts['reordered'] += 1
+                if counts['lost'] > 0:
+                    counts['lost'] -= 1
+                else:
+                    # Loss was reported in previous interval
+                    self.__totals['lost'] -= 1
+            elif 0x10000 - delta <= self.history:
+                # Older packet which is not missing was received already
+                counts['duplicates'] += 1
+                return
+            else:
+                # Jump out of the window: sender restart or sequence number change
+                counts['resyncs'] += 1
+                self.__missing.clear()
+                self.__last_seq = seq
+        else:
+            self.__last_seq = seq
+        self.__seqs[seq] = True
+        if len(self.__seqs) > self.history:
+            del self.__seqs[next(iter(self.__seqs))]
+        # Interarrival jitter (RFC 3550 A.8)
+        transit = dt.timestamp() * RTP_CLOCK - timestamp
+        if self.__last_transit is not None:
+            d = abs(transit - self.__last_transit)
+            if d < RTP_CLOCK * 60:      # timestamps wrap around or stream restart are ignored
+                self.jitter += (d - self.jitter) / 16
+        self.__last_transit = transit
+
+    def report(self) -> dict:
+        """
+        RTP statistics since previous report (None if flow is not RTP)
+
+        :return: dictionary with packets, lost, duplicates, reordered, resyncs and jitter_ms
+        """
+        if self.mode != 'rtp':
+            return None
+        result = dict(self.__counts, jitter_ms=round(self.jitter / RTP_CLOCK * 1000, 3))
+        for name, value in self.__counts.items():
+            self.__totals[name] += value
+            self.__counts[name] = 0
+        return result
+
+    def get_totals(self) -> dict:
+        """
+        :return: RTP statistics since start including not reported yet (None if flow is not RTP)
+        """
+        if self.mode != 'rtp':
+            return None
+        return {name: value + self.__counts[name] for name, value in self.__totals.items()}
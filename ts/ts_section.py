@@ -0,0 +1,308 @@
+import datetime
+
+"""
+PSI/SI section assembly and DVB SI repetition monitoring (ETSI TR 101 290 3.x, ETSI TS 101 211 4.4):
+    NIT_error           - wrong table_id on PID 0x0010, NIT_actual interval exceeds limit or the same section is
+                          repeated faster than 25 ms
+    SDT_error           - the same for SDT_actual on PID 0x0011
+    EIT_error           - the same for EIT present/following actual on PID 0x0012
+    TDT_error           - the same for TDT on PID 0x0014
+    SI_repetition_error - interval of any monitored table exceeds its limit
+Intervals are kept as integer milliseconds of arrival time. Absence of a table which has been seen is also checked
+at report time
+"""
+
+TABLE_NAMES = {0x40: 'NIT_actual', 0x41: 'NIT_other', 0x42: 'SDT_actual', 0x46: 'SDT_other', 0x4A: 'BAT',
+               0x4E: 'EIT_pf_actual', 0x4F: 'EIT_pf_other', 0x70: 'TDT', 0x71: 'RST', 0x72: 'ST', 0x73: 'TOT'}
+TABLE_NAMES.update({table_id: 'EIT_schedule_actual' for table_id in range(0x50, 0x60)})
+TABLE_NAMES.update({table_id: 'EIT_schedule_other' for table_id in range(0x60, 0x70)})
+
+# table_id -> maximum repetition interval (ms)
+REPETITION_LIMITS_MS = {0x40: 10000, 0x41: 10000, 0x42: 2000, 0x46: 10000, 0x4A: 10000, 0x4E: 2000, 0x4F: 10000,
+                        0x70: 30000, 0x73: 30000}
+REPETITION_LIMITS_MS.update({table_id: 10000 for table_id in range(0x50, 0x60)})
+REPETITION_LIMITS_MS.update({table_id: 30000 for table_id in range(0x60, 0x70)})
+MIN_INTERVAL_MS = 25                # Minimum interval between repetitions of the same section
+
+# PID -> allowed table_id values
+PID_TABLES = {0x10: {0x40, 0x41, 0x72}, 0x11: {0x42, 0x46, 0x4A, 0x72}, 0x12: set(range(0x4E, 0x70)) | {0x72},
+              0x14: {0x70, 0x71, 0x72, 0x73}}
+# table_id -> TR 101 290 error of the table, PID -> error for wrong table_id
+TABLE_ERRORS = {0x40: 'NIT_error', 0x42: 'SDT_error', 0x4E: 'EIT_error', 0x70: 'TDT_error'}
+PID_ERRORS = {0x10: 'NIT_error', 0x11: 'SDT_error', 0x12: 'EIT_error', 0x14: 'TDT_error'}
+ERRORS = ('NIT_error', 'SDT_error', 'EIT_error', 'TDT_error', 'SI_repetition_error')
+
+MAX_SECTION_LENGTH = 4096
+
+
+def section_header(section: bytes) -> tuple:
+    """
+    :param section: Section bytes starting from table_id
+    :return: (table_id, table_id_extension, version_number, section_number). Extension, version and section number
+             are 0 for sections with section_syntax_indicator = 0
+    """
+    if section[1] & 128 and len(section) >= 8:
+        return section[0], (section[3] << 8) | section[4], (section[5] >> 1) & 31, section[6]
+    return section[0], 0, 0, 0
+
+
+class SectionAssembler:
+    """ Class for assembling complete sections from TS packet payloads of several PIDs """
+    def __init__(self):
+        self.__buffers = dict()         # pid -> bytes of incomplete section
+
+    def push(self, pid: int, payload: bytes, pusi: int) -> list:
+        """
+        Add payload of TS packet
+
+        :param pid: PID of the packet
+        :param payload: Payload bytes (starting from pointer_field if pusi is set)
+        :param pusi: payload_unit_start_indicator of the packet
+        :return: list of complete sections (bytes starting from table_id)
+        """
+        sections = list()
+        buffer = self.__buffers.get(pid)
+        if pusi:
+            if len(payload) == 0:
+                return sections
+            pointer_field = payload[0]
+            if buffer is not None:
+                # Tail of the previous section
+                self.__complete(buffer + payload[1:1 + pointer_field], sections)
+            buffer = payload[1 + pointer_field:]
+        elif buffer is not None:
+            buffer += payload
+        else:
+            return sections
+        self.__buffers[pid] = self.__complete(buffer, sections)
+        return sections
+
+    def get_state(self) -> dict:
+        """ :return: Incomplete sections for checkpoint (see ts_checkpoint) """
+        return dict(self.__buffers)
+
+    def set_state(self, state: dict):
+        self.__buffers = dict(state)
+
+    @staticmethod
+    def __complete(buffer: bytes, sections: list) -> bytes:
+        """ Move complete sections from buffer into sections. Remainder of buffer is returned (None if nothing) """
+        while len(buffer) >= 3:
+            if buffer[0] == 0xFF:
+                # Stuffing bytes up to the end of the packet
+                return None
+            length = 3 + (((buffer[1] & 15) << 8) | buffer[2])
+            if length > MAX_SECTION_LENGTH + 3:
+                return None
+            if len(buffer) < length:
+                return buffer
+            sections.append(buffer[:length])
+            buffer = buffer[length:]
+        return buffer if len(buffer) > 0 else None
+
+
+class SiTables:
+    """
+    Class for SI sections decoding and repetition monitoring. Sections are compared with the last received copy of
+    the same section (PID, table_id, table_id_extension, section_number): identical sections are neither CRC checked
+    nor decoded again, changed sections of the same version are CRC checked only and full decoding is done when
+    version changes
+    """
+    def __init__(self, parser, repetition_limits_ms=None, check_timing=True, anomalies=None):
+        """
+        Initialize object
+
+        :param parser: TSParser object with decode_nit, decode_eit, decode_tdt and crc32mpeg2 methods
+        :param anomalies: AnomalyCounter object errors are logged through (aggregated per interval). If None errors
+                          are counted only
+        :param repetition_limits_ms: table_id -> maximum repetition interval in ms (REPETITION_LIMITS_MS if None)
+        :param check_timing: If False repetition intervals are not checked (arrival time is not stream time, e.g. when
+                             TS-file is read)
+        """
+        self.check_timing = check_timing
+        self.anomalies = anomalies
+        self.repetition_limits_ms = repetition_limits_ms if repetition_limits_ms is not None else REPETITION_LIMITS_MS
+        self.__parser = parser
+        self.__assembler = SectionAssembler()
+        self.__decoders = {0x40: parser.decode_nit, 0x41: parser.decode_nit, 0x4E: parser.decode_eit,
+                           0x4F: parser.decode_eit, 0x70: parser.decode_tdt, 0x73: parser.decode_tdt}
+        self.__decoders.update({table_id: parser.decode_eit for table_id in range(0x50, 0x70)})
+        self.__sections = dict()        # (pid, table_id, extension, section_number) -> [bytes, version, last ms]
+        self.__tables = dict()          # (pid, table_id) -> [last ms, min, max, sum, count, sections, absent]
+        self.__reported_sections = dict()   # (pid, table_id) -> sections at last report
+        self.__errors = dict.fromkeys(ERRORS, 0)
+        self.__reported_errors = dict.fromkeys(ERRORS, 0)
+        self.__dt = None                # Arrival time of the last data
+
+    def tick(self, dt: datetime.datetime):
+        """
+        Set arrival time of current data (used for absence check at report time)
+        """
+        self.__dt = dt
+
+    def packet(self, pid: int, payload: bytes, pusi: int, dt: datetime.datetime, decode=True) -> tuple:
+        """
+        Account TS packet of SI PID
+
+        :param pid: PID of the packet
+        :param payload: Payload bytes of the packet
+        :param pusi: payload_unit_start_indicator of the packet
+        :param dt: Arrival time of the packet
+        :param decode: If False sections are accounted for repetition and CRC only
+        :return: (list of decoded tables which are new or changed, crc32_ok of completed sections or None if there
+                 are no completed sections)
+        """
+        self.__dt = dt
+        tables = list()
+        crc32_ok = None
+        sections = self.__assembler.push(pid, payload, pusi)
+        if len(sections) == 0:
+            return tables, crc32_ok
+        t_ms = int(dt.timestamp() * 1000)
+        for section in sections:
+            ok, table = self.__section(pid, section, t_ms, dt, decode)
+            crc32_ok = ok if crc32_ok is None else crc32_ok and ok
+            if table is not None:
+                tables.append(table)
+        return tables, crc32_ok
+
+    def __section(self, pid: int, section: bytes, t_ms: int, dt: datetime.datetime, decode: bool) -> tuple:
+        table_id, extension, version, section_number = section_header(section)
+        allowed = PID_TABLES.get(pid)
+        if allowed is not None and table_id not in allowed:
+            self.__error(PID_ERRORS[pid], pid, 'unexpected table_id 0x{:02X}', table_id)
+        key = (pid, table_id, extension, section_number)
+        last = self.__sections.get(key)
+        if last is not None and last[0] == section:
+            # The same section is repeated
+            ok = True
+            table = None
+        else:
+            table = None
+            decoder = self.__decoders.get(table_id) if decode else None
+            if decoder is not None and (last is None or last[1] != version or table_id == 0x70 or table_id == 0x73):
+                table = decoder(section, pid)
+                ok = table is not None and table.crc32_ok
+            elif section[1] & 128 or table_id == 0x73:
+                ok = self.__parser.crc32mpeg2(section) == 0
+            else:
+                ok = True
+            if not ok:
+                return False, None
+            if last is None:
+                last = self.__sections[key] = [section, version, None]
+            else:
+                last[0] = section
+                last[1] = version
+        if (last[2] is not None and t_ms - last[2] < MIN_INTERVAL_MS and table_id in TABLE_ERRORS
+                and self.check_timing):
+            self.__error(TABLE_ERRORS[table_id], pid, '{} section {} repeated after {} ms', TABLE_NAMES[table_id],
+                         section_number, t_ms - last[2])
+        last[2] = t_ms
+        self.__repetition(pid, table_id, t_ms, dt)
+        return ok, table
+
+    def __repetition(self, pid: int, table_id: int, t_ms: int, dt: datetime.datetime):
+        table = self.__tables.get((pid, table_id))
+        if table is None:
+            self.__tables[(pid, table_id)] = [t_ms, 0, 0, 0, 0, 1, False]
+            return
+        interval = t_ms - table[0]
+        table[0] = t_ms
+        table[5] += 1
+        if interval <= 0:
+            return
+        if table[4] == 0 or interval < table[1]:
+            table[1] = interval
+        if table[4] == 0 or interval > table[2]:
+            table[2] = interval
+        table[3] += interval
+        table[4] += 1
+        limit = self.repetition_limits_ms.get(table_id)
+        if limit is not None and interval > limit and not table[6] and self.check_timing:
+            self.__limit_exceeded(pid, table_id, interval, dt)
+        table[6] = False
+
+    def __limit_exceeded(self, pid: int, table_id: int, interval: int, dt: datetime.datetime):
+        self.__error('SI_repetition_error', pid, '{} repetition interval {} ms exceeds {} ms',
+                     TABLE_NAMES.get(table_id, '0x{:02X}'.format(table_id)), interval,
+                     self.repetition_limits_ms[table_id])
+        if table_id in TABLE_ERRORS:
+            self.__errors[TABLE_ERRORS[table_id]] += 1
+
+    def __error(self, name: str, pid: int, msg: str, *args):
+        self.__errors[name] += 1
+        if self.anomalies is not None:
+            self.anomalies.count(pid, name, msg, *args)
+
+    def __check_absence(self):
+        """ Count tables which have not been received longer than their limit (once per absence) """
+        if self.__dt is None or not self.check_timing:
+            return
+        t_ms = int(self.__dt.timestamp() * 1000)
+        for (pid, table_id), table in self.__tables.items():
+            limit = self.repetition_limits_ms.get(table_id)
+            if limit is not None and not table[6] and t_ms - table[0] > limit:
+                table[6] = True
+                self.__limit_exceeded(pid, table_id, t_ms - table[0], self.__dt)
+
+    def report(self, final=False) -> dict:
+        """
+        SI statistics since previous report
+
+        :param final: If True statistics since start are reported
+        :return: {'errors': {error: count}, 'tables': list of {'pid', 'table_id', 'table', 'sections', 'interval_ms'
+                 ({min, max, mean} since start), 'limit_ms'}} or None if no SI sections received
+        """
+        self.__check_absence()
+        if len(self.__tables) == 0:
+            return None
+        tables = list()
+        for (pid, table_id), table in sorted(self.__tables.items()):
+            sections = table[5] if final else table[5] - self.__reported_sections.get((pid, table_id), 0)
+            tables.append({'pid': pid, 'table_id': table_id,
+                           'table': TABLE_NAMES.get(table_id, '0x{:02X}'.format(table_id)), 'sections': sections,
+                           'interval_ms': ({'min': table[1], 'max': table[2], 'mean': round(table[3] / table[4])}
+                                           if table[4] > 0 else None),
+                           'limit_ms': self.repetition_limits_ms.get(table_id)})
+            if not final:
+                self.__reported_sections[(pid, table_id)] = table[5]
+        if final:
+            errors = dict(self.__errors)
+        else:
+            errors = {name: value - self.__reported_errors[name] for name, value in self.__errors.items()}
+            self.__reported_errors = dict(self.__errors)
+        return {'errors': errors, 'tables': tables}
+
+    def get_totals(self) -> dict:
+        """
+        :return: SI statistics since start (see report)
+        """
+        return self.report(final=True)
+
+    def get_state(self) -> dict:
+        """
+        :return: State for checkpoint (see ts_checkpoint): last copies of sections, repetition statistics, error
+                 counters and incomplete sections
+        """
+        return {'sections': {key: list(value) for key, value in self.__sections.items()},
+                'tables': {key: list(value) for key, value in self.__tables.items()},
+                'reported_sections': dict(self.__reported_sections), 'errors': dict(self.__errors),
+                'reported_errors': dict(self.__reported_errors), 'assembler': self.__assembler.get_state()}
+
+    def set_state(self, state: dict, live=False):
+        """
+        :param state: State returned by get_state
+        :param live: If True the stream is resumed after a gap: repetition intervals are measured from the first
+                     sections after the gap and incomplete sections are dropped
+        """
+        self.__sections = {key: list(value) for key, value in state['sections'].items()}
+        self.__errors = dict(state['errors'])
+        self.__reported_errors = dict(state['reported_errors'])
+        if live:
+            for section in self.__sections.values():
+                section[2] = None
+        else:
+            self.__tables = {key: list(value) for key, value in state['tables'].items()}
+            self.__reported_sections = dict(state['reported_sections'])
+            self.__assembler.set_state(state['assembler'])
@@ -1,19 +1,34 @@
 from models.TSPacket import TSPacket
 from models.Programs import Programs
-from views.viever import Viewer
+from ts.ts_pcr import PcrAnalyzer
+from ts.ts_bitrate import BitrateMeter
+from ts.ts_mdi import MdiAnalyzer
 import datetime
 import threading
+import time
 import copy
 import json
+import logging
 from events.event import Event
 
 """
 ETSI TR 101 290 V1.3.1 - Digital Video Broadcasting (DVB); Measurement guidelines for DVB systems
 """
 
+# stream_type -> PID_error timeout (s) for streams which packets may be rare (private sections, private PES with
+# subtitles/teletext/data, DSM-CC, metadata)
+STREAM_TYPE_PID_TIMEOUTS_S = {5: 30, 6: 30, 11: 30, 12: 30, 13: 30, 21: 30}
+# PIDs which are not referred by PSI but expected in TS (PSI/SI, DigiCipher 2/ATSC, null packets)
+RESERVED_PIDS = frozenset(range(32)) | {8187, 8191}
+
 
 class PidStat:
     """ Class for collecting statistics per PID based on ETSI TR 101 290 V1.3.1 """
+    # Names of all counters (packet counters and TR 101 290 error classes)
+    COUNTERS = ('Packet_count', 'Scrambled_count', 'TS_sync_loss', 'Sync_byte_error', 'PAT_error', 'CC_errors',
+                'PMT_error', 'PID_error', 'Transport_error', 'CRC_error', 'PCR_repetition_error',
+                'PCR_discontinuity_indicator_error', 'PTS_error', 'CAT_error')
+
     def __init__(self):
         self.Packet_count = 0
         self.Scrambled_count = 0
@@ -42,6 +57,7 @@ class PidStat:
         self.x_pts_dt = None
         self.cc = None
         self.x_cc_repeated = False
+        self.x_pid_missing = False  # PID_error is counted for current absence of the PID
 
     def __str__(self):
         lst = ['{"Packet_count":', str(self.Packet_count),
@@ -66,39 +82,110 @@ class PidStat:
 
 
 class Statistics:
-    def __init__(self, psize=188, pcap=False, interval_s=1, skip_cc_err_for_first_ms=100):
+    def __init__(self, psize=188, pcap=False, interval_s=1, skip_cc_err_for_first_ms=100, anomalies=None,
+                 profiler=None, pcr_window=256, bitrate_bin_ms=10, bitrate_window_s=10,
+                 media_rate_bps=None, pid_timeout_s=5, pid_timeouts_s=None, stream_type_timeouts_s=None):
+        """
+        Initialize object
+
+        :param psize: TS packet size. Default is 188 bytes
+        :param pcap: If True stat intervals are generated from packets timestamps instead of timer
+        :param interval_s: Statistics interval in seconds
+        :param skip_cc_err_for_first_ms: Skipping CC errors for first milliseconds
+        :param anomalies: AnomalyCounter object which summary is logged once per statistics interval
+        :param profiler: Profiler object (see ts_profiler). If set, its counters are added to each stat interval
+        :param pcr_window: Number of last PCRs per PCR PID used for PCR_AC/OJ/FO/DR measurements (see ts_pcr)
+        :param bitrate_bin_ms: Bin length of min/max/percentile bitrate measurements (see ts_bitrate)
+        :param bitrate_window_s: Sliding window of min/max/percentile bitrate measurements
+        :param media_rate_bps: Nominal media rate for MDI delay factor (see ts_mdi). Default is measured rate
+        :param pid_timeout_s: Default PID_error period (PID does not occur for this time)
+        :param pid_timeouts_s: PID -> PID_error period (s) overriding default and stream type periods
+        :param stream_type_timeouts_s: stream_type -> PID_error period (s) of elementary PIDs. Default is
+                                       STREAM_TYPE_PID_TIMEOUTS_S
+        """
         self.__pcap = pcap
         self.__stat = None
         self.__stat_prev = None
         self.__stat_program_prev = None
+        self.__stat_programs_prev = dict()      # program_number -> PidStat of programs at previous interval
+        self.__stat_index = dict()              # pid -> stat item of self.__stat
+        self.__pid_timeout = datetime.timedelta(seconds=pid_timeout_s)
+        self.pid_timeouts_s = pid_timeouts_s if pid_timeouts_s is not None else dict()
+        self.stream_type_timeouts_s = (stream_type_timeouts_s if stream_type_timeouts_s is not None
+                                       else STREAM_TYPE_PID_TIMEOUTS_S)
+        self.__pid_timeouts = {pid: datetime.timedelta(seconds=value) for pid, value in self.pid_timeouts_s.items()}
+        self.__cat_received = False
+        self.__cat_error_counted = False    # CAT_error for scrambled packets is counted once per interval
+        self.__unreferenced_pids = set()
+        self.known_pids = RESERVED_PIDS     # PIDs which are not reported as unreferenced (see TSReader.known_pids)
+        self.__cc_state = dict()            # pid -> continuity counter preceding the first packet (see set_cc_state)
         self.__interval = interval_s
         self.__psize = psize * 8
         self.first_pk_dt = None
         self.__last_dt = None
         self.__current_dt = None
         self.__skip_cc_err_for_ms = skip_cc_err_for_first_ms
+        self.__packet_index = 0     # Number of packets received (for byte position of PCR packets)
+        self.__position = (0, 0)    # (byte position, __packet_index before the packet) set by set_position
+        self.pcr = PcrAnalyzer(window=pcr_window)
+        self.bitrate = BitrateMeter(psize=psize, bin_ms=bitrate_bin_ms, window_s=bitrate_window_s)
+        self.mdi = MdiAnalyzer(media_rate_bps=media_rate_bps)
+        self.__datagrams_received = False
+        self.__datagram = None      # (arrival time, number of TS packets, __packet_index before it) of last datagram
+        self.__packet_s = None      # Mean transmission time of one TS packet (s) measured from datagram arrivals
+        self.__report_sections = list()     # [(name, function, final function)] of additional interval report sections
+        self.__checkpointed_sections = set()    # Names of report sections which state is saved in checkpoint
+        self.anomalies = anomalies
+        self.profiler = profiler
+        if profiler is not None:
+            # Instance attribute shadows the method, so handlers connected later are timed
+            self.update_stat = profiler.timed('update_stat', self.update_stat)
         self.__start_timer()
 
         self.monitoring_start_dt = None
         self.monitoring_end_dt = None
+        self.resumed_dt = None      # Time the state was restored from checkpoint (see set_state)
         self.pat_received_dt = None
         self.pmt_received_dt = None
         self.cat_received_dt = None
         self.sdt_received_dt = None
 
         self.programs = Programs()
-        self.viewer = Viewer()
+        self.__viewer = None
+        # Cumulative counters and bitrates of the last stat interval. New dictionary is assigned on each interval
+        # (never modified in place), so it can be read from other threads without locking
+        self.snapshot = None
+        # Deltas (counters of the interval) and bitrates of the last stat interval: {'dt', 'program': {'bitrate',
+        # <counters>}, 'pids': {pid: {'bitrate', <counters>}}, 'programs': {program_number: {'bitrate',
+        # 'service_name', <counters>}}}. Assigned like snapshot (see ts_alarm)
+        self.interval = None
 
         # Events
+        self.onIntervalReady = Event()      # Fired for each stat interval with interval deltas before report sections
         self.onStatReady = Event()          # Fired for each stat interval
         self.onFinalStatReady = Event()     # Fired when final start is ready
 
+    @property
+    def viewer(self):
+        # Viewer is created on first use only (it is needed for debug output)
+        if self.__viewer is None:
+            from views.viever import Viewer
+            self.__viewer = Viewer()
+        return self.__viewer
+
     def __start_timer(self):
         self.__timer = threading.Timer(self.__interval, self.__generate_stat)
         self.__timer.start()
 
     def update_programs_info(self, dt: datetime, programs: Programs, pat=None, pmt=None, cat=None, sdt=None):
         self.programs = copy.deepcopy(programs)
+        if pmt is not None:
+            self.__update_pid_timeouts()
+        # Referenced PIDs may change, so all PIDs are checked again (PSI updates are rare)
+        unreferenced_pids = self.__unreferenced_pids
+        self.__unreferenced_pids = set()
+        for pid in list(self.__stat_index):
+            self.__check_referenced(pid, dt, pid not in unreferenced_pids)
         if pat is not None:
             self.pat_received_dt = dt
         if pmt is not None:
@@ -114,30 +201,230 @@ class Statistics:
         if bat is not None:
             self.viewer.print_bat(bat, dt=dt)"""
 
+    def __update_pid_timeouts(self):
+        """ Resolve PID_error period of elementary PIDs by stream_type (once per PMT change, not per packet) """
+        pid_timeouts = dict()
+        for pmt_pid in self.programs.get_pmt_pids():
+            pmt = self.programs.get_prog_pmt(pmt_pid)
+            if pmt is None:
+                continue
+            for stream in pmt.streams:
+                if stream['stream_type'] in self.stream_type_timeouts_s:
+                    pid_timeouts[stream['elementary_pid']] = datetime.timedelta(
+                        seconds=self.stream_type_timeouts_s[stream['stream_type']])
+        pid_timeouts.update({pid: datetime.timedelta(seconds=value) for pid, value in self.pid_timeouts_s.items()})
+        self.__pid_timeouts = pid_timeouts
+
+    def __is_referenced(self, pid: int) -> bool:
+        programs = self.programs
+        return (pid in self.known_pids or len(programs.get_pid_programs(pid)) > 0 or pid in programs.get_pmt_pids()
+                or pid in programs.get_net_pids() or pid in programs.get_other_pids())
+
+    def __check_referenced(self, pid: int, dt: datetime, warn=True):
+        """
+        PID is unreferenced if it is not reserved and not referred by PAT, PMT or CAT. Checked only when PMTs of all
+        programs of PAT are received
+        """
+        programs = self.programs
+        if (programs.pat is not None and not self.__is_referenced(pid)
+                and len(programs.get_programs()) >= len(programs.get_pmt_pids())):
+            if warn:
+                logging.warning('{}: PID=0x{:04X} is not referred by PSI'.format(dt, pid))
+            self.__unreferenced_pids.add(pid)
+
+    def __check_missing_pids(self, dt: datetime):
+        """ PID_error for referenced PIDs which have not been received longer than their period (once per absence) """
+        for pid, pid_stat in list(self.__stat_index.items()):
+            stat = pid_stat['stat']
+            if (not stat.x_pid_missing and stat.x_pid_dt is not None and pid not in self.__unreferenced_pids
+                    and pid != 8191 and len(self.programs.get_pid_programs(pid)) > 0
+                    and stat.x_pid_dt + self.__pid_timeouts.get(pid, self.__pid_timeout) < dt):
+                stat.x_pid_missing = True
+                stat.PID_error += 1
+                logging.warning('{}: PID=0x{:04X} is missing since {}'.format(dt, pid, stat.x_pid_dt))
+
+    def get_state(self) -> dict:
+        """
+        :return: State for checkpoint (see ts_checkpoint): counters and per PID state, previous interval counters,
+                 times, programs, PCR analyzers and bitrate bins. Report sections of other analyzers are not included
+                 (they are reported since resume, see get_stat). Must be called from the thread which updates
+                 statistics
+        """
+        return {'stat': copy.deepcopy(self.__stat), 'stat_prev': self.__stat_prev,
+                'stat_program_prev': self.__stat_program_prev, 'stat_programs_prev': self.__stat_programs_prev,
+                'first_pk_dt': self.first_pk_dt, 'last_dt': self.__last_dt, 'current_dt': self.__current_dt,
+                'pat_received_dt': self.pat_received_dt, 'pmt_received_dt': self.pmt_received_dt,
+                'cat_received_dt': self.cat_received_dt, 'sdt_received_dt': self.sdt_received_dt,
+                'cat_received': self.__cat_received, 'unreferenced_pids': set(self.__unreferenced_pids),
+                'packet_index': self.__packet_index, 'skip_cc_err_for_ms': self.__skip_cc_err_for_ms,
+                'pid_timeouts': dict(self.__pid_timeouts), 'programs': self.programs.get_state(),
+                'pcr': self.pcr.get_state(), 'bitrate': self.bitrate.get_state()}
+
+    def set_state(self, state: dict, live=False):
+        """
+        :param state: State returned by get_state
+        :param live: If True the stream is resumed after a gap (monitor restart): counters and programs are kept,
+                     but CC and timing references are dropped (no CC/PAT/PMT/PID errors caused by the gap) and the
+                     next interval starts at the first packet after the gap. Otherwise the stream continues exactly
+                     after the checkpoint (offline analysis); arrival times (not pcap mode) are shifted by the pause
+        """
+        self.__stat = state['stat']
+        self.__stat_index = {pid_stat['pid']: pid_stat for pid_stat in self.__stat or list()}
+        self.__stat_prev = state['stat_prev']
+        self.__stat_program_prev = state['stat_program_prev']
+        self.__stat_programs_prev = state['stat_programs_prev']
+        self.first_pk_dt = state['first_pk_dt']
+        self.pat_received_dt = state['pat_received_dt']
+        self.pmt_received_dt = state['pmt_received_dt']
+        self.cat_received_dt = state['cat_received_dt']
+        self.sdt_received_dt = state['sdt_received_dt']
+        self.__cat_received = state['cat_received']
+        self.__unreferenced_pids = set(state['unreferenced_pids'])
+        self.__packet_index = state['packet_index']
+        self.__skip_cc_err_for_ms = state['skip_cc_err_for_ms']
+        self.__pid_timeouts = dict(state['pid_timeouts'])
+        programs = Programs()
+        programs.set_state(state['programs'])
+        self.programs = programs
+        self.resumed_dt = datetime.datetime.now()
+        if live:
+            for pid_stat in self.__stat or list():
+                stat = pid_stat['stat']
+                stat.cc = stat.x_pam_dt = stat.x_pmt_dt = stat.x_pid_dt = stat.x_pcr_dt = stat.x_pts_dt = None
+                stat.x_cc_repeated = stat.x_pid_missing = False
+            # Counters received before the gap are already reported
+            if self.__stat is not None:
+                self.__stat_prev = copy.deepcopy(self.__stat)
+                self.__stat_program_prev = PidStat()
+                self.__stat_programs_prev = dict()
+                for pid_stat in self.__stat:
+                    self.__add_counters(self.__stat_program_prev, pid_stat['stat'])
+                    for program_number in programs.get_pid_programs(pid_stat['pid']):
+                        self.__add_counters(self.__stat_programs_prev.setdefault(program_number, PidStat()),
+                                            pid_stat['stat'])
+            self.__last_dt = self.__current_dt = datetime.datetime.now()
+            self.pcr.set_state(state['pcr'], live=True)
+            self.bitrate.set_state(state['bitrate'], live=True)
+        else:
+            self.__last_dt = state['last_dt']
+            self.__current_dt = state['current_dt']
+            shift = datetime.timedelta()
+            if not self.__pcap and self.__current_dt is not None:
+                # Packet times are arrival times: the pause between checkpoint and resume is not a stream gap
+                shift = self.resumed_dt - self.__current_dt
+                self.__shift_times(shift)
+            self.pcr.set_state(state['pcr'], shift_s=shift.total_seconds())
+            self.bitrate.set_state(state['bitrate'], shift_s=shift.total_seconds())
+
+    def __shift_times(self, delta: datetime.timedelta):
+        def shift(dt):
+            return dt + delta if dt is not None else None
+        for pid_stat in self.__stat or list():
+            stat = pid_stat['stat']
+            stat.x_pam_dt, stat.x_pmt_dt, stat.x_pid_dt, stat.x_pcr_dt, stat.x_pts_dt = (
+                shift(stat.x_pam_dt), shift(stat.x_pmt_dt), shift(stat.x_pid_dt), shift(stat.x_pcr_dt),
+                shift(stat.x_pts_dt))
+        self.first_pk_dt = shift(self.first_pk_dt)
+        self.pat_received_dt = shift(self.pat_received_dt)
+        self.pmt_received_dt = shift(self.pmt_received_dt)
+        self.cat_received_dt = shift(self.cat_received_dt)
+        self.sdt_received_dt = shift(self.sdt_received_dt)
+        self.__last_dt = shift(self.__last_dt)
+        self.__current_dt = shift(self.__current_dt)
+
+    def set_cc_state(self, cc_state: dict):
+        """
+        Set continuity counters preceding the first analyzed packet of each PID, so CC errors are detected from the
+        first packet when the stream is analyzed from the middle (see ts_index)
+
+        :param cc_state: pid -> continuity counter
+        """
+        self.__cc_state = dict(cc_state)
+
+    def set_position(self, position: int):
+        """
+        Set byte position of the next packet in the stream, when packets are not read contiguously (e.g. PIDs are
+        filtered through ts_index). Byte positions of PCR packets are used for PCR_AC
+
+        :param position: Byte position (offset in TS-file) of the next packet
+        """
+        self.__position = (position, self.__packet_index)
+
+    def add_report_section(self, name: str, func, final_func=None, checkpointed=False):
+        """
+        Add section to interval reports
+
+        :param name: Section name (JSON key)
+        :param func: Function without arguments returning JSON serializable section data (or None to skip section)
+        :param final_func: The same for final report. Section is not added to final report if None
+        :param checkpointed: True if state of the section analyzer is saved in checkpoint (see ts_checkpoint).
+                             Totals of other sections are listed as counted since resume in final report
+        """
+        self.__report_sections.append((name, func, final_func))
+        if checkpointed:
+            self.__checkpointed_sections.add(name)
+
+    def update_datagram(self, dt: datetime, size: int):
+        """
+        Collect network statistic (inter-arrival time, MDI) for each received datagram
+
+        :param dt: Arrival date and time of the datagram
+        :param size: Size of TS data in the datagram
+        """
+        self.__datagrams_received = True
+        t = dt.timestamp()
+        self.mdi.datagram(t, size)
+        packets = size // (self.__psize // 8)
+        if self.__datagram is not None and packets > 0:
+            # Packets of the datagram were sent after the previous datagram (gaps over 100 ms are not sending time)
+            packet_s = (t - self.__datagram[0]) / packets
+            if 0 < packet_s * packets < 0.1:
+                self.__packet_s = (packet_s if self.__packet_s is None
+                                   else self.__packet_s + (packet_s - self.__packet_s) / 16)
+        self.__datagram = (t, packets, self.__packet_index)
+
+    def __arrival_time(self, dpk: TSPacket) -> float:
+        """
+        :param dpk: Last received TS packet
+        :return: Arrival time of the packet. All packets of a datagram get its timestamp, so the time is interpolated
+                 by position of the packet in the datagram (the datagram timestamp is the time of its last packet).
+                 None if packet transmission time is not measured yet
+        """
+        datagram = self.__datagram
+        if datagram is None:
+            return dpk.dt.timestamp()
+        if self.__packet_s is None:
+            return None
+        position = self.__packet_index - 1 - datagram[2]
+        return datagram[0] - max(datagram[1] - 1 - position, 0) * self.__packet_s
+
     def update_stat(self, dpk: TSPacket, rsync: int, pat=None, pmt=None, cat=None, crc32_ok=None, pcr_pid=False,
                     pes=None):
         if self.first_pk_dt is None:
             self.first_pk_dt = dpk.dt
-        pid_stat = None
+        self.__packet_index += 1
+        self.bitrate.add(dpk.tsh_pid, dpk.dt)
         is_new_pid = False
-        index = 0
         if self.__stat is None:
             self.__stat = list()
-        else:
-            # Find stat object for pid
-            for stat in self.__stat:
-                if stat['pid'] == dpk.tsh_pid:
-                    pid_stat = stat
-                    break
-                index += 1
+        pid_stat = self.__stat_index.get(dpk.tsh_pid)
         if pid_stat is None:
             pid_stat = {'pid': dpk.tsh_pid, 'stat': PidStat()}
+            pid_stat['stat'].cc = self.__cc_state.get(dpk.tsh_pid)
             is_new_pid = True
+            self.__check_referenced(dpk.tsh_pid, dpk.dt)
 
         # Packet count
         pid_stat['stat'].Packet_count += 1
         if dpk.tsh_tsc != 0:
             pid_stat['stat'].Scrambled_count += 1
+            # CAT_error
+            # Packets with transport_scrambling_control not 00 present, but no section with table_id = 0x01
+            # (i.e. a CAT) present. Counted once per stat interval while CAT is missing
+            if not self.__cat_received and not self.__cat_error_counted:
+                self.__cat_error_counted = True
+                pid_stat['stat'].CAT_error += 1
+                logging.warning('{}: PID=0x{:04X} scrambled packets without CAT'.format(dpk.dt, dpk.tsh_pid))
         # Rsync
         if rsync != 0:
             pid_stat['stat'].TS_sync_loss += 1
@@ -181,6 +468,8 @@ class Statistics:
                 elif ((dpk.tsh_cc > 15
                        or (pid_stat['stat'].cc < 15 and pid_stat['stat'].cc + 1 != dpk.tsh_cc)
                        or (pid_stat['stat'].cc == 15 and dpk.tsh_cc != 0))):
+                    # Lost packets for MDI media loss rate
+                    self.mdi.lost((dpk.tsh_cc - pid_stat['stat'].cc - 1) % 16)
                     # Skip CC_error for first self.__skip_cc_err_for_ms
                     if self.__skip_cc_err_for_ms is not None:
                         if (self.first_pk_dt + datetime.timedelta(milliseconds=self.__skip_cc_err_for_ms) < dpk.dt):
@@ -191,6 +480,8 @@ class Statistics:
                     else:
                         pid_stat['stat'].CC_errors += 1
                     #print('{} CC_error PID=0x{:04X} CC={}'.format(dpk.dt, dpk.tsh_pid, dpk.tsh_cc))         # Debug
+            if pid_stat['stat'].cc != dpk.tsh_cc:
+                pid_stat['stat'].x_cc_repeated = False     # Single duplicate packet is allowed again
             pid_stat['stat'].cc = dpk.tsh_cc
         # PMT_error
         # Sections with table_id 0x02, (i.e. a PMT), do not
@@ -211,7 +502,12 @@ class Statistics:
         # NOTE: For PIDs carrying other information such as sub-titles, data services or audio services with
         # ISO 639 [i.17] language descriptor with type greater than '0', the time between two consecutive
         # packets of the same PID may be significantly longer.
-        if pid_stat['stat'].x_pid_dt is not None and pid_stat['stat'].x_pid_dt + datetime.timedelta(seconds=5) < dpk.dt:
+        # Period is configured per PID (see pid_timeouts_s, stream_type_timeouts_s). Absence of referred PIDs is also
+        # checked at each stat interval (see __check_missing_pids), so PID_error is reported while PID is missing
+        if pid_stat['stat'].x_pid_missing:
+            pid_stat['stat'].x_pid_missing = False
+        elif (pid_stat['stat'].x_pid_dt is not None
+              and pid_stat['stat'].x_pid_dt + self.__pid_timeouts.get(dpk.tsh_pid, self.__pid_timeout) < dpk.dt):
             pid_stat['stat'].PID_error += 1
         pid_stat['stat'].x_pid_dt = dpk.dt
         # Transport_error
@@ -222,8 +518,8 @@ class Statistics:
         # CRC error occurred in CAT, PAT, PMT, NIT, EIT, BAT, SDT or TOT table
         if crc32_ok is not None and crc32_ok is False:
             pid_stat['stat'].CRC_error += 1
-        # PCR errors
-        if pcr_pid:
+        # PCR errors (only packets which carry PCR are checked)
+        if pcr_pid and dpk.af_pcrf:
             if pid_stat['stat'].x_pcr_dt is not None:
                 # PCR_discontinuity_indicator_error
                 # The difference between two consecutive PCR values (PCRi+1 – PCRi) is outside the range of
@@ -235,6 +531,11 @@ class Statistics:
                 elif pid_stat['stat'].x_pcr_dt + datetime.timedelta(milliseconds=40) < dpk.dt:
                     pid_stat['stat'].PCR_repetition_error += 1
             pid_stat['stat'].x_pcr_dt = dpk.dt
+            # PCR_AC, PCR_OJ, PCR_FO, PCR_DR are measured once per stat interval
+            t = self.__arrival_time(dpk)
+            if t is not None:
+                position = self.__position[0] + (self.__packet_index - 1 - self.__position[1]) * (self.__psize // 8)
+                self.pcr.add(dpk.tsh_pid, dpk.af_pcr, t, position, dpk.af_disc == 1)
         # PTS_error
         # PTS repetition period more than 700 ms
         if pes is not None:
@@ -246,13 +547,15 @@ class Statistics:
         # Packets with transport_scrambling_control not 00 present, but no section with table_id = 0x01
         # (i.e. a CAT) present
         # Section with table_id other than 0x01 (i.e. not a CAT) found on PID 0x0001
-        if cat is not None and cat.table_id != 1:
-            pid_stat['stat'].CAT_error += 1
+        if cat is not None:
+            if cat.table_id != 1:
+                pid_stat['stat'].CAT_error += 1
+            elif cat.crc32_ok:
+                self.__cat_received = True
         # Update stat data
         if is_new_pid:
             self.__stat.append(pid_stat)
-        else:
-            self.__stat[index] = pid_stat
+            self.__stat_index[dpk.tsh_pid] = pid_stat
         # Check if need generate stat (in case of parsing pcap file instead of real stream)
         self.__current_dt = dpk.dt
         if self.__last_dt is None:
@@ -262,15 +565,27 @@ class Statistics:
             self.__generate_stat()
 
     def __generate_stat(self, restart_timer=True, is_final=False):
+        if self.profiler is not None:
+            start_ns = time.perf_counter_ns()
         result = None
         if self.__stat is not None:
+            if not is_final:
+                self.__check_missing_pids(self.__current_dt)
+                self.__cat_error_counted = False
             if self.__stat_prev is None or is_final:
                 self.__stat_program_prev = PidStat()
+                self.__stat_programs_prev = dict()
                 self.__stat_prev = list()
 
-            # Calculate Program stat
+            # Calculate Program stat and stat per program of PAT (MPTS) in the same pass. PIDs are mapped to programs
+            # by index of Programs (PIDs shared by several programs are added to each of them)
             stat_program = PidStat()
+            programs = self.programs.get_programs()
+            stat_programs = {program_number: PidStat() for program_number in programs}
             for pid in self.__stat:
+                for program_number in self.programs.get_pid_programs(pid['pid']):
+                    if program_number in stat_programs:
+                        self.__add_counters(stat_programs[program_number], pid['stat'])
                 stat_program.Packet_count += pid['stat'].Packet_count
                 stat_program.Scrambled_count += pid['stat'].Scrambled_count
                 stat_program.TS_sync_loss += pid['stat'].TS_sync_loss
@@ -308,6 +623,12 @@ class Statistics:
                                 '","first_pk_dt":"', str(self.first_pk_dt),
                                 '","pat_received_dt":"', str(self.pat_received_dt),
                                 '","pmt_received_dt":"', str(self.pmt_received_dt), '"']
+                if self.resumed_dt is not None:
+                    # Totals of these sections are not saved in checkpoint: they are counted since resume
+                    results_list.extend([',"resumed_dt":"', str(self.resumed_dt), '","since_resume":',
+                                         json.dumps([name for name, func, final_func in self.__report_sections
+                                                     if final_func is not None
+                                                     and name not in self.__checkpointed_sections])])
             else:
                 time_delta = (self.__current_dt - self.__last_dt).total_seconds()
                 if time_delta == 0:
@@ -321,22 +642,87 @@ class Statistics:
             # Add stat for program and per pid
             results_list.append(',"pids":[')
             pids_stat = ''
+            snapshot_pids = dict()
+            interval_pids = dict()
+            stat_prev_index = {pid_prev['pid']: pid_prev['stat'] for pid_prev in self.__stat_prev}
             for pid in self.__stat:
-                pids_stat += ('{'+'"pid":' + str(pid['pid']) + ',"bitrate":'
-                                 + self.__calc_bitrate(pid['stat'].Packet_count
-                                                       - self.__find_pid_stat_prev(pid['pid']).Packet_count,
-                                                       time_delta))
+                pid_delta = self.__calc_delta(pid['stat'], stat_prev_index.get(pid['pid'], PidStat()))
+                bitrate = self.__calc_bitrate(pid_delta.Packet_count, time_delta)
+                pids_stat += '{'+'"pid":' + str(pid['pid']) + ',"bitrate":' + bitrate
+                if not is_final:
+                    snapshot_pids[pid['pid']] = {'bitrate': int(bitrate), 'last_dt': pid['stat'].x_pid_dt,
+                                                 'stat': {name: getattr(pid['stat'], name)
+                                                          for name in PidStat.COUNTERS}}
+                    interval_pids[pid['pid']] = self.__interval_item(pid_delta, int(bitrate))
                 if has_errors == 1 or is_final:
-                    pids_stat += (',"stat":' + str(self.__calc_delta(pid['stat'],
-                                                                     self.__find_pid_stat_prev(pid['pid']))))
+                    pids_stat += ',"stat":' + str(pid_delta)
                 pids_stat += '},'
             results_list.append(pids_stat[:-1] + ']')
+            if len(self.__unreferenced_pids) > 0:
+                results_list.append(',"unreferenced_pids":' + json.dumps(sorted(self.__unreferenced_pids)))
+            # Add stat per program with service names from SDT
+            snapshot_programs = dict()
+            interval_programs = dict()
+            if len(programs) > 0:
+                programs_stat = list()
+                for program_number, stat in sorted(stat_programs.items()):
+                    delta = self.__calc_delta(stat, self.__stat_programs_prev.get(program_number, PidStat()))
+                    service = self.programs.get_service(program_number) or dict()
+                    program_result = {'program_number': program_number, 'pmt_pid': programs[program_number],
+                                      'service_name': self.__text(service.get('service_name')),
+                                      'service_provider_name': self.__text(service.get('service_provider_name')),
+                                      'bitrate': int(self.__calc_bitrate(delta.Packet_count, time_delta)),
+                                      'has_errors': int(any(getattr(delta, name) != 0
+                                                            for name in PidStat.COUNTERS[1:]))}
+                    if program_result['has_errors'] == 1 or is_final:
+                        program_result['stat'] = {name: getattr(delta, name) for name in PidStat.COUNTERS}
+                    programs_stat.append(program_result)
+                    snapshot_programs[program_number] = {'bitrate': program_result['bitrate'],
+                                                         'service_name': program_result['service_name'],
+                                                         'stat': {name: getattr(stat, name)
+                                                                  for name in PidStat.COUNTERS}}
+                    interval_programs[program_number] = self.__interval_item(
+                        delta, program_result['bitrate'], service_name=program_result['service_name'])
+                results_list.append(',"programs":' + json.dumps(programs_stat))
+            # Add bitrate min/max/mean/percentile of bins (per interval or since start, sliding window for program)
+            bitrate_stat = self.bitrate.get_totals() if is_final else self.bitrate.report()
+            bitrate_window = self.bitrate.report(window=True)
+            results_list.extend([',"bitrate_stat":{"program":', json.dumps(bitrate_stat['program']),
+                                 ',"window":', json.dumps(bitrate_window['program']), ',"pids":',
+                                 json.dumps([dict(pid=pid, **stat) for pid, stat in bitrate_stat['pids'].items()]),
+                                 '}'])
+            # Add network statistic (MDI)
+            if self.__datagrams_received and not is_final:
+                results_list.append(',"mdi":' + json.dumps(self.mdi.report()))
+            # Interval deltas are published before sections of other analyzers, so sections (e.g. alarms) which are
+            # evaluated on them are reported in the same interval
+            if not is_final:
+                program_bitrate = int(self.__calc_bitrate(stat_program_delta.Packet_count, time_delta))
+                self.interval = {'dt': self.__current_dt, 'pids': interval_pids, 'programs': interval_programs,
+                                 'program': self.__interval_item(stat_program_delta, program_bitrate)}
+                if self.onIntervalReady.getHandlerCount() > 0:
+                    self.onIntervalReady.fire(interval=self.interval)
+            # Add sections of other analyzers
+            for name, func, final_func in self.__report_sections:
+                section = (final_func() if final_func is not None else None) if is_final else func()
+                if section is not None:
+                    results_list.append(',"' + name + '":' + json.dumps(section))
+            # Add PCR measurements
+            if len(self.pcr.pids) > 0:
+                results_list.append(',"pcr":' + json.dumps(self.pcr.report(final=is_final)))
 
             results_list.append('}')
             result = ''.join(results_list)
+            if not is_final:
+                self.snapshot = {'dt': self.__current_dt, 'updated': time.time(),
+                                 'program_bitrate': int(self.__calc_bitrate(stat_program_delta.Packet_count,
+                                                                            time_delta)),
+                                 'program_stat': {name: getattr(stat_program, name) for name in PidStat.COUNTERS},
+                                 'pids': snapshot_pids, 'programs': snapshot_programs}
 
             self.__stat_prev = copy.deepcopy(self.__stat)
             self.__stat_program_prev = copy.deepcopy(stat_program)
+            self.__stat_programs_prev = stat_programs
             self.__last_dt = self.__current_dt
         else:
             if is_final:
@@ -349,15 +735,48 @@ class Statistics:
                 result = ''.join(results_list)
             else:
                 result = '{"dt":"' + str(datetime.datetime.now()) + '","has_errors":-1}'
+        if self.anomalies is not None:
+            self.anomalies.flush(self.__current_dt)
+        if self.profiler is not None:
+            self.profiler.add_stage('report', time.perf_counter_ns() - start_ns)
+            result = result[:-1] + ',"profile":' + json.dumps(self.profiler.get_profile()) + '}'
         if restart_timer:
             self.__start_timer()
         if (not is_final) and self.onStatReady.getHandlerCount() > 0:
+            if self.profiler is not None:
+                start_ns = time.perf_counter_ns()
+                self.onStatReady.fire(stat_result=result)
+                self.profiler.add_stage('print', time.perf_counter_ns() - start_ns)
+            else:
                 self.onStatReady.fire(stat_result=result)
         return result
 
+    def get_profile(self) -> dict:
+        """
+        :return: Profiler counters (see ts_profiler.Profiler.get_profile) or None if profiling is disabled
+        """
+        return self.profiler.get_profile() if self.profiler is not None else None
+
     def __calc_bitrate(self, packet_count: int, time_delta: float) -> str:
         return str(round(packet_count*self.__psize/time_delta))
 
+    @staticmethod
+    def __add_counters(stat: PidStat, stat_pid: PidStat):
+        for name in PidStat.COUNTERS:
+            setattr(stat, name, getattr(stat, name) + getattr(stat_pid, name))
+
+    @staticmethod
+    def __interval_item(delta: PidStat, bitrate: int, **kwargs) -> dict:
+        item = {name: getattr(delta, name) for name in PidStat.COUNTERS}
+        item['bitrate'] = bitrate
+        item.update(kwargs)
+        return item
+
+    @staticmethod
+    def __text(value):
+        # Service names which are not decoded (unknown character table) are reported as Latin-1
+        return value.decode('latin-1') if isinstance(value, bytes) else value
+
     def __calc_delta(self, stat: PidStat, stat_prev: PidStat) -> PidStat:
         stat_delta = PidStat()
         stat_delta.Packet_count = stat.Packet_count - stat_prev.Packet_count
@@ -377,12 +796,6 @@ class Statistics:
         stat_delta.CAT_error = stat.CAT_error - stat_prev.CAT_error
         return stat_delta
 
-    def __find_pid_stat_prev(self, pid: int) -> PidStat:
-        for pid_prev in self.__stat_prev:
-            if pid == pid_prev['pid']:
-                return pid_prev['stat']
-        return PidStat()
-
     def get_stat(self) -> dict:
         self.__timer.cancel()
         self.__generate_stat(restart_timer=False)
@@ -1,30 +1,145 @@
-import datetime
-from ts.ts_reader import TSReader
-from views.viever import Viewer
-from ts.ts_stat import Statistics
+import argparse
 
 
-source_file = r'c:\Users\vitaliy_ko\PycharmProjects\iptv\samples\setanta2.m2ts'
-source_file = r'd:\Downloads\692-inadv-vid-1k-387623377.ts'
+#source_file = r'c:\Users\vitaliy_ko\PycharmProjects\iptv\samples\setanta2.m2ts'
+#source_file = r'd:\Downloads\692-inadv-vid-1k-387623377.ts'
+
+def tsfile_reader(source_file: str, psize=188, chunksize=7, stat_interval_s=10, profile=False, start_s=None,
+                  end_s=None, pids=None, checkpoint=None) -> dict:
+    """
+    Analyze multicast IPTV stream recorded into video MPEG TS-file
+
+    :param source_file: Full path to TS-file
+    :param psize: TS packet size. Default is 188 bytes
+    :param chunksize: Number of TS packets read at once (as in one UDP datagram)
+    :param stat_interval_s: Statistics output interval in seconds
+    :param profile: If True hot-path profiling counters are collected and added to statistics (see ts_profiler)
+    :param start_s: Analyze from this stream time in seconds (PCR based, see ts_index)
+    :param end_s: Analyze up to this stream time in seconds
+    :param pids: Analyze these PIDs only (and PSI/SI). If start_s, end_s or pids is set, the file is read through
+                 its sidecar index (built on first use) with statistics intervals by stream time
+    :param checkpoint: Checkpoint file path. Analyzer state and file offset are saved periodically, so interrupted
+                       analysis resumes at the saved offset (see ts_checkpoint). Not used with the sidecar index
+    :return: Final statistics
+    """
+    import datetime
+    import mmap
+    from ts.ts_reader import TSReader
+    from views.viever import Viewer
+    from ts.ts_stat import Statistics
+    from ts.ts_profiler import Profiler
+    from ts.ts_pes import PesTracker
+    from ts.ts_es import EsScanner
+    from ts.ts_freeze import FreezeDetector
 
-def main():
-    psize = 188
-    chunksize = 7
     viewer = Viewer()
-    stats = Statistics()
-    ts_reader = TSReader(statistics=stats)
+    ts_reader = TSReader(profiler=Profiler() if profile else None, pes_tracker=PesTracker(), es_scanner=EsScanner(),
+                         freeze_detector=FreezeDetector())
+    indexed = start_s is not None or end_s is not None or pids is not None
+    stats = Statistics(psize=psize, pcap=indexed, interval_s=stat_interval_s, anomalies=ts_reader.anomalies,
+                       profiler=ts_reader.profiler)
+    stats.add_report_section('pes', ts_reader.pes_tracker.report, ts_reader.pes_tracker.get_totals)
+    stats.add_report_section('es', ts_reader.es_scanner.report, ts_reader.es_scanner.get_totals)
+    stats.add_report_section('freeze', ts_reader.freeze_detector.report, ts_reader.freeze_detector.get_totals)
+    # File is read faster than real time (stream time is used with index)
+    ts_reader.si.check_timing = indexed
+    stats.pcr.check_timing = indexed
+    stats.add_report_section('si', ts_reader.si.report, ts_reader.si.get_totals, checkpointed=True)
+    stats.known_pids = ts_reader.known_pids
+    stats.onStatReady += viewer.print_stat_result
+    stats.onFinalStatReady += viewer.print_final_stat_result
+    ts_reader.onPacketDecoded += stats.update_stat
+    ts_reader.onPatReceived += stats.update_programs_info
+    ts_reader.onPmtReceived += stats.update_programs_info
+    ts_reader.onCatReceived += stats.update_programs_info
+    ts_reader.onProgramSdtReceived += stats.update_programs_info
+
+    if indexed:
+        from ts.ts_index import TSIndex
+        index = TSIndex.open(source_file, psize=psize)
+        start_dt = datetime.datetime.now()
+        with open(source_file, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Analysis starts from the first packet of start_s with PSI and CC state in force at the packet
+            block, start, start_time_s, cc_state = index.locate(mm, start_s)
+            if len(index.blocks) > 0:
+                # Packets are primed at their stream times, so SI repetition intervals continue into the range
+                for offset, packet in index.prime_data(mm, block, start):
+                    ts_reader.prime(packet, start_dt + datetime.timedelta(seconds=index.time_at(offset) - start_time_s))
+            stats.set_cc_state(cc_state)
+            for data, time_s, offset in index.read_range(mm, start_s=start_s, end_s=end_s, pids=pids,
+                                                         chunksize=chunksize, start=start):
+                # Filtered out packets leave gaps, so PCR_AC is measured by file offsets
+                stats.set_position(offset)
+                ts_reader.read(data, dt=start_dt + datetime.timedelta(seconds=time_s - start_time_s))
 
+        stat = stats.get_stat()
+        viewer.print_summary(stats, stat, ts_reader.known_pids)
+        return stat
+
+    checkpointer = None
+    if checkpoint is not None:
+        from storage.ts_checkpoint import Checkpointer
+        checkpointer = Checkpointer(checkpoint)
+        checkpointer.add('reader', ts_reader)
+        checkpointer.add('stats', stats)
+        extra = checkpointer.restore()
+        checkpointer.start()
     with open(source_file, 'rb') as file:
+        if checkpointer is not None and extra is not None:
+            file.seek(extra['offset'])
         while True:
             data = file.read(psize * chunksize)
             if not data:
                 break
             dt = datetime.datetime.now()
             ts_reader.read(data, dt=dt)
+            if checkpointer is not None:
+                checkpointer.poll(offset=file.tell())
+
+    if checkpointer is not None:
+        # Analysis is completed
+        checkpointer.close(remove=True)
+    stat = stats.get_stat()
+    viewer.print_summary(stats, stat, ts_reader.known_pids)
+    return stat
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """
+    Add command line arguments of tsfile_reader to the parser
+
+    :param parser: ArgumentParser object (or subcommand parser)
+    """
+    parser.add_argument('source_file', help='full path to TS-file')
+    parser.add_argument('-s', '--stat_int_s', nargs='?', type=int, default=10,
+                        help='statistics output interval in seconds')
+    parser.add_argument('-P', '--profile', action='store_true',
+                        help='collect hot-path profiling counters and add them to statistics')
+    parser.add_argument('-f', '--start_s', nargs='?', type=float, default=None,
+                        help='analyze from this stream time in seconds (uses sidecar index <file>.idx)')
+    parser.add_argument('-u', '--end_s', nargs='?', type=float, default=None,
+                        help='analyze up to this stream time in seconds (uses sidecar index <file>.idx)')
+    parser.add_argument('--pids', nargs='?', default=None,
+                        help='comma separated PIDs to analyze, e.g. 0x100,0x101 (uses sidecar index <file>.idx)')
+    parser.add_argument('--checkpoint', nargs='?', default=None,
+                        help='checkpoint file: save analyzer state periodically and resume interrupted analysis')
+
+
+def run(args: dict):
+    """
+    Run tsfile_reader with parsed command line arguments
 
-    stats_sorted = sorted(stats.get_stat(), key=lambda k: k['pid'])
-    viewer.print_stat(stats_sorted, ts_reader.get_programs_data(), ts_reader.known_pids)
+    :param args: Dictionary of parsed arguments (see add_arguments)
+    """
+    pids = None
+    if args['pids'] is not None:
+        pids = set(int(pid, 0) for pid in args['pids'].split(','))
+    return tsfile_reader(args['source_file'], stat_interval_s=args['stat_int_s'], profile=args['profile'],
+                         start_s=args['start_s'], end_s=args['end_s'], pids=pids, checkpoint=args['checkpoint'])
 
 
 if __name__ == '__main__':
-    main()
+    """Analyze multicast IPTV stream recorded into video MPEG TS-file"""
+    parser = argparse.ArgumentParser(description='Analyze MPEG TS-file according to ETSI TR 101 290')
+    add_arguments(parser)
+    run(vars(parser.parse_args()))
@@ -1 +1 @@
-__all__ = ['viewer']
+__all__ = ['viewer', 'metrics_exporter']
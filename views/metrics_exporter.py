@@ -0,0 +1,232 @@
+"""
+Embedded HTTP endpoint exposing live ETSI TR 101 290 counters and bitrates in Prometheus text / OpenMetrics format.
+Metrics are rendered on scrape from Statistics.snapshot (pre-aggregated once per stat interval), so the packet
+processing thread is never touched by scrapes
+"""
+import http.server
+import os
+import threading
+
+from ts.ts_stat import PidStat
+
+OPENMETRICS_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PROMETHEUS_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def udp_socket_stats(sock) -> dict:
+    """
+    Read receive queue depth and drops of UDP socket from /proc/net/udp (Linux only)
+
+    :param sock: socket object
+    :return: dictionary {'rx_queue': bytes, 'drops': datagrams} or None if not available
+    """
+    try:
+        inode = str(os.fstat(sock.fileno()).st_ino)
+        with open('/proc/net/udp') as f:
+            next(f)     # header
+            for line in f:
+                fields = line.split()
+                # sl local_address rem_address st tx_queue:rx_queue tr:tm->when retrnsmt uid timeout inode ref
+                # pointer drops
+                if fields[9] == inode:
+                    return {'rx_queue': int(fields[4].split(':')[1], 16), 'drops': int(fields[12])}
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def escape_label(value: str) -> str:
+    """ Escape label value (backslash, double quote and line feed) """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _GroupPids:
+    """ PID label state of one group """
+    __slots__ = ('own', 'exported', 'baseline', 'last')
+
+    def __init__(self):
+        self.own = dict()           # PIDs exported with own label (insertion ordered)
+        self.exported = set()       # PIDs ever exported with own label
+        self.baseline = dict()      # PID summed into 'other' -> its counters when it was added to 'other'
+        self.last = dict()          # PID summed into 'other' -> its last counters
+
+
+class MetricsExporter:
+    """
+    Class for serving metrics of one or more monitored groups over HTTP (GET /metrics). The number of PID label
+    values per group is bounded: PIDs not seen for pid_ttl_s are removed and PIDs above max_pids are summed into
+    pid="other". PID labels are sticky (a PID keeps its label while it is alive and a PID summed into "other" stays
+    there), and "other" counters accumulate increments of their PIDs only, so exported counters never decrease
+    """
+    def __init__(self, port=9100, address='', max_pids=64, pid_ttl_s=60):
+        """
+        Initialize object
+
+        :param port: HTTP port
+        :param address: Address to listen on. Default is all interfaces
+        :param max_pids: Maximum number of PID label values per group
+        :param pid_ttl_s: PIDs which packets are not received for this time are not exported
+        """
+        self.port = port
+        self.address = address
+        self.max_pids = max_pids
+        self.pid_ttl_s = pid_ttl_s
+        self.__sources = dict()     # group -> (Statistics, socket)
+        self.__pids = dict()        # group -> _GroupPids
+        self.__lock = threading.Lock()      # Guards PID label state (scrapes are served by several threads)
+        self.__server = None
+        self.__thread = None
+
+    def add_source(self, group: str, stats, sock=None):
+        """
+        Register monitored group
+
+        :param group: Group name used as label value (e.g. multicast address:port)
+        :param stats: Statistics object
+        :param sock: Receiving socket for queue depth and drops metrics (optional)
+        """
+        sources = dict(self.__sources)
+        sources[group] = (stats, sock)
+        self.__sources = sources
+
+    def remove_source(self, group: str):
+        sources = dict(self.__sources)
+        sources.pop(group, None)
+        self.__sources = sources
+        with self.__lock:
+            self.__pids.pop(group, None)
+
+    def start(self):
+        """ Start HTTP server in daemon thread """
+        exporter = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+                body = exporter.render(openmetrics=openmetrics).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass    # scrapes are not logged
+
+        self.__server = http.server.ThreadingHTTPServer((self.address, self.port), Handler)
+        self.__server.daemon_threads = True
+        self.port = self.__server.server_address[1]
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name='metrics-exporter', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+    def __select_pids(self, group: str, snapshot: dict) -> (list, list, dict):
+        """
+        :return: (exported PIDs, alive PIDs summed into 'other', accumulated counters of 'other')
+        """
+        pids = snapshot['pids']
+        if snapshot['dt'] is not None:
+            alive = [pid for pid, data in pids.items()
+                     if data['last_dt'] is None or (snapshot['dt'] - data['last_dt']).total_seconds() <= self.pid_ttl_s]
+        else:
+            alive = list(pids)
+        with self.__lock:
+            state = self.__pids.setdefault(group, _GroupPids())
+            alive_set = set(alive)
+            # Expired PIDs free their labels (their series disappear, counters are not decreased)
+            for pid in [pid for pid in state.own if pid not in alive_set]:
+                del state.own[pid]
+            for pid in alive:
+                if pid in state.own or pid in state.baseline:
+                    continue
+                if len(state.own) < self.max_pids:
+                    state.own[pid] = True
+                    state.exported.add(pid)
+                else:
+                    # Counters already exported with own label are not added to 'other' again
+                    state.baseline[pid] = (dict(pids[pid]['stat']) if pid in state.exported
+                                           else {name: 0 for name in PidStat.COUNTERS})
+            for pid in state.baseline:
+                if pid in pids:
+                    state.last[pid] = pids[pid]['stat']
+            other = {name: sum(state.last[pid][name] - baseline[name] for pid, baseline in state.baseline.items()
+                               if pid in state.last)
+                     for name in PidStat.COUNTERS}
+            # Dictionary keeps PIDs in the order of appearance, so exported PIDs stay stable over time
+            return ([pid for pid in state.own if pid in pids], [pid for pid in alive if pid in state.baseline],
+                    other if len(state.baseline) > 0 else None)
+
+    def render(self, openmetrics=False) -> str:
+        """
+        Render metrics of all groups
+
+        :param openmetrics: If True output is OpenMetrics (counter families without _total suffix, # EOF)
+        :return: metrics text
+        """
+        families = {
+            'iptv_ts_packets': ('counter', 'Received TS packets', []),
+            'iptv_ts_errors': ('counter', 'ETSI TR 101 290 errors and scrambled packets by class', []),
+            'iptv_ts_bitrate_bps': ('gauge', 'Bitrate of the last statistics interval', []),
+            'iptv_ts_program_bitrate_bps': ('gauge', 'Bitrate of all PIDs of the last statistics interval', []),
+            'iptv_ts_service_bitrate_bps': ('gauge', 'Bitrate of PIDs of program (service) of the last statistics '
+                                                     'interval', []),
+            'iptv_ts_service_errors': ('counter', 'ETSI TR 101 290 errors of PIDs of program (service) by class', []),
+            'iptv_ts_exported_pids': ('gauge', 'Number of PIDs exported with own label', []),
+            'iptv_ts_other_pids': ('gauge', 'Number of PIDs summed into pid="other"', []),
+            'iptv_ts_snapshot_timestamp_seconds': ('gauge', 'Time of the last statistics snapshot', []),
+            'iptv_socket_rx_queue_bytes': ('gauge', 'Receive queue depth of the socket', []),
+            'iptv_socket_drops': ('counter', 'Datagrams dropped by the socket', []),
+        }
+        for group, (stats, sock) in self.__sources.items():
+            group_label = 'group="{}"'.format(group)
+            snapshot = stats.snapshot   # reference is read once: the snapshot is replaced, never modified
+            if snapshot is not None:
+                exported, other, other_stat = self.__select_pids(group, snapshot)
+                series = [('0x{:04X}'.format(pid), [pid], snapshot['pids'][pid]['stat']) for pid in exported]
+                if other_stat is not None:
+                    series.append(('other', other, other_stat))
+                for label, pids, stat in series:
+                    labels = '{},pid="{}"'.format(group_label, label)
+                    families['iptv_ts_packets'][2].append(('_total', labels, stat['Packet_count']))
+                    for name in PidStat.COUNTERS[1:]:
+                        families['iptv_ts_errors'][2].append(('_total', '{},error="{}"'.format(labels, name),
+                                                              stat[name]))
+                    families['iptv_ts_bitrate_bps'][2].append(('', labels, sum(snapshot['pids'][pid]['bitrate']
+                                                                               for pid in pids)))
+                families['iptv_ts_program_bitrate_bps'][2].append(('', group_label, snapshot['program_bitrate']))
+                for program_number, program in snapshot.get('programs', dict()).items():
+                    labels = '{},program="{}",service="{}"'.format(group_label, program_number,
+                                                                   escape_label(program['service_name'] or ''))
+                    families['iptv_ts_service_bitrate_bps'][2].append(('', labels, program['bitrate']))
+                    for name in PidStat.COUNTERS[1:]:
+                        families['iptv_ts_service_errors'][2].append(('_total', '{},error="{}"'.format(labels, name),
+                                                                      program['stat'][name]))
+                families['iptv_ts_exported_pids'][2].append(('', group_label, len(exported)))
+                families['iptv_ts_other_pids'][2].append(('', group_label, len(other)))
+                families['iptv_ts_snapshot_timestamp_seconds'][2].append(('', group_label, snapshot['updated']))
+            if sock is not None:
+                socket_stats = udp_socket_stats(sock)
+                if socket_stats is not None:
+                    families['iptv_socket_rx_queue_bytes'][2].append(('', group_label, socket_stats['rx_queue']))
+                    families['iptv_socket_drops'][2].append(('_total', group_label, socket_stats['drops']))
+        lines = list()
+        for name, (metric_type, help_str, samples) in families.items():
+            if len(samples) == 0:
+                continue
+            # Prometheus text format names counter family by its samples name (with _total suffix)
+            family = name if openmetrics or metric_type != 'counter' else name + '_total'
+            lines.append('# HELP {} {}'.format(family, help_str))
+            lines.append('# TYPE {} {}'.format(family, metric_type))
+            for suffix, labels, value in samples:
+                lines.append('{}{}{{{}}} {}'.format(name, suffix, labels, value))
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
@@ -1,17 +1,25 @@
 import sys
-import os
 from models import *
 from dicts import dict_reader
 
 
 class Viewer:
-    def __init__(self):
-        # Load Dictionary
-        cwd = os.getcwd()
-        self.__stream_type = dict_reader.load_dictionary_csv(os.path.join(cwd, 'dicts', 'stream_type.csv'))
-        self.__table_id = dict_reader.load_dictionary_csv(os.path.join(cwd, 'dicts', 'table_id.csv'))
-        self.__service_type = dict_reader.load_dictionary_csv(os.path.join(cwd, 'dicts', 'service_type.csv'))
-        self.__descriptor_tag = dict_reader.load_dictionary_csv(os.path.join(cwd, 'dicts', 'descriptor_tag.csv'))
+    # Dictionaries are loaded once per process on first lookup (see dict_reader.get_dictionary)
+    @property
+    def __stream_type(self) -> dict_reader.LookupTable:
+        return dict_reader.get_dictionary('stream_type')
+
+    @property
+    def __table_id(self) -> dict_reader.LookupTable:
+        return dict_reader.get_dictionary('table_id')
+
+    @property
+    def __service_type(self) -> dict_reader.LookupTable:
+        return dict_reader.get_dictionary('service_type')
+
+    @property
+    def __descriptor_tag(self) -> dict_reader.LookupTable:
+        return dict_reader.get_dictionary('descriptor_tag')
 
     def print_pat(self, pat: PAT, dt=None, file=None):
         if file is None:
@@ -137,6 +145,96 @@ class Viewer:
                 print('\t\t\tDescriptor data={}'.format(descriptor['descriptor_data']), file=file)
         print('\n', file=file)
 
+    def print_summary(self, stats, stat, known_pids: set, file=None):
+        """
+        Print received tables and final statistics
+
+        :param stats: Statistics object
+        :param stat: Final statistics returned by Statistics.get_stat
+        :param known_pids: Set of known PIDs (see TSReader.known_pids)
+        :param file: Output file. Default is sys.stdout
+        """
+        if stat.get('has_errors') == -1:
+            print('\nNo TS packets found', file=file)
+            return
+        if stats.pat_received_dt is not None:
+            self.print_pat(stats.programs.pat, stats.pat_received_dt, file=file)
+        if stats.pmt_received_dt is not None:
+            for pid in stats.programs.get_pmt_pids():
+                self.print_pmt(stats.programs.get_prog_pmt(pid), stats.pmt_received_dt, file=file)
+        if stats.sdt_received_dt is not None:
+            self.print_sdt(stats.programs.sdt, stats.sdt_received_dt, file=file)
+        if stats.cat_received_dt is not None:
+            self.print_cat(stats.programs.cat, stats.cat_received_dt, file=file)
+        self.print_stat(stat, stats.programs, known_pids, file=file)
+        if len(stat.get('programs', [])) > 1:
+            self.print_programs(stat['programs'], file=file)
+        if 'pcr' in stat:
+            self.print_pcr(stat['pcr'], file=file)
+        if 'rtp' in stat:
+            self.print_rtp(stat['rtp'], file=file)
+        if 'pes' in stat:
+            self.print_pes(stat['pes'], file=file)
+        if 'es' in stat:
+            self.print_es(stat['es'], file=file)
+        if 'freeze' in stat:
+            self.print_freeze(stat['freeze'], file=file)
+        if 'si' in stat:
+            self.print_si(stat['si'], file=file)
+
+    def print_programs(self, programs: list, file=None):
+        print('\nStatistic per program:', file=file)
+        for program in programs:
+            print('\tProgram={}\t PMT PID=0x{:04X}  service_name={}  bitrate={}  {}'.format(
+                program['program_number'], program['pmt_pid'], program['service_name'], program['bitrate'],
+                '  '.join('{}={}'.format(k, v) for k, v in program['stat'].items() if v != 0 and k != 'Packet_count')),
+                file=file)
+
+    def print_pcr(self, pcr: list, file=None):
+        print('\nPCR statistic:', file=file)
+        for pid in pcr:
+            print('\tPID=0x{:04X}\t PCR_AC={}ns  PCR_OJ={}ns  PCR_FO={}Hz  PCR_DR={}Hz/s  discontinuities={}  '
+                  'errors: {}'.format(pid['pid'], pid['PCR_AC_ns'], pid['PCR_OJ_ns'], pid['PCR_FO_Hz'],
+                                      pid['PCR_DR_Hz_s'], pid.get('discontinuities', 0),
+                                      '  '.join('{}={}'.format(k, v) for k, v in pid['errors'].items())), file=file)
+
+    def print_pes(self, pes: list, file=None):
+        print('\nPES statistic:', file=file)
+        for pid in pes:
+            offset = pid['pts_pcr_ms']
+            print('\tPID=0x{:04X}\t {:<8}PTS-PCR={}ms  A/V sync={}ms  {}'.format(
+                pid['pid'], pid['kind'], offset['mean'] if offset is not None else None, pid.get('av_sync_ms'),
+                '  '.join('{}={}'.format(k, pid[k]) for k in ('pes', 'pts', 'length_errors', 'discontinuities',
+                                                               'dts_errors', 'pts_late', 'pts_early'))), file=file)
+
+    def print_es(self, es: list, file=None):
+        print('\nGOP statistic:', file=file)
+        for pid in es:
+            gop = pid['gop']
+            print('\tPID=0x{:04X}\t {:<6}frames={}  I={}  P={}  B={}  other={}  GOP={}  fps={}  rai={}  '
+                  'rai_missing={}'.format(pid['pid'], pid['codec'], pid['frames'], pid['I'], pid['P'], pid['B'],
+                                          pid['other'], '{min}-{max}'.format(**gop) if gop is not None else None,
+                                          pid['fps'], pid['rai'], pid['rai_missing']), file=file)
+
+    def print_freeze(self, freeze: list, file=None):
+        print('\nFrozen/black picture detection:', file=file)
+        for pid in freeze:
+            print('\tPID=0x{:04X}\t key_frames={}  frozen={}  freeze_events={}  black={}  black_events={}'.format(
+                pid['pid'], pid['key_frames'], pid['frozen'], pid['freeze_events'], pid['black'], pid['black_events']),
+                file=file)
+
+    def print_si(self, si: dict, file=None):
+        print('\nSI tables: ' + '  '.join('{}={}'.format(k, v) for k, v in si['errors'].items()), file=file)
+        for table in si['tables']:
+            interval = table['interval_ms']
+            print('\tPID=0x{:04X}\t table_id=0x{:02X} {:<20}sections={}  interval={}ms  limit={}ms'.format(
+                table['pid'], table['table_id'], table['table'], table['sections'],
+                '{min}-{max}'.format(**interval) if interval is not None else None, table['limit_ms']), file=file)
+
+    def print_rtp(self, rtp: dict, file=None):
+        print('\nRTP statistic:', file=file)
+        print('\t' + '  '.join('{}={}'.format(k, v) for k, v in rtp.items()), file=file)
+
     def print_stat(self, stat, programs: Programs, known_pids: list, file=None):
         print('\nProgram statistic:', file=file)
         self._print_stat({'pid': -1, 'bitrate': stat['program_bitrate'], 'stat': stat['program_stat']}, file)